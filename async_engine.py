@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import logging
+from tqdm import tqdm
+
+from m3u8_resolver import DPlayerError, PlayerConfigScanner, STREAM_CHUNK_SIZE
+from rate_limiter import THROTTLE_STATUS
+from crawl_pipeline import CategoryCheckpoint
+from parsers import ParsePool
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# 可重试的状态码（与requests引擎的重试策略一致）
+RETRY_STATUS = {500, 502, 504} | THROTTLE_STATUS
+
+# 队列结束标记
+_DONE = object()
+
+class AsyncCrawlEngine:
+    """基于asyncio的爬取引擎：单个事件循环、共享连接池、按请求类型的全局并发预算"""
+    
+    def __init__(self, crawler, list_concurrency=4, detail_concurrency=16, play_concurrency=32, retries=3,
+                 trace_configs=None):
+        """
+        crawler: OptimizedDSQ4DCrawler实例，复用其解析、查重、批量保存和进度记录
+        *_concurrency: 列表页、详情页、播放页（含get_dplayer接口）的全局并发上限
+        trace_configs: 传给aiohttp.ClientSession的TraceConfig列表（如基准测试统计请求延迟）
+        """
+        if aiohttp is None:
+            raise RuntimeError("async引擎需要aiohttp，请先执行: pip install \"aiohttp>=3.8.1\"")
+        
+        self.crawler = crawler
+        self.limits = {
+            'list': list_concurrency,
+            'detail': detail_concurrency,
+            'play': play_concurrency
+        }
+        self.retries = retries
+        self.trace_configs = trace_configs
+        self.last_errors = {}  # URL -> 最近一次失败原因，用于记录失败
+        self.session = None
+        self.semaphores = {}
+        self.current = None  # (分类ID, 当前页, 总页数, 最大dyid, 断点)，用于中断时保存进度
+    
+    def run(self, categories, start_page=None):
+        """依次爬取给定的分类 {分类ID: 分类名称}"""
+        try:
+            asyncio.run(self._run(categories, start_page))
+        except KeyboardInterrupt:
+            print("\n⏹️ 爬取被用户中断")
+            self.crawler.flush_batch()
+            if self.current:
+                category_id, current_page, total_pages, last_dyid, checkpoint = self.current
+                self.crawler.save_progress(category_id, current_page, total_pages, last_dyid, "interrupted", checkpoint)
+    
+    async def _run(self, categories, start_page):
+        # 信号量和连接池必须在事件循环内创建
+        self.semaphores = {kind: asyncio.Semaphore(limit) for kind, limit in self.limits.items()}
+        
+        headers = dict(self.crawler.session.headers)
+        headers.pop('Accept-Encoding', None)  # 由aiohttp按已安装的解码器协商
+        connector = aiohttp.TCPConnector(limit=sum(self.limits.values()), ttl_dns_cache=300)
+        
+        async with aiohttp.ClientSession(headers=headers, connector=connector,
+                                         trace_configs=self.trace_configs) as session:
+            self.session = session
+            for index, (category_id, category_name) in enumerate(categories.items()):
+                if index > 0:
+                    print(f"⏱️ 等待 {self.crawler.delay * 2} 秒后继续下一个分类...")
+                    await asyncio.sleep(self.crawler.delay * 2)
+                if not await self.crawl_category(category_id, category_name, start_page):
+                    if len(categories) > 1:
+                        print("⚠️ 爬取被中断或出错，停止所有爬取任务。")
+                    break
+    
+    async def _request(self, url, kind, read, timeout=5):
+        """在对应类型的并发预算内发送GET请求，read(response)负责读取响应体，失败返回None"""
+        error = None
+        limiter = self.crawler.rate_limiter
+        metrics = self.crawler.metrics
+        rate_kind = self.crawler.request_kind(url)
+        
+        # 磁盘缓存只用于完整读取的文本页面（列表页、详情页）；缓存读写是同步的SQLite操作，在线程中执行
+        cache = self.crawler.http_cache
+        if not (cache and read == self._read_text and cache.enabled_for(rate_kind)):
+            cache = None
+        entry = None
+        headers = None
+        if cache:
+            entry = await asyncio.to_thread(cache.lookup, url)
+            if entry and cache.is_fresh(entry, rate_kind):
+                cache.hit()
+                metrics.inc('requests_total', kind=rate_kind, status='cache')
+                return cache.text(entry)
+            if cache.offline:
+                metrics.inc('requests_total', kind=rate_kind, status='offline_miss')
+                logger.warning(f"离线模式下缓存未命中, URL: {url}")
+                return None
+            headers = cache.conditional_headers(entry)
+        
+        async with self.semaphores[kind]:
+            for attempt in range(self.retries + 1):
+                try:
+                    await limiter.acquire_async(rate_kind)
+                    start = time.perf_counter()
+                    async with self.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        metrics.observe('request_seconds', time.perf_counter() - start, kind=rate_kind)
+                        metrics.inc('requests_total', kind=rate_kind, status=response.status)
+                        limiter.report(rate_kind, response.status)
+                        if cache and response.status == 304 and entry:
+                            await asyncio.to_thread(cache.refresh, url, response.headers)
+                            cache.hit(revalidated=True)
+                            return cache.text(entry)
+                        if cache and response.status == 200:
+                            body = await response.read()
+                            await asyncio.to_thread(cache.store, url, response.status, response.headers, body)
+                            return body.decode(response.get_encoding(), errors='replace')
+                        if response.status == 200:
+                            return await read(response)
+                        error = f"状态码: {response.status}"
+                        if response.status not in RETRY_STATUS:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError) as e:
+                    error = e if str(e) else type(e).__name__
+                    metrics.inc('requests_total', kind=rate_kind, status='error')
+                if attempt < self.retries:
+                    await asyncio.sleep(0.3 * (2 ** attempt))
+        
+        logger.warning(f"请求失败 {error}, URL: {url}")
+        self.last_errors[url] = str(error)
+        return None
+    
+    async def _parse(self, method, *args):
+        """解析页面；启用解析进程池时在池中解析，不阻塞事件循环"""
+        parser = self.crawler.parser
+        if isinstance(parser, ParsePool):
+            return await asyncio.wrap_future(parser.submit(method, *args))
+        return getattr(parser, method)(*args)
+    
+    async def _read_text(self, response):
+        return await response.text(errors='replace')
+    
+    async def _read_json(self, response):
+        return await response.json(content_type=None)
+    
+    async def _read_player_stream(self, response):
+        """
+        流式读取播放页，解析出player_aaaa或达到字节上限后停止，返回 (已读文本, player_aaaa)
+        aiohttp返回的是解压后的内容，上限和统计按解压后的字节数计算
+        """
+        received = 0
+        scanner = PlayerConfigScanner(response.charset or 'utf-8')
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                received += len(chunk)
+                if scanner.feed(chunk) is not None or received >= self.crawler.stream_max_bytes:
+                    break
+        finally:
+            self.crawler._bump_stat('play_pages')
+            self.crawler._bump_stat('play_decoded_bytes', received)
+        return scanner.text, scanner.config or None
+    
+    async def fetch_json(self, url):
+        """请求get_dplayer等JSON接口，失败时抛出带失败原因的DPlayerError"""
+        data = await self._request(url, 'play', self._read_json, timeout=3)
+        if data is None:
+            raise DPlayerError(self.last_errors.pop(url, None) or "get_dplayer接口请求失败")
+        return data
+    
+    async def fetch_m3u8(self, play_url):
+        """请求播放页并解析m3u8链接"""
+        if self.crawler.stream_play_pages and '/play/' in play_url:
+            page = await self._request(play_url, 'play', self._read_player_stream, timeout=3)
+        else:
+            content = await self._request(play_url, 'play', self._read_text, timeout=3)
+            page = (content, None) if content is not None else None
+        
+        if page is None:
+            return {'m3u8_url': None, 'strategy': None, 'player': {}, 'error': self.last_errors.pop(play_url, None)}
+        content, player = page
+        result = await self.crawler.resolver.resolve_page_async(content, self.fetch_json, player)
+        if not result['m3u8_url']:
+            # get_dplayer接口请求失败时解析器已带回其错误原因
+            result['error'] = result.get('error') or "未解析到m3u8链接"
+        return result
+    
+    async def fetch_list_page(self, category_id, page):
+        """获取单个列表页中的影片条目"""
+        list_url = self.crawler.list_page_url(category_id, page)
+        html = await self._request(list_url, 'list', self._read_text)
+        if html is None:
+            self.crawler.record_failure(list_url, 'list', error=self.last_errors.pop(list_url, None))
+            return []
+        self.crawler.record_success(list_url)
+        entries = await self._parse('list_entries', html)
+        logger.debug(f"页面 {page}: 获取到 {len(entries)} 个链接")
+        return entries
+    
+    async def fetch_plan(self, url, badge=None):
+        """请求并解析详情页，返回需要补充的集数任务（crawler.plan_title的结果），失败返回None"""
+        crawler = self.crawler
+        dyid = crawler.extract_dyid(url)
+        if dyid is None:
+            logger.warning(f"❌ 无法从URL提取dyid: {url}")
+            return None
+        crawler._bump_stat('titles')
+        started = time.time()
+        
+        html = await self._request(url, 'detail', self._read_text, timeout=5)
+        if html is None:
+            crawler.record_failure(url, 'detail', dyid, error=self.last_errors.pop(url, None))
+            return None
+        crawler._bump_stat('detail_fetches')
+        
+        detail = await self._parse('detail', html, url)
+        plan = crawler.plan_title(url, html, badge, detail=detail) if detail else None
+        if plan:
+            plan['started'] = started
+        return plan
+    
+    async def crawl_category(self, category_id, category_name, start_page=None):
+        """异步爬取单个分类，进度记录与requests引擎兼容"""
+        crawler = self.crawler
+        print(f"🚀 开始异步爬取{category_name}...")
+        
+        current_page = 1
+        total_pages = 0
+        last_dyid = 0
+        checkpoint = None
+        
+        try:
+            # 获取或恢复进度（增量模式总是从头开始），中断或出错后同样从断点恢复
+            progress = crawler.get_progress(category_id)
+            if progress:
+                last_dyid = progress['last_dyid'] or 0
+            if (progress and progress['status'] != 'completed' and progress['total_pages']
+                    and start_page is None and not crawler.incremental):
+                total_pages = progress['total_pages']
+                checkpoint = CategoryCheckpoint.from_progress(progress)
+                current_page = checkpoint.first_pending()
+                print(f"📋 恢复爬取进度: 已完成 {len(checkpoint.pages_done)}/{total_pages} 页, "
+                      f"未完成页面中已完成 {checkpoint.titles_done_count()} 部, "
+                      f"重新处理 {len(checkpoint.resumed_inflight)} 部中断的影片")
+            else:
+                first_url = crawler.list_page_url(category_id, 1)
+                html = await self._request(first_url, 'list', self._read_text)
+                self.last_errors.pop(first_url, None)
+                total_pages = await self._parse('total_pages', html) if html else 0
+                if total_pages == 0:
+                    print(f"❌ 获取{category_name}总页数失败")
+                    return False
+                current_page = 1 if start_page is None else start_page
+                print(f"📊 {category_name}总页数: {total_pages}")
+            
+            if crawler.test_mode and total_pages > 2:
+                total_pages = 2
+                print("🧪 测试模式: 只爬取前2页")
+            
+            if crawler.incremental:
+                print(f"🔄 增量模式: 连续 {crawler.incremental} 页没有新内容后停止 (上次最大dyid: {last_dyid})")
+            
+            if checkpoint is None:
+                checkpoint = CategoryCheckpoint(total_pages, range(1, current_page))
+            checkpoint.total_pages = total_pages
+            self.current = (category_id, current_page, total_pages, last_dyid, checkpoint)
+            await asyncio.to_thread(crawler.save_progress, category_id, current_page, total_pages, last_dyid,
+                                    "running", checkpoint)
+            
+            # 流水线处理：列表页 -> 详情页 -> 播放页 -> 写库，只处理断点中未完成的页面
+            pipeline = AsyncCategoryPipeline(self, category_id, checkpoint.pending_pages(current_page), total_pages,
+                                             checkpoint, last_dyid=last_dyid, queue_size=crawler.queue_size)
+            success_count, title_count = await pipeline.run()
+            print(f"✅ 处理完成: {success_count}/{title_count} 成功")
+            if pipeline.last_dyid > last_dyid:
+                print(f"🆕 最大dyid: {last_dyid} -> {pipeline.last_dyid}")
+            
+            await asyncio.to_thread(crawler.flush_batch)
+            await asyncio.to_thread(crawler.save_progress, category_id, total_pages, total_pages, pipeline.last_dyid,
+                                    "completed")
+            self.current = None
+            print(f"🎉 {category_name}爬取完成!")
+            return True
+        
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"💥 爬取过程中发生错误: {e}")
+            await asyncio.to_thread(crawler.flush_batch)
+            if self.current:
+                current_page, last_dyid = self.current[1], self.current[3]
+            await asyncio.to_thread(crawler.save_progress, category_id, current_page, total_pages, last_dyid, "error",
+                                    checkpoint)
+            self.current = None
+            return False
+
+class AsyncCategoryPipeline:
+    """单个分类的异步流水线：列表页 -> 详情页 -> 播放页 -> 写库，各阶段之间使用有界队列，没有按批次等待的同步点"""
+    
+    def __init__(self, engine, category_id, pages, total_pages, checkpoint, last_dyid=0, queue_size=None):
+        """
+        engine: AsyncCrawlEngine实例，各阶段的协程数与其按请求类型的并发上限一致
+        pages: 需要处理的页码（升序）
+        checkpoint: CategoryCheckpoint，恢复时跳过其中已完成的影片
+        queue_size: 各阶段之间队列的容量，默认为下游协程数的4倍
+        last_dyid: 该分类之前记录的最大dyid（高水位）
+        """
+        self.engine = engine
+        self.crawler = engine.crawler
+        self.category_id = category_id
+        self.pages = list(pages)
+        self.total_pages = total_pages
+        self.checkpoint = checkpoint
+        self.workers = dict(engine.limits)
+        self.queue_size = queue_size
+        self.page_queue = self.detail_queue = self.play_queue = self.write_queue = None
+        self.pbar = None
+        
+        self.page_remaining = {}  # 页码 -> 未完成的影片数
+        self.seen_urls = set()
+        self.last_dyid = last_dyid or 0
+        
+        # 增量模式：记录没有新内容的页码，连续quiet_pages页后提前停止
+        self.quiet_pages = self.crawler.incremental
+        self.quiet = set()
+        self.stopped_at = None
+        
+        self.title_count = 0
+        self.success_count = 0
+    
+    async def run(self):
+        """运行流水线直到所有页面处理完成，返回 (成功数, 影片数)"""
+        # 队列必须在事件循环内创建
+        self.page_queue = asyncio.Queue()
+        for page in self.pages:
+            self.page_queue.put_nowait(page)
+        self.detail_queue = asyncio.Queue(maxsize=self.queue_size or self.workers['detail'] * 4)
+        self.play_queue = asyncio.Queue(maxsize=self.queue_size or self.workers['play'] * 4)
+        self.write_queue = asyncio.Queue(maxsize=self.queue_size or 256)
+        
+        list_tasks = self._start(self._list_worker, 'list')
+        detail_tasks = self._start(self._detail_worker, 'detail')
+        play_tasks = self._start(self._play_worker, 'play')
+        writer = asyncio.ensure_future(self._writer())
+        try:
+            with tqdm(total=0, desc=f"爬取进度") as self.pbar:
+                # 上游阶段全部结束后，向下游发送结束标记
+                await asyncio.gather(*list_tasks)
+                for _ in detail_tasks:
+                    await self.detail_queue.put(_DONE)
+                await asyncio.gather(*detail_tasks)
+                for _ in play_tasks:
+                    await self.play_queue.put(_DONE)
+                await asyncio.gather(*play_tasks)
+                await self.write_queue.put(_DONE)
+                await writer
+        finally:
+            for task in list_tasks + detail_tasks + play_tasks + [writer]:
+                task.cancel()
+        
+        return self.success_count, self.title_count
+    
+    def _start(self, target, stage):
+        return [asyncio.ensure_future(target()) for _ in range(max(self.workers[stage], 1))]
+    
+    def _refresh(self):
+        """显示各队列的积压情况（反压）"""
+        depths = {
+            'pages': self.page_queue.qsize(),
+            'detail': self.detail_queue.qsize(),
+            'play': self.play_queue.qsize(),
+            'write': self.write_queue.qsize()
+        }
+        for name, depth in depths.items():
+            self.crawler.metrics.set('queue_depth', depth, queue=name)
+        self.crawler.metrics.set('queue_depth', self.crawler.writer.queue.qsize(), queue='db')
+        self.pbar.set_postfix(**depths, refresh=False)
+    
+    async def _list_worker(self):
+        crawler = self.crawler
+        while True:
+            try:
+                page = self.page_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            
+            entries = []
+            try:
+                entries = await self.engine.fetch_list_page(self.category_id, page)
+            except Exception as e:
+                # 解析失败的页面同样记入失败表，之后可通过重试失败记录重新获取
+                logger.warning(f"获取页面 {page} 链接失败: {e}")
+                crawler.record_failure(crawler.list_page_url(self.category_id, page), 'list',
+                                       error=f"{type(e).__name__}: {e}")
+            
+            # 更新标记未变化的影片不进入详情页阶段，恢复时跳过上次已完成的影片
+            changed = [
+                entry for entry in crawler.filter_changed(entries)
+                if not self.checkpoint.is_title_done(page, entry['dyid'])
+            ]
+            for entry in entries:
+                self.last_dyid = max(self.last_dyid, entry['dyid'])
+            if self.quiet_pages and entries and not changed:
+                self.quiet.add(page)
+                if self._quiet_streak(page):
+                    self._stop_listing(page)
+            
+            # 同一影片出现在多页时记在第一页
+            new_entries = [entry for entry in changed if entry['url'] not in self.seen_urls]
+            self.seen_urls.update(entry['url'] for entry in new_entries)
+            self.page_remaining[page] = len(new_entries)
+            self.title_count += len(new_entries)
+            self.pbar.total = self.title_count
+            self.pbar.refresh()
+            if not new_entries:
+                await self.write_queue.put(('page', page))
+            
+            for entry in new_entries:
+                self.checkpoint.start_title(entry['dyid'])
+                await self.detail_queue.put((page, entry))
+    
+    def _quiet_streak(self, page):
+        """包含page在内是否已有连续quiet_pages页没有新内容"""
+        for start in range(page - self.quiet_pages + 1, page + 1):
+            if all(p in self.quiet for p in range(start, start + self.quiet_pages)):
+                return True
+        return False
+    
+    def _stop_listing(self, page):
+        """清空待获取的列表页，已取出的页面照常处理完"""
+        if self.stopped_at is not None:
+            return
+        self.stopped_at = page
+        dropped = 0
+        while not self.page_queue.empty():
+            self.page_queue.get_nowait()
+            dropped += 1
+        print(f"⏹️ 连续 {self.quiet_pages} 页没有新影片或更新，停止获取后续 {dropped} 页")
+    
+    async def _detail_worker(self):
+        while True:
+            item = await self.detail_queue.get()
+            if item is _DONE:
+                return
+            page, entry = item
+            
+            plan = None
+            try:
+                plan = await self.engine.fetch_plan(entry['url'], entry['badge'])
+            except Exception as e:
+                logger.warning(f"爬取影片失败 {entry['url']}: {e}")
+            
+            if not plan or not plan['jobs']:
+                await self.write_queue.put(('title', page, entry['dyid'], plan, []))
+                continue
+            
+            # 剧集按集拆分进入播放页队列，全部解析完成后再整体写库
+            title = {'page': page, 'plan': plan, 'rows': [], 'remaining': len(plan['jobs'])}
+            for episode_number, play_url in plan['jobs']:
+                await self.play_queue.put((title, episode_number, play_url))
+    
+    async def _play_worker(self):
+        crawler = self.crawler
+        while True:
+            item = await self.play_queue.get()
+            if item is _DONE:
+                return
+            title, episode_number, play_url = item
+            plan = title['plan']
+            
+            try:
+                result = await self.engine.fetch_m3u8(play_url)
+            except Exception as e:
+                logger.warning(f"获取第{episode_number}集m3u8失败: {e}")
+                result = {'m3u8_url': None, 'strategy': None, 'player': {}}
+            title['rows'].append(crawler.build_m3u8_row(plan['dyid'], plan['name'], episode_number, play_url, result))
+            
+            title['remaining'] -= 1
+            if title['remaining'] == 0:
+                rows = sorted(title['rows'], key=lambda x: x['episode'])
+                await self.write_queue.put(('title', title['page'], plan['dyid'], plan, rows))
+    
+    async def _writer(self):
+        """唯一的写库协程：汇总结果并在每部影片完成后记录进度；写库队列满时会阻塞的调用放到线程中执行，按顺序等待"""
+        crawler = self.crawler
+        while True:
+            item = await self.write_queue.get()
+            if item is _DONE:
+                return
+            
+            if item[0] == 'title':
+                _, page, dyid, plan, rows = item
+                if plan:
+                    try:
+                        await asyncio.to_thread(crawler.finish_title, plan, rows)
+                        self.success_count += 1
+                    except Exception as e:
+                        logger.error(f"保存影片失败 {plan['dyid']}: {e}")
+                # 失败的影片已记录到失败表，同样视为完成
+                self.checkpoint.finish_title(page, dyid)
+                self.page_remaining[page] -= 1
+                page_done = self.page_remaining[page] == 0
+                self.pbar.update(1)
+            else:
+                page = item[1]
+                page_done = True
+            
+            if page_done:
+                self.checkpoint.finish_page(page)
+            
+            # 进度排在该影片数据之后进入写库队列，与数据在同一批提交
+            first_pending = self.checkpoint.first_pending()
+            self.engine.current = (self.category_id, first_pending, self.total_pages, self.last_dyid, self.checkpoint)
+            await asyncio.to_thread(crawler.save_progress, self.category_id, first_pending, self.total_pages,
+                                    self.last_dyid, "running", self.checkpoint)
+            self._refresh()
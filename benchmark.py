@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import sqlite3
+import statistics
+import subprocess
+import contextlib
+import random
+import zlib
+
+from fixture_server import FixtureServer
+from parsers import PARSERS, ParsePool
+from init_db import migrate
+from query_data import FTS_MIN_KEYWORD, build_search_query, fts_phrase
+
+RESULT_PREFIX = "BENCH_RESULT "
+
+# 搜索基准测试生成影片信息用的常用汉字
+SEARCH_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所"
+    "民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那"
+    "社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通"
+    "并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区"
+    "强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清"
+)
+
+# 搜索基准测试的高频短语，约30%的简介中包含
+SEARCH_COMMON_PHRASE = "讲述了"
+
+def percentile(values, pct):
+    """计算百分位数（线性插值），没有数据时返回0"""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），Linux下ru_maxrss单位为KB，macOS下为字节"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == 'darwin' else maxrss / 1024
+
+def run_scenario(config):
+    """在子进程中执行单个场景：使用临时数据库爬取一个分类，输出耗时、延迟和内存统计"""
+    os.chdir(tempfile.mkdtemp(prefix="dsq4d-bench-"))
+    db_file = os.path.join(os.getcwd(), "dy.db")
+    latencies = []
+    
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import init_db
+        init_db.init_database(db_file)
+        
+        import dsq4d_crawler_optimized as crawler_module
+        crawler_module.BASE_URL = config['base_url']
+        crawler_module.DB_FILE = db_file
+        
+        concurrency = config['concurrency']
+        crawler = crawler_module.OptimizedDSQ4DCrawler(
+            delay=0,
+            max_workers=concurrency,
+            play_workers=concurrency * 2,
+            list_workers=config['list_workers'],
+            rate_limits={},  # 基准测试不限速
+            stream_play_pages=not config['no_stream'],
+            parser=config['parser']
+        )
+        
+        start = time.perf_counter()
+        try:
+            if config['engine'] == 'async':
+                import aiohttp
+                from async_engine import AsyncCrawlEngine
+                
+                async def on_request_start(session, context, params):
+                    context.start = time.perf_counter()
+                
+                async def on_request_end(session, context, params):
+                    latencies.append(time.perf_counter() - context.start)
+                
+                trace_config = aiohttp.TraceConfig()
+                trace_config.on_request_start.append(on_request_start)
+                trace_config.on_request_end.append(on_request_end)
+                engine = AsyncCrawlEngine(
+                    crawler,
+                    list_concurrency=config['list_workers'],
+                    detail_concurrency=concurrency,
+                    play_concurrency=concurrency * 2,
+                    trace_configs=[trace_config]
+                )
+                engine.run({config['category']: f"分类{config['category']}"}, 1)
+            else:
+                # elapsed为发出请求到收到响应头的时间
+                crawler.session.hooks['response'].append(
+                    lambda response, *args, **kwargs: latencies.append(response.elapsed.total_seconds())
+                )
+                crawler.crawl_category_optimized(config['category'], 1)
+        finally:
+            elapsed = time.perf_counter() - start
+            crawler.close()
+    
+    print(RESULT_PREFIX + json.dumps({
+        'elapsed': elapsed,
+        'titles': crawler.stats.get('titles', 0),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+def run_benchmark(args):
+    server = FixtureServer(
+        pages=args.pages, titles_per_page=args.titles_per_page, max_episodes=args.max_episodes,
+        play_page_kb=args.play_page_kb, latency=args.latency / 1000, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, replay_db=args.replay
+    ).start()
+    print(f"🧪 替身站点: {server.url}, 延迟 {args.latency}ms, 错误率 {args.error_rate}, 429比例 {args.throttle_rate}")
+    
+    results = []
+    try:
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                config = {
+                    'engine': engine,
+                    'concurrency': concurrency,
+                    'list_workers': args.list_workers,
+                    'category': args.category,
+                    'base_url': server.url,
+                    'no_stream': args.no_stream,
+                    'parser': args.parser
+                }
+                before = server.snapshot()
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--scenario', json.dumps(config)],
+                    stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL,
+                    text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                )
+                after = server.snapshot()
+                
+                lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+                if process.returncode != 0 or not lines:
+                    print(f"❌ {engine} 并发{concurrency}: 运行失败 (退出码 {process.returncode})")
+                    continue
+                
+                result = json.loads(lines[-1][len(RESULT_PREFIX):])
+                delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+                requests = sum(delta.get(kind, 0) for kind in ('list', 'mp4', 'play', 'api'))
+                titles = result['titles']
+                result.update({
+                    'engine': engine,
+                    'concurrency': concurrency,
+                    'requests': requests,
+                    'titles_per_sec': titles / result['elapsed'] if result['elapsed'] else 0,
+                    'requests_per_title': requests / titles if titles else 0,
+                    'errors': delta.get('500', 0),
+                    'throttled': delta.get('429', 0)
+                })
+                results.append(result)
+                print(f"✓ {engine} 并发{concurrency}: {titles}部影片, {result['elapsed']:.2f}s")
+    finally:
+        server.stop()
+    
+    print()
+    print(f"{'engine':<10}{'conc':>6}{'titles/s':>10}{'req/title':>10}{'p50(ms)':>10}{'p99(ms)':>10}"
+          f"{'rss(MB)':>10}{'500':>6}{'429':>6}")
+    for r in results:
+        print(f"{r['engine']:<10}{r['concurrency']:>6}{r['titles_per_sec']:>10.1f}{r['requests_per_title']:>10.2f}"
+              f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['peak_rss_mb']:>10.1f}{r['errors']:>6}{r['throttled']:>6}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+def load_parse_pages(args):
+    """解析基准测试用的页面 [(类型, URL, 原始字节)]：回放录制的缓存，或由替身站点生成"""
+    pages = []
+    if args.replay:
+        conn = sqlite3.connect(args.replay)
+        try:
+            for url, body in conn.execute("SELECT url, body FROM responses WHERE status = 200"):
+                if '/list/' in url:
+                    pages.append(('list', url, zlib.decompress(body)))
+                elif '/mp4/' in url:
+                    pages.append(('detail', url, zlib.decompress(body)))
+        finally:
+            conn.close()
+        return pages
+    
+    server = FixtureServer(pages=args.pages, titles_per_page=args.titles_per_page, max_episodes=args.max_episodes)
+    try:
+        for page in range(1, args.pages + 1):
+            pages.append(('list', f"/list/{args.category}-{page}.html", server._list_page(args.category, page)))
+            for index in range(args.titles_per_page):
+                dyid = args.category * 1000000 + page * 1000 + index
+                pages.append(('detail', f"/mp4/{dyid}.html", server._detail_page(dyid)))
+    finally:
+        server.httpd.server_close()
+    return pages
+
+def run_parse_benchmark(args):
+    """对比各解析后端的解析速度：在当前进程中解析（单核），以及在不同数量的解析进程中并行解析"""
+    pages = load_parse_pages(args)
+    if not pages:
+        print("❌ 没有可用于解析的页面")
+        return
+    tasks = [page for _ in range(args.parse_rounds) for page in pages]
+    print(f"🧪 解析基准测试: {len(pages)} 个页面 × {args.parse_rounds} 轮, CPU核数 {os.cpu_count()}")
+    
+    results = []
+    for backend in args.parsers:
+        for processes in args.parse_processes:
+            if processes == 0:
+                parser = PARSERS[backend]('')
+                timings = {'list': [], 'detail': []}
+                start = time.perf_counter()
+                for kind, url, body in tasks:
+                    page_start = time.perf_counter()
+                    if kind == 'list':
+                        parser.list_entries(body)
+                    else:
+                        parser.detail(body, url)
+                    timings[kind].append(time.perf_counter() - page_start)
+                elapsed = time.perf_counter() - start
+            else:
+                pool = ParsePool(backend, '', processes)
+                try:
+                    # 预热：等待所有解析进程启动完成
+                    for future in [pool.submit('list_entries', b'') for _ in range(processes * 2)]:
+                        future.result()
+                    start = time.perf_counter()
+                    futures = [
+                        pool.submit('list_entries', body) if kind == 'list' else pool.submit('detail', body, url)
+                        for kind, url, body in tasks
+                    ]
+                    for future in futures:
+                        future.result()
+                    elapsed = time.perf_counter() - start
+                finally:
+                    pool.close()
+                timings = None
+            
+            pages_per_sec = len(tasks) / elapsed if elapsed else 0
+            result = {
+                'parser': backend,
+                'processes': processes,
+                'pages_per_sec': pages_per_sec,
+                'pages_per_sec_per_core': pages_per_sec / max(processes, 1),
+                'list_ms': statistics.mean(timings['list']) * 1000 if timings and timings['list'] else None,
+                'detail_ms': statistics.mean(timings['detail']) * 1000 if timings and timings['detail'] else None
+            }
+            results.append(result)
+            print(f"✓ {backend} 解析进程{processes}: {pages_per_sec:.0f} 页/秒")
+    
+    print()
+    print(f"{'parser':<10}{'procs':>6}{'pages/s':>10}{'pages/s/core':>14}{'list(ms)':>10}{'detail(ms)':>12}")
+    for r in results:
+        list_ms = f"{r['list_ms']:.2f}" if r['list_ms'] is not None else '-'
+        detail_ms = f"{r['detail_ms']:.2f}" if r['detail_ms'] is not None else '-'
+        print(f"{r['parser']:<10}{r['processes']:>6}{r['pages_per_sec']:>10.0f}{r['pages_per_sec_per_core']:>14.0f}"
+              f"{list_ms:>10}{detail_ms:>12}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+def build_search_catalog(db_file, titles, seed=0):
+    """生成titles部随机影片的临时数据库（经迁移创建，全文索引由触发器同步），返回 (数据库连接, 查询关键词, 写入耗时)"""
+    rng = random.Random(seed)
+    
+    def text(low, high):
+        return ''.join(rng.choice(SEARCH_CHARS) for _ in range(rng.randint(low, high)))
+    
+    actors = [text(3, 3) for _ in range(5000)]
+    directors = [text(3, 3) for _ in range(1000)]
+    
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        migrate(conn)
+    
+    def rows():
+        for dyid in range(1, titles + 1):
+            description = text(60, 120)
+            if rng.random() < 0.3:
+                position = rng.randint(0, len(description))
+                description = description[:position] + SEARCH_COMMON_PHRASE + description[position:]
+            yield (dyid, text(2, 6), rng.choice(('电影', '电视剧', '动漫', '综艺')), '大陆', str(rng.randint(1990, 2025)),
+                   ', '.join(rng.sample(actors, 3)), rng.choice(directors), description, f"/mp4/{dyid}.html")
+    
+    start = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO dy (dyid, name, type, region, year, actors, directors, description, url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    
+    # 取一部中间的影片，用其片名片段和主演作为关键词
+    name, actor = conn.execute("SELECT name, actors FROM dy WHERE dyid = ?", (titles // 2,)).fetchone()
+    keywords = [
+        ('name', (name * 2)[:3]),
+        ('actor', actor.split(', ')[0]),
+        ('common', SEARCH_COMMON_PHRASE),
+        ('miss', '鑫鑫鑫'),
+        ('2-char', SEARCH_COMMON_PHRASE[:2])  # 少于3个字，两种方式都使用LIKE
+    ]
+    return conn, keywords, elapsed
+
+def run_search_benchmark(args):
+    """对比LIKE扫描与FTS5全文索引的搜索耗时（每种查询取多轮的中位数）"""
+    results = []
+    for titles in args.search_titles:
+        with tempfile.TemporaryDirectory(prefix="dsq4d-search-") as tmpdir:
+            db_file = os.path.join(tmpdir, "dy.db")
+            print(f"🧪 生成 {titles} 部影片...")
+            conn, keywords, insert_seconds = build_search_catalog(db_file, titles)
+            print(f"✓ 写入并建立索引耗时 {insert_seconds:.1f} 秒, 数据库 {os.path.getsize(db_file) / 1024 / 1024:.0f} MB")
+            try:
+                for label, keyword in keywords:
+                    timings = {}
+                    for mode, use_index in (('like', False), ('fts', True)):
+                        sql, params = build_search_query(keyword, limit=args.search_limit, use_index=use_index)
+                        samples = []
+                        for _ in range(args.search_rounds):
+                            start = time.perf_counter()
+                            count = len(conn.execute(sql, params).fetchall())
+                            samples.append(time.perf_counter() - start)
+                        timings[mode] = (statistics.median(samples) * 1000, count)
+                    matched = conn.execute(
+                        "SELECT COUNT(*) FROM dy_fts WHERE dy_fts MATCH ?", (fts_phrase(keyword),)
+                    ).fetchone()[0] if len(keyword) >= FTS_MIN_KEYWORD else None
+                    results.append({
+                        'titles': titles, 'keyword': label, 'matched': matched,
+                        'like_ms': timings['like'][0], 'fts_ms': timings['fts'][0], 'rows': timings['fts'][1]
+                    })
+            finally:
+                conn.close()
+    
+    print()
+    print(f"{'titles':>9}  {'keyword':<14}{'matched':>9}{'like(ms)':>11}{'fts(ms)':>10}{'speedup':>9}")
+    for r in results:
+        matched = r['matched'] if r['matched'] is not None else '-'
+        speedup = r['like_ms'] / r['fts_ms'] if r['fts_ms'] else 0
+        print(f"{r['titles']:>9}  {r['keyword']:<14}{matched:>9}{r['like_ms']:>11.2f}{r['fts_ms']:>10.2f}{speedup:>8.1f}x")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.json}")
+
+def main():
+    parser = argparse.ArgumentParser(description="DSQ4D爬虫离线基准测试（基于本地替身站点）")
+    parser.add_argument("--engines", default="requests,async", help="要测试的引擎，逗号分隔")
+    parser.add_argument("--concurrency", default="4,16", help="详情页并发数，逗号分隔（播放页并发为其2倍）")
+    parser.add_argument("--list-workers", type=int, default=2, help="列表页并发数")
+    parser.add_argument("--category", type=int, default=1, help="爬取的分类ID")
+    parser.add_argument("--pages", type=int, default=3, help="替身站点每个分类的页数")
+    parser.add_argument("--titles-per-page", type=int, default=20, help="替身站点每页影片数")
+    parser.add_argument("--max-episodes", type=int, default=12, help="替身站点单部影片的最大集数")
+    parser.add_argument("--play-page-kb", type=int, default=40, help="替身站点播放页的填充大小(KB)")
+    parser.add_argument("--latency", type=float, default=20.0, help="每个请求的平均延迟(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--replay", metavar="CACHE_DB", help="回放http_cache.py录制的缓存文件，而不是生成页面")
+    parser.add_argument("--no-stream", action="store_true", help="完整下载播放页")
+    parser.add_argument("--parser", choices=list(PARSERS), default="bs4", help="爬取时使用的解析后端")
+    parser.add_argument("--parse", action="store_true", help="只测试页面解析速度（不发送请求），对比各解析后端")
+    parser.add_argument("--parsers", default=",".join(PARSERS), help="--parse: 要测试的解析后端，逗号分隔")
+    parser.add_argument("--parse-processes", default="0,2", help="--parse: 解析进程数，逗号分隔，0表示在当前进程中解析")
+    parser.add_argument("--parse-rounds", type=int, default=5, help="--parse: 每个页面重复解析的轮数")
+    parser.add_argument("--search", action="store_true", help="只测试搜索速度（不发送请求），对比LIKE扫描与全文索引")
+    parser.add_argument("--search-titles", default="100000,1000000", help="--search: 生成的影片数，逗号分隔")
+    parser.add_argument("--search-rounds", type=int, default=5, help="--search: 每个查询重复的轮数")
+    parser.add_argument("--search-limit", type=int, default=100, help="--search: 每个查询返回的结果数")
+    parser.add_argument("--json", metavar="FILE", help="将结果保存为JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程的进度条和错误输出")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.scenario:
+        run_scenario(json.loads(args.scenario))
+        return
+    
+    if args.search:
+        args.search_titles = [int(value) for value in args.search_titles.split(',') if value.strip()]
+        run_search_benchmark(args)
+        return
+    
+    if args.parse:
+        args.parsers = [name.strip() for name in args.parsers.split(',') if name.strip()]
+        args.parse_processes = [int(value) for value in args.parse_processes.split(',') if value.strip()]
+        run_parse_benchmark(args)
+        return
+    
+    args.engines = [engine.strip() for engine in args.engines.split(',') if engine.strip()]
+    args.concurrency = [int(value) for value in args.concurrency.split(',') if value.strip()]
+    run_benchmark(args)
+
+if __name__ == "__main__":
+    main()
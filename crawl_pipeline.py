@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import json
+import queue
+import logging
+import threading
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+class CategoryCheckpoint:
+    """分类的细粒度进度：已完成页码的位图、未完成页面中已完成的影片、处理中的影片"""
+    
+    def __init__(self, total_pages, pages_done=None, titles_done=None):
+        self.total_pages = total_pages
+        self.pages_done = set(pages_done or ())
+        self.titles_done = {page: set(dyids) for page, dyids in (titles_done or {}).items()}
+        self.inflight = set()
+        self.resumed_inflight = []  # 上次中断时处理中的影片，恢复后会重新处理
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def from_progress(cls, progress):
+        """从crawl_progress记录恢复，旧记录没有位图时按current_page之前的页面已完成处理"""
+        total_pages = progress['total_pages'] or 0
+        if progress.get('pages_done') is None:
+            return cls(total_pages, range(1, progress['current_page'] or 1))
+        titles_done = json.loads(progress.get('titles_done') or '{}')
+        checkpoint = cls(total_pages, decode_pages(progress['pages_done']),
+                         {int(page): dyids for page, dyids in titles_done.items()})
+        checkpoint.resumed_inflight = json.loads(progress.get('inflight') or '[]')
+        return checkpoint
+    
+    def pending_pages(self, start_page=1):
+        return [page for page in range(start_page, self.total_pages + 1) if page not in self.pages_done]
+    
+    def first_pending(self, start_page=1):
+        """第一个未完成的页码，全部完成时返回总页数"""
+        pending = self.pending_pages(start_page)
+        return pending[0] if pending else self.total_pages
+    
+    def is_title_done(self, page, dyid):
+        with self.lock:
+            return dyid in self.titles_done.get(page, ())
+    
+    def start_title(self, dyid):
+        with self.lock:
+            self.inflight.add(dyid)
+    
+    def finish_title(self, page, dyid):
+        with self.lock:
+            self.inflight.discard(dyid)
+            self.titles_done.setdefault(page, set()).add(dyid)
+    
+    def finish_page(self, page):
+        with self.lock:
+            self.pages_done.add(page)
+            self.titles_done.pop(page, None)
+    
+    def fields(self):
+        """写入crawl_progress的字段：pages_done位图、titles_done和inflight（JSON）"""
+        with self.lock:
+            return {
+                'pages_done': encode_pages(self.pages_done),
+                'titles_done': json.dumps({page: sorted(dyids) for page, dyids in self.titles_done.items() if dyids},
+                                          separators=(',', ':')),
+                'inflight': json.dumps(sorted(self.inflight), separators=(',', ':'))
+            }
+    
+    def titles_done_count(self):
+        with self.lock:
+            return sum(len(dyids) for dyids in self.titles_done.values())
+
+def encode_pages(pages):
+    """页码集合 -> 位图（第i位表示第i+1页）"""
+    if not pages:
+        return b''
+    bitmap = bytearray((max(pages) - 1) // 8 + 1)
+    for page in pages:
+        if page >= 1:
+            bitmap[(page - 1) >> 3] |= 1 << ((page - 1) & 7)
+    return bytes(bitmap)
+
+def decode_pages(bitmap):
+    """位图 -> 页码集合"""
+    return {
+        index * 8 + bit + 1
+        for index, byte in enumerate(bitmap or b'')
+        for bit in range(8)
+        if byte & (1 << bit)
+    }
+
+class CategoryPipeline:
+    """单个分类的流水线：列表页 -> 详情页 -> 剧集解析 -> 写库，各阶段之间使用有界队列"""
+    
+    def __init__(self, crawler, category_id, pages, total_pages,
+                 list_workers=2, detail_workers=8, play_workers=16, queue_size=None,
+                 quiet_pages=0, last_dyid=0, checkpoint=None, save_progress=True, progress_bar=True):
+        """
+        crawler: OptimizedDSQ4DCrawler实例
+        pages: 需要处理的页码（升序）
+        checkpoint: CategoryCheckpoint，恢复时跳过其中已完成的影片
+        save_progress: 是否写入crawl_progress（分片爬取时由crawl_shards记录进度）
+        progress_bar: 是否显示进度条
+        queue_size: 各阶段之间队列的容量，默认为下游线程数的4倍
+        quiet_pages: 增量模式下连续多少页没有新影片或更新时停止获取后续列表页，0表示不提前停止
+        last_dyid: 该分类之前记录的最大dyid（高水位）
+        """
+        self.crawler = crawler
+        self.category_id = category_id
+        self.pages = list(pages)
+        self.total_pages = total_pages
+        self.workers = {'list': list_workers, 'detail': detail_workers, 'play': play_workers}
+        
+        self.page_queue = queue.Queue()
+        self.detail_queue = queue.Queue(maxsize=queue_size or detail_workers * 4)
+        self.play_queue = queue.Queue(maxsize=queue_size or play_workers * 4)
+        self.write_queue = queue.Queue(maxsize=queue_size or 256)
+        self.stop_event = threading.Event()
+        
+        # 页级进度：页码 -> 未完成的影片数
+        self.page_lock = threading.Lock()
+        self.page_remaining = {}
+        self.seen_urls = set()
+        self.checkpoint = checkpoint or CategoryCheckpoint(total_pages, range(1, self.pages[0] if self.pages else 1))
+        self.checkpoint_page = self.checkpoint.first_pending()
+        self.save_progress = save_progress
+        self.progress_bar = progress_bar
+        
+        # 增量模式：记录没有新内容的页码，连续quiet_pages页后提前停止
+        self.quiet_pages = quiet_pages
+        self.quiet = set()
+        self.stopped_at = None
+        self.last_dyid = last_dyid or 0
+        
+        self.title_count = 0
+        self.done_count = 0
+        self.success_count = 0
+    
+    def run(self):
+        """运行流水线直到所有页面处理完成，返回 (成功数, 影片数)"""
+        for page in self.pages:
+            self.page_queue.put(page)
+        
+        list_threads = self._start(self._list_worker, 'list')
+        detail_threads = self._start(self._detail_worker, 'detail')
+        play_threads = self._start(self._play_worker, 'play')
+        writer = threading.Thread(target=self._writer, name="writer", daemon=True)
+        writer.start()
+        
+        try:
+            with tqdm(total=0, desc=f"爬取进度", disable=not self.progress_bar) as pbar:
+                # 上游阶段全部结束后，向下游发送结束标记
+                self._wait(list_threads, pbar)
+                for _ in detail_threads:
+                    self._put(self.detail_queue, _DONE)
+                self._wait(detail_threads, pbar)
+                for _ in play_threads:
+                    self._put(self.play_queue, _DONE)
+                self._wait(play_threads, pbar)
+                self._put(self.write_queue, _DONE)
+                self._wait([writer], pbar)
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            raise
+        
+        return self.success_count, self.title_count
+    
+    def _start(self, target, stage):
+        threads = [
+            threading.Thread(target=target, name=f"{stage}-{i}", daemon=True)
+            for i in range(max(self.workers[stage], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+    
+    def _wait(self, threads, pbar):
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+                self._refresh(pbar)
+        self._refresh(pbar)
+    
+    def _refresh(self, pbar):
+        """刷新进度条，并显示各队列的积压情况（反压）"""
+        with self.page_lock:
+            total, done = self.title_count, self.done_count
+        if pbar.total != total:
+            pbar.total = total
+        if done > pbar.n:
+            pbar.update(done - pbar.n)
+        depths = {
+            'pages': self.page_queue.qsize(),
+            'detail': self.detail_queue.qsize(),
+            'play': self.play_queue.qsize(),
+            'write': self.write_queue.qsize()
+        }
+        for name, depth in depths.items():
+            self.crawler.metrics.set('queue_depth', depth, queue=name)
+        self.crawler.metrics.set('queue_depth', self.crawler.writer.queue.qsize(), queue='db')
+        pbar.set_postfix(**depths, refresh=False)
+        pbar.refresh()
+    
+    def _put(self, q, item):
+        """向有界队列放入数据，队列满时阻塞（反压），收到停止信号时放弃"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+    
+    def _list_worker(self):
+        while not self.stop_event.is_set():
+            try:
+                page = self.page_queue.get_nowait()
+            except queue.Empty:
+                return
+            
+            entries = []
+            list_url = self.crawler.list_page_url(self.category_id, page)
+            try:
+                response = self.crawler._get_with_retry(list_url)
+                if response:
+                    self.crawler.record_success(list_url)
+                    entries = self.crawler.parse_list_page(response.content, response.encoding)
+                else:
+                    self.crawler.record_failure(list_url, 'list')
+                logger.debug(f"页面 {page}: 获取到 {len(entries)} 个链接")
+            except Exception as e:
+                # 解析失败的页面同样记入失败表，之后可通过重试失败记录重新获取
+                logger.warning(f"获取页面 {page} 链接失败: {e}")
+                self.crawler.record_failure(list_url, 'list', error=f"{type(e).__name__}: {e}")
+            
+            # 更新标记未变化的影片不进入详情页阶段，恢复时跳过上次已完成的影片
+            changed = [
+                entry for entry in self.crawler.filter_changed(entries)
+                if not self.checkpoint.is_title_done(page, entry['dyid'])
+            ]
+            
+            with self.page_lock:
+                for entry in entries:
+                    self.last_dyid = max(self.last_dyid, entry['dyid'])
+                if self.quiet_pages and entries and not changed:
+                    self.quiet.add(page)
+                    if self._quiet_streak(page):
+                        self._stop_listing(page)
+                entries = changed
+                new_entries = [entry for entry in entries if entry['url'] not in self.seen_urls]
+                self.seen_urls.update(entry['url'] for entry in new_entries)
+                self.page_remaining[page] = len(new_entries)
+                self.title_count += len(new_entries)
+            if not new_entries:
+                self._put(self.write_queue, ('page', page))
+            
+            for entry in new_entries:
+                self.checkpoint.start_title(entry['dyid'])
+                if not self._put(self.detail_queue, (page, entry)):
+                    return
+    
+    def _quiet_streak(self, page):
+        """包含page在内是否已有连续quiet_pages页没有新内容"""
+        for start in range(page - self.quiet_pages + 1, page + 1):
+            if all(p in self.quiet for p in range(start, start + self.quiet_pages)):
+                return True
+        return False
+    
+    def _stop_listing(self, page):
+        """清空待获取的列表页，已取出的页面照常处理完"""
+        if self.stopped_at is not None:
+            return
+        self.stopped_at = page
+        dropped = 0
+        while True:
+            try:
+                self.page_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                break
+        print(f"⏹️ 连续 {self.quiet_pages} 页没有新影片或更新，停止获取后续 {dropped} 页")
+    
+    def _detail_worker(self):
+        crawler = self.crawler
+        while True:
+            item = self._get(self.detail_queue)
+            if item is _DONE:
+                return
+            page, entry = item
+            url = entry['url']
+            
+            plan = None
+            try:
+                if entry['dyid'] is None:
+                    logger.warning(f"❌ 无法从URL提取dyid: {url}")
+                else:
+                    crawler._bump_stat('titles')
+                    started = time.time()
+                    response = crawler._get_with_retry(url, timeout=5)
+                    if response:
+                        crawler._bump_stat('detail_fetches')
+                        plan = crawler.plan_title(url, response.content, entry['badge'], response.encoding)
+                        if plan:
+                            plan['started'] = started
+                    else:
+                        crawler.record_failure(url, 'detail', entry['dyid'])
+            except Exception as e:
+                logger.warning(f"爬取影片失败 {url}: {e}")
+            
+            if not plan:
+                self._put(self.write_queue, ('title', page, entry['dyid'], None, None))
+                continue
+            if not plan['jobs']:
+                self._put(self.write_queue, ('title', page, entry['dyid'], plan, []))
+                continue
+            
+            # 剧集按集拆分进入解析队列，全部解析完成后再整体写库
+            title = {'page': page, 'plan': plan, 'rows': [], 'remaining': len(plan['jobs']), 'lock': threading.Lock()}
+            for episode_number, play_url in plan['jobs']:
+                if not self._put(self.play_queue, (title, episode_number, play_url)):
+                    return
+    
+    def _play_worker(self):
+        crawler = self.crawler
+        while True:
+            item = self._get(self.play_queue)
+            if item is _DONE:
+                return
+            title, episode_number, play_url = item
+            plan = title['plan']
+            
+            try:
+                result = crawler.fetch_m3u8(play_url)
+            except Exception as e:
+                logger.warning(f"获取第{episode_number}集m3u8失败: {e}")
+                result = {'m3u8_url': None, 'strategy': None, 'player': {}}
+            row = crawler.build_m3u8_row(plan['dyid'], plan['name'], episode_number, play_url, result)
+            
+            with title['lock']:
+                title['rows'].append(row)
+                title['remaining'] -= 1
+                finished = title['remaining'] == 0
+            if finished:
+                rows = sorted(title['rows'], key=lambda x: x['episode'])
+                self._put(self.write_queue, ('title', title['page'], plan['dyid'], plan, rows))
+    
+    def _writer(self):
+        """唯一的写库线程：汇总结果、批量保存，并在每部影片完成后记录进度"""
+        while True:
+            item = self._get(self.write_queue)
+            if item is _DONE:
+                return
+            
+            if item[0] == 'title':
+                _, page, dyid, plan, rows = item
+                if plan:
+                    try:
+                        self.crawler.finish_title(plan, rows)
+                        self.success_count += 1
+                    except Exception as e:
+                        logger.error(f"保存影片失败 {plan['dyid']}: {e}")
+                # 失败的影片已记录到失败表，同样视为完成
+                self.checkpoint.finish_title(page, dyid)
+                with self.page_lock:
+                    self.done_count += 1
+                    self.page_remaining[page] -= 1
+                    page_done = self.page_remaining[page] == 0
+            else:
+                page = item[1]
+                page_done = True
+            
+            if page_done:
+                self.checkpoint.finish_page(page)
+                self.checkpoint_page = self.checkpoint.first_pending()
+            
+            # 进度排在该影片数据之后进入写库队列，与数据在同一批提交，不会单独提交
+            if self.save_progress:
+                self.crawler.save_progress(self.category_id, self.checkpoint_page, self.total_pages,
+                                           self.last_dyid, "running", self.checkpoint)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import queue
+import logging
+import sqlite3
+import threading
+
+from init_db import apply_pragmas
+from dimensions import save_dimensions
+from metrics import Metrics, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# 影片信息：已存在则整体更新
+UPSERT_MOVIE_SQL = """
+INSERT INTO dy (dyid, name, type, region, year, actors, directors, description, url)
+VALUES (:dyid, :name, :type, :region, :year, :actors, :directors, :description, :url)
+ON CONFLICT(dyid) DO UPDATE SET
+    name = excluded.name, type = excluded.type, region = excluded.region, year = excluded.year,
+    actors = excluded.actors, directors = excluded.directors, description = excluded.description,
+    url = excluded.url, crawl_time = CURRENT_TIMESTAMP
+"""
+
+# m3u8链接：只补充m3u8_url为空的记录，已有链接的不覆盖
+UPSERT_M3U8_SQL = """
+INSERT INTO m3u8 (dyid, name, episode, play_url, m3u8_url)
+VALUES (:dyid, :name, :episode, :play_url, :m3u8_url)
+ON CONFLICT(dyid, episode) DO UPDATE SET
+    name = excluded.name, play_url = excluded.play_url, m3u8_url = excluded.m3u8_url,
+    crawl_time = CURRENT_TIMESTAMP
+WHERE m3u8.m3u8_url IS NULL
+"""
+
+UPSERT_BADGE_SQL = """
+INSERT INTO title_badge (dyid, badge) VALUES (?, ?)
+ON CONFLICT(dyid) DO UPDATE SET badge = excluded.badge, update_time = CURRENT_TIMESTAMP
+"""
+
+UPSERT_DPLAYER_SQL = """
+INSERT INTO dplayer_cache (key, m3u8_url) VALUES (?, ?)
+ON CONFLICT(key) DO UPDATE SET m3u8_url = excluded.m3u8_url, update_time = CURRENT_TIMESTAMP
+"""
+
+# 失败记录：重试间隔按 RETRY_BASE_DELAY * 2^失败次数 递增，最长 RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 24 * 3600
+
+UPSERT_FAILURE_SQL = f"""
+INSERT INTO crawl_failures (url, kind, dyid, episode, attempts, last_error, next_retry)
+VALUES (:url, :kind, :dyid, :episode, 1, :error, datetime('now', '+{RETRY_BASE_DELAY} seconds'))
+ON CONFLICT(url) DO UPDATE SET
+    attempts = crawl_failures.attempts + 1, last_error = excluded.last_error,
+    dyid = COALESCE(excluded.dyid, crawl_failures.dyid), episode = COALESCE(excluded.episode, crawl_failures.episode),
+    next_retry = datetime('now', '+' || MIN({RETRY_BASE_DELAY} * (1 << MIN(crawl_failures.attempts, 16)), {RETRY_MAX_DELAY}) || ' seconds'),
+    update_time = CURRENT_TIMESTAMP
+"""
+
+DELETE_FAILURE_SQL = "DELETE FROM crawl_failures WHERE url = ?"
+
+UPSERT_PROGRESS_SQL = """
+INSERT INTO crawl_progress (current_page, total_pages, last_dyid, status, pages_done, titles_done, inflight, category)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(category) DO UPDATE SET
+    current_page = excluded.current_page, total_pages = excluded.total_pages,
+    last_dyid = excluded.last_dyid, status = excluded.status,
+    pages_done = excluded.pages_done, titles_done = excluded.titles_done, inflight = excluded.inflight,
+    update_time = CURRENT_TIMESTAMP
+"""
+
+FINISH_SHARD_SQL = """
+UPDATE crawl_shards SET status = 'done', titles = ?, lease_until = NULL, update_time = CURRENT_TIMESTAMP
+WHERE id = ? AND owner = ?
+"""
+
+class DBWriter:
+    """独占写连接的写库线程：通过队列接收数据，按数量或时间批量提交"""
+    
+    def __init__(self, db_file, batch_size=50, commit_interval=2.0, queue_size=10000, metrics=None):
+        """
+        batch_size: 累计多少部影片（或5倍数量的m3u8记录）后提交
+        commit_interval: 有待提交数据时的最长提交间隔（秒）
+        metrics: Metrics实例，记录每次提交的行数和耗时
+        """
+        self.metrics = metrics or Metrics()
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.commit_callbacks = []
+        
+        self.pending_movies = []
+        self.pending_m3u8s = []
+        self.pending_badges = {}
+        self.pending_dplayer = {}
+        self.pending_failures = {}
+        self.pending_progress = {}
+        self.pending_shards = []
+        
+        self.stats = {'commits': 0, 'movies': 0, 'm3u8s': 0, 'statements': 0, 'failed_commits': 0}
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+    
+    def add_commit_callback(self, callback):
+        """注册提交成功后的回调 callback(batch)，batch包含movies、m3u8s、badges，在写库线程中执行"""
+        self.commit_callbacks.append(callback)
+    
+    def put_movie(self, movie):
+        self.queue.put(('movie', movie))
+    
+    def put_m3u8s(self, m3u8s):
+        # 只保存有效的m3u8链接
+        rows = [m3u8 for m3u8 in m3u8s if m3u8.get('m3u8_url')]
+        if rows:
+            self.queue.put(('m3u8', rows))
+    
+    def put_badge(self, dyid, badge):
+        """记录影片在列表页上的更新标记"""
+        self.queue.put(('badge', (dyid, badge)))
+    
+    def put_dplayer(self, key, m3u8_url):
+        """保存get_dplayer接口的解析结果"""
+        self.queue.put(('dplayer', (key, m3u8_url)))
+    
+    def put_failure(self, url, kind, dyid=None, episode=None, error=None):
+        """记录一次失败，已有记录时失败次数加一并推迟下次重试时间"""
+        self.queue.put(('failure', {'url': url, 'kind': kind, 'dyid': dyid, 'episode': episode, 'error': error}))
+    
+    def put_resolved(self, url):
+        """之前失败的URL已成功，删除失败记录"""
+        self.queue.put(('failure', {'url': url, 'resolved': True}))
+    
+    def put_progress(self, category, current_page, total_pages, last_dyid, status,
+                     pages_done=None, titles_done=None, inflight=None):
+        """同一分类的多次进度更新在一次提交内只写最后一次，断点字段为None时清空"""
+        self.queue.put(('progress', (current_page, total_pages, last_dyid, status,
+                                     pages_done, titles_done, inflight, category)))
+    
+    def put_shard_done(self, shard_id, owner, titles):
+        """分片完成，与该分片最后一批数据在同一事务或之后的事务中提交"""
+        self.queue.put(('shard', (titles, shard_id, owner)))
+    
+    def flush(self, timeout=None):
+        """提交所有已入队的数据并等待完成，返回是否成功"""
+        if not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        result = {}
+        self.queue.put(('flush', (done, result)))
+        done.wait(timeout)
+        return result.get('success', False)
+    
+    def close(self):
+        """提交剩余数据并结束写库线程"""
+        if self.thread.is_alive():
+            self.queue.put(('stop', None))
+            self.thread.join()
+    
+    def _run(self):
+        self.conn = sqlite3.connect(self.db_file, timeout=30)
+        apply_pragmas(self.conn)
+        deadline = None
+        try:
+            while True:
+                timeout = max(deadline - time.monotonic(), 0) if deadline else None
+                try:
+                    kind, payload = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._commit()
+                    deadline = None
+                    continue
+                
+                if kind == 'movie':
+                    self.pending_movies.append(payload)
+                elif kind == 'm3u8':
+                    self.pending_m3u8s.extend(payload)
+                elif kind == 'badge':
+                    self.pending_badges[payload[0]] = payload[1]
+                elif kind == 'dplayer':
+                    self.pending_dplayer[payload[0]] = payload[1]
+                elif kind == 'failure':
+                    self.pending_failures[payload['url']] = payload
+                elif kind == 'progress':
+                    self.pending_progress[payload[-1]] = payload
+                elif kind == 'shard':
+                    self.pending_shards.append(payload)
+                elif kind == 'flush':
+                    done, result = payload
+                    result['success'] = self._commit()
+                    deadline = None
+                    done.set()
+                    continue
+                elif kind == 'stop':
+                    self._commit()
+                    return
+                
+                if (len(self.pending_movies) >= self.batch_size or
+                    len(self.pending_m3u8s) >= self.batch_size * 5):
+                    self._commit()
+                    deadline = None
+                elif deadline is None:
+                    deadline = time.monotonic() + self.commit_interval
+        finally:
+            self.conn.close()
+    
+    def _commit(self):
+        """在一个事务内写入所有待提交数据"""
+        if not (self.pending_movies or self.pending_m3u8s or self.pending_badges or self.pending_dplayer or
+                self.pending_failures or self.pending_progress or self.pending_shards):
+            return True
+        
+        movies, self.pending_movies = self.pending_movies, []
+        m3u8s, self.pending_m3u8s = self.pending_m3u8s, []
+        badges, self.pending_badges = self.pending_badges, {}
+        dplayer, self.pending_dplayer = self.pending_dplayer, {}
+        failures, self.pending_failures = self.pending_failures, {}
+        progress, self.pending_progress = self.pending_progress, {}
+        shards, self.pending_shards = self.pending_shards, []
+        
+        start = time.perf_counter()
+        cursor = self.conn.cursor()
+        try:
+            statements = 0
+            if movies:
+                cursor.executemany(UPSERT_MOVIE_SQL, movies)
+                save_dimensions(cursor, movies)
+                statements += 1
+            if m3u8s:
+                cursor.executemany(UPSERT_M3U8_SQL, m3u8s)
+                statements += 1
+            if badges:
+                cursor.executemany(UPSERT_BADGE_SQL, list(badges.items()))
+                statements += 1
+            if dplayer:
+                cursor.executemany(UPSERT_DPLAYER_SQL, list(dplayer.items()))
+                statements += 1
+            if failures:
+                resolved = [(url,) for url, failure in failures.items() if failure.get('resolved')]
+                failed = [failure for failure in failures.values() if not failure.get('resolved')]
+                if resolved:
+                    cursor.executemany(DELETE_FAILURE_SQL, resolved)
+                    statements += 1
+                if failed:
+                    cursor.executemany(UPSERT_FAILURE_SQL, failed)
+                    statements += 1
+            if progress:
+                cursor.executemany(UPSERT_PROGRESS_SQL, list(progress.values()))
+                statements += 1
+            if shards:
+                cursor.executemany(FINISH_SHARD_SQL, shards)
+                statements += 1
+            
+            self.conn.commit()
+            
+            self.stats['commits'] += 1
+            self.stats['movies'] += len(movies)
+            self.stats['m3u8s'] += len(m3u8s)
+            self.stats['statements'] += statements
+            self.metrics.observe('db_flush_seconds', time.perf_counter() - start)
+            self.metrics.observe('db_flush_rows', len(movies) + len(m3u8s) + len(badges) + len(dplayer) + len(failures) + len(progress),
+                                 buckets=SIZE_BUCKETS)
+            self.metrics.inc('db_commits_total', result='ok')
+            if movies or m3u8s:
+                logger.debug(f"💾 批量保存: {len(movies)}部影片, {len(m3u8s)}个m3u8链接")
+            
+            batch = {'movies': movies, 'm3u8s': m3u8s, 'badges': badges}
+            for callback in self.commit_callbacks:
+                try:
+                    callback(batch)
+                except Exception as e:
+                    logger.error(f"提交回调执行失败: {e}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"批量保存数据失败: {e}")
+            self.conn.rollback()
+            self.stats['failed_commits'] += 1
+            self.metrics.inc('db_commits_total', result='failed')
+            return False
+        finally:
+            cursor.close()
+
+class QueueWriter(DBWriter):
+    """分片工作进程中使用的写库代理：接口与DBWriter相同，数据经进程间队列交给协调进程中唯一的DBWriter"""
+    
+    def __init__(self, queue):
+        """
+        queue: multiprocessing队列，协调进程按顺序转发到DBWriter的队列
+        """
+        self.queue = queue
+        self.commit_callbacks = []
+        self.stats = {'commits': 0, 'movies': 0, 'm3u8s': 0, 'statements': 0, 'failed_commits': 0}
+    
+    def put_movie(self, movie):
+        super().put_movie(movie)
+        self._handed_off(movies=[movie])
+    
+    def put_m3u8s(self, m3u8s):
+        super().put_m3u8s(m3u8s)
+        self._handed_off(m3u8s=[m3u8 for m3u8 in m3u8s if m3u8.get('m3u8_url')])
+    
+    def put_badge(self, dyid, badge):
+        super().put_badge(dyid, badge)
+        self._handed_off(badges={dyid: badge})
+    
+    def _handed_off(self, movies=(), m3u8s=(), badges=None):
+        """
+        提交发生在协调进程，本进程收不到提交通知：数据交给协调进程后即执行提交回调，
+        使本进程的已入库状态索引随之更新，后续分片遇到同一部影片时不会重复爬取
+        """
+        batch = {'movies': list(movies), 'm3u8s': list(m3u8s), 'badges': badges or {}}
+        for callback in self.commit_callbacks:
+            try:
+                callback(batch)
+            except Exception as e:
+                logger.error(f"提交回调执行失败: {e}")
+    
+    def flush(self, timeout=None):
+        """数据已交给协调进程，由其DBWriter按批提交"""
+        return True
+    
+    def close(self):
+        pass
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+# 人员角色 -> dy表中的字段
+PERSON_ROLES = {'actor': 'actors', 'director': 'directors'}
+
+# 分面维度（与dy表中的字段同名，title_facet中对应 <维度>_id 列）
+FACET_KINDS = ('type', 'region', 'year')
+
+# 详情页缺失字段时填入的占位值，不写入维度表
+UNKNOWN = "未知"
+
+NAME_SEPARATOR_RE = re.compile(r'\s*[,，、/]\s*')
+
+def split_names(text):
+    """拆分逗号分隔的人名，去掉空值、占位值和重复项（保持原顺序）"""
+    if not text:
+        return []
+    names = []
+    for name in NAME_SEPARATOR_RE.split(text.strip()):
+        if name and name != UNKNOWN and name not in names:
+            names.append(name)
+    return names
+
+def facet_value(value):
+    """分面取值，空值和占位值返回None"""
+    value = (value or '').strip()
+    return value if value and value != UNKNOWN else None
+
+def save_dimensions(cursor, movies):
+    """按影片信息重写人员关联（person/title_person）和分面（facet/title_facet），与影片写入在同一个事务中执行"""
+    latest = {movie['dyid']: movie for movie in movies}
+    if not latest:
+        return
+    cursor.executemany("DELETE FROM title_person WHERE dyid = ?", [(dyid,) for dyid in latest])
+    
+    credits = []
+    facets = []
+    for dyid, movie in latest.items():
+        for role, column in PERSON_ROLES.items():
+            for position, name in enumerate(split_names(movie.get(column))):
+                credits.append((dyid, role, position, name))
+        facets.append((dyid, *(facet_value(movie.get(kind)) for kind in FACET_KINDS)))
+    
+    if credits:
+        cursor.executemany("INSERT OR IGNORE INTO person (name) VALUES (?)", [(name,) for *_, name in credits])
+        cursor.executemany(
+            "INSERT OR IGNORE INTO title_person (dyid, person_id, role, position) "
+            "SELECT ?, id, ?, ? FROM person WHERE name = ?", credits
+        )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO facet (kind, value) VALUES (?, ?)",
+        {(kind, value) for _, *values in facets for kind, value in zip(FACET_KINDS, values) if value}
+    )
+    # 每部影片一行分面ID，取值未知的维度为NULL
+    lookups = ', '.join(f"(SELECT id FROM facet WHERE kind = '{kind}' AND value = ?)" for kind in FACET_KINDS)
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO title_facet (dyid, {', '.join(f'{kind}_id' for kind in FACET_KINDS)}) VALUES (?, {lookups})",
+        facets
+    )
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+def request_key(api_url):
+    """缓存键：接口地址的路径和查询参数（与站点域名无关）"""
+    parts = urlsplit(api_url)
+    return parts.path + (f"?{parts.query}" if parts.query else '')
+
+class DPlayerCache:
+    """get_dplayer接口结果的缓存：进程内LRU（带有效期）+ 持久化表，相同请求合并为一次调用，接口调用在有界线程池中执行"""
+    
+    def __init__(self, load=None, store=None, max_entries=10000, ttl=0, workers=4):
+        """
+        load: load(key) -> (m3u8_url, 已保存秒数) 或None，从持久化表读取
+        store: store(key, m3u8_url)，保存解析成功的结果
+        max_entries: 进程内LRU的容量
+        ttl: 缓存有效期（秒），0表示永不过期
+        workers: 同时进行的接口调用数上限
+        """
+        self.load = load
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.workers = workers
+        self.entries = OrderedDict()  # key -> (m3u8_url, 保存时间)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dplayer")
+        self.async_inflight = {}
+        self.async_semaphore = None
+        self.stats = {'calls': 0, 'memory_hits': 0, 'db_hits': 0, 'coalesced': 0}
+    
+    def get(self, api_url, call):
+        """返回接口地址对应的m3u8链接；未缓存时在线程池中执行 call() -> m3u8_url，同一地址的并发请求共用一次调用"""
+        key = request_key(api_url)
+        m3u8_url = self._lookup(key)
+        if m3u8_url:
+            return m3u8_url
+        
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.inflight[key] = self.executor.submit(self._call, key, call)
+            else:
+                self.stats['coalesced'] += 1
+        return future.result()
+    
+    async def get_async(self, api_url, call):
+        """get的异步版本，call为协程函数；事件循环上只查进程内LRU，持久化表的读写放到线程中执行"""
+        key = request_key(api_url)
+        m3u8_url = self._memory_lookup(key)
+        if m3u8_url:
+            return m3u8_url
+        
+        task = self.async_inflight.get(key)
+        if task is None:
+            if self.async_semaphore is None:
+                self.async_semaphore = asyncio.Semaphore(self.workers)
+            task = self.async_inflight[key] = asyncio.ensure_future(self._call_async(key, call))
+        else:
+            with self.lock:
+                self.stats['coalesced'] += 1
+        return await asyncio.shield(task)
+    
+    def _call(self, key, call):
+        try:
+            # 排队期间其他线程可能已经写入结果
+            m3u8_url = self._lookup(key, count=False)
+            if m3u8_url:
+                return m3u8_url
+            with self.lock:
+                self.stats['calls'] += 1
+            m3u8_url = call()
+            if m3u8_url:
+                self._remember(key, m3u8_url)
+            return m3u8_url
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+    
+    async def _call_async(self, key, call):
+        try:
+            m3u8_url = await asyncio.to_thread(self._stored_lookup, key)
+            if m3u8_url:
+                return m3u8_url
+            async with self.async_semaphore:
+                with self.lock:
+                    self.stats['calls'] += 1
+                m3u8_url = await call()
+            if m3u8_url:
+                # store可能因写库队列已满而阻塞，不能在事件循环上执行
+                await asyncio.to_thread(self._remember, key, m3u8_url)
+            return m3u8_url
+        finally:
+            self.async_inflight.pop(key, None)
+    
+    def _lookup(self, key, count=True):
+        """依次查找进程内LRU和持久化表"""
+        return self._memory_lookup(key, count) or self._stored_lookup(key, count)
+    
+    def _memory_lookup(self, key, count=True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (not self.ttl or time.time() - entry[1] < self.ttl):
+                self.entries.move_to_end(key)
+                if count:
+                    self.stats['memory_hits'] += 1
+                return entry[0]
+        return None
+    
+    def _stored_lookup(self, key, count=True):
+        """查找持久化表，命中时放入进程内LRU"""
+        stored = self.load(key) if self.load else None
+        if stored and stored[0] and (not self.ttl or stored[1] < self.ttl):
+            with self.lock:
+                self._put(key, stored[0], time.time() - stored[1])
+                if count:
+                    self.stats['db_hits'] += 1
+            return stored[0]
+        return None
+    
+    def _remember(self, key, m3u8_url):
+        with self.lock:
+            self._put(key, m3u8_url, time.time())
+        if self.store:
+            self.store(key, m3u8_url)
+    
+    def _put(self, key, m3u8_url, stored_time):
+        self.entries[key] = (m3u8_url, stored_time)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def close(self):
+        self.executor.shutdown()
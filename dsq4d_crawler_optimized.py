@@ -3,21 +3,30 @@
 
 import requests
 import sqlite3
-import re
 import time
-import random
 import argparse
+import logging
 import os
 import sys
-import base64
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from queue import Queue
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 from datetime import datetime
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
+from m3u8_resolver import M3U8Resolver, PlayerConfigScanner, STREAM_CHUNK_SIZE
+from rate_limiter import RateLimiter, THROTTLE_STATUS, parse_rates
+from crawl_pipeline import CategoryPipeline, CategoryCheckpoint
+from db_writer import DBWriter
+from init_db import SCHEMA_VERSION, get_schema_version, apply_pragmas
+from known_state import KnownStateIndex
+from http_cache import HTTPCache, build_response, parse_ttls
+from dplayer_cache import DPlayerCache
+from metrics import Metrics
+from parsers import ParsePool, create_parser, extract_dyid
+
+logger = logging.getLogger(__name__)
 
 # 全局变量
 BASE_URL = "https://m.dsq4d.com"
@@ -51,38 +60,86 @@ CATEGORIES = {
 # 数据库文件
 DB_FILE = "dy.db"
 
+# 失败次数达到该值后不再自动重试
+MAX_RETRY_ATTEMPTS = 8
+
 class OptimizedDSQ4DCrawler:
-    def __init__(self, test_mode=False, delay=0.1, max_workers=8, batch_size=50):
-        """初始化优化爬虫"""
+    def __init__(self, test_mode=False, delay=0.1, max_workers=8, batch_size=50,
+                 stream_play_pages=True, stream_max_bytes=256 * 1024, rate_limits=None,
+                 list_workers=2, play_workers=16, queue_size=None, commit_interval=2.0,
+                 incremental=0, http_cache=None, metrics=None, writer=None, parser='bs4', parse_processes=0,
+                 dplayer_workers=4, dplayer_cache_size=10000, dplayer_ttl=0):
+        """
+        初始化优化爬虫
+        incremental: 大于0时为增量模式，从第1页开始，连续incremental页没有新内容后停止
+        http_cache: HTTPCache实例，为None时不使用磁盘缓存
+        metrics: Metrics实例，为None时创建一个只在内存中统计的实例
+        writer: 写库对象，为None时创建独占写连接的DBWriter（分片工作进程传入QueueWriter）
+        parser: 页面解析后端（bs4/lxml）
+        parse_processes: 大于0时在对应数量的解析进程中解析列表页和详情页
+        dplayer_workers / dplayer_cache_size / dplayer_ttl: get_dplayer接口的并发调用数、进程内缓存容量和有效期(秒，0为永不过期)
+        """
         self.test_mode = test_mode
+        self.http_cache = http_cache
+        self.metrics = metrics or Metrics()
+        self.incremental = incremental
         self.delay = delay
         self.max_workers = max_workers
+        self.list_workers = list_workers
+        self.play_workers = play_workers
+        self.queue_size = queue_size
         self.batch_size = batch_size
+        self.stream_play_pages = stream_play_pages
+        self.stream_max_bytes = stream_max_bytes
         
         # 创建优化的session
         self.session = self._create_optimized_session()
         
-        # 数据库连接池
-        self.db_lock = threading.Lock()
-        self.conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        # 全局限速器，所有请求都必须先取得对应类型的令牌
+        self.rate_limiter = RateLimiter(rate_limits)
+        
+        # get_dplayer接口结果缓存（进程内LRU + dplayer_cache表），接口调用在独立的有界线程池中执行
+        self.dplayer_cache = DPlayerCache(
+            load=self._load_dplayer, store=lambda key, m3u8_url: self.writer.put_dplayer(key, m3u8_url),
+            max_entries=dplayer_cache_size, ttl=dplayer_ttl, workers=dplayer_workers
+        )
+        
+        # m3u8解析器（预编译正则 + 策略链）
+        self.resolver = M3U8Resolver(self._get_with_retry, BASE_URL, api_cache=self.dplayer_cache,
+                                     last_error=lambda: getattr(self.local, 'last_error', None))
+        
+        # 列表页和详情页解析器
+        self.parser = create_parser(parser, BASE_URL, parse_processes)
         
-        # 批量操作缓存
-        self.movie_batch = []
-        self.m3u8_batch = []
-        self.batch_lock = threading.Lock()
+        # 运行统计
+        self.stats = {'titles': 0, 'detail_fetches': 0}
+        self.stats_lock = threading.Lock()
         
-        self._ensure_tables()
+        # 每个线程一个只读连接，写操作全部交给写库线程
+        self.local = threading.local()
+        self.read_conns = []
+        self.read_conns_lock = threading.Lock()
+        self.writer = None
+        
+        self._check_schema()
+        
+        # 启动时一次性加载已入库状态，查重不再访问数据库
+        self.known = self._load_known_state()
+        self.failed_urls = self._load_failed_urls()
+        
+        self.writer = writer or DBWriter(DB_FILE, batch_size=batch_size, commit_interval=commit_interval,
+                                         metrics=self.metrics)
+        self.writer.add_commit_callback(self.known.on_commit)
         
     def _create_optimized_session(self):
         """创建优化的HTTP会话"""
         session = requests.Session()
         
-        # 配置重试策略
+        # 配置重试策略（429/503由_get_with_retry经限速器重试，以便自适应降速）
         retry_strategy = Retry(
             total=3,
             backoff_factor=0.3,
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=[500, 502, 504],
         )
         
         # 配置适配器
@@ -99,129 +156,303 @@ class OptimizedDSQ4DCrawler:
         
         return session
     
-    def _ensure_tables(self):
-        """确保所需的数据库表已创建"""
-        tables = ["dy", "m3u8", "crawl_progress"]
-        for table in tables:
-            cursor = self.conn.cursor()
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'")
-            if not cursor.fetchone():
-                print(f"表 {table} 不存在，请先运行 init_db.py 初始化数据库")
-                sys.exit(1)
+    def _check_schema(self):
+        """确认数据库结构版本与程序一致"""
+        if not os.path.exists(DB_FILE):
+            print(f"数据库文件 {DB_FILE} 不存在，请先运行 init_db.py 初始化数据库")
+            sys.exit(1)
+        
+        version = get_schema_version(self._reader())
+        if version < SCHEMA_VERSION:
+            print(f"数据库结构版本 v{version} 低于程序所需的 v{SCHEMA_VERSION}，请先运行 init_db.py 升级数据库")
+            sys.exit(1)
+        if version > SCHEMA_VERSION:
+            print(f"数据库结构版本 v{version} 高于程序支持的 v{SCHEMA_VERSION}，请更新程序")
+            sys.exit(1)
+    
+    def _load_known_state(self):
+        """从数据库加载已知影片和集数索引"""
+        start = time.time()
+        known = KnownStateIndex()
+        known.load(self._reader())
+        print(f"🧠 已加载已入库状态: {len(known.names)} 部影片, {known.episode_count()} 集, "
+              f"占用约 {known.memory_usage() / 1024 / 1024:.1f} MB, 耗时 {time.time() - start:.2f}s")
+        return known
+    
+    def _load_failed_urls(self):
+        """加载已有的失败记录，成功后据此删除对应记录"""
+        cursor = self._reader().cursor()
+        try:
+            cursor.execute("SELECT url FROM crawl_failures")
+            return {row[0] for row in cursor.fetchall()}
+        finally:
             cursor.close()
     
+    def record_failure(self, url, kind, dyid=None, episode=None, error=None):
+        """记录失败的URL，error为空时使用当前线程最近一次请求的错误"""
+        error = error or getattr(self.local, 'last_error', None) or "未知错误"
+        self.failed_urls.add(url)
+        self.writer.put_failure(url, kind, dyid, episode, error)
+        self._bump_stat('failures')
+        self.metrics.inc('failures_total', kind=kind)
+    
+    def record_success(self, url):
+        """之前失败的URL已成功时删除失败记录"""
+        if url in self.failed_urls:
+            self.failed_urls.discard(url)
+            self.writer.put_resolved(url)
+            self._bump_stat('recovered')
+    
+    def _reader(self):
+        """获取当前线程的只读数据库连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            apply_pragmas(conn, read_only=True)
+            self.local.conn = conn
+            with self.read_conns_lock:
+                self.read_conns.append(conn)
+        return conn
+    
+    def _load_dplayer(self, key):
+        """从dplayer_cache表读取接口结果，返回 (m3u8_url, 已保存秒数)"""
+        row = self._reader().execute(
+            "SELECT m3u8_url, strftime('%s', 'now') - strftime('%s', update_time) FROM dplayer_cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+        return (row[0], row[1] or 0) if row else None
+    
+    def request_kind(self, url):
+        """按URL判断请求类型（list/detail/play/api），用于分类限速"""
+        if 'get_dplayer' in url:
+            return 'api'
+        if '/play/' in url:
+            return 'play'
+        if '/mp4/' in url:
+            return 'detail'
+        if '/list/' in url:
+            return 'list'
+        return 'other'
+    
+    def _send(self, url, timeout, stream=False):
+        """经过限速器发送GET请求，遇到429/503时降速后重试；启用缓存时优先使用缓存并做条件请求"""
+        kind = self.request_kind(url)
+        cache = self.http_cache if self.http_cache and self.http_cache.enabled_for(kind) else None
+        entry = None
+        headers = None
+        if cache:
+            entry = cache.lookup(url)
+            if entry and cache.is_fresh(entry, kind):
+                cache.hit()
+                self.metrics.inc('requests_total', kind=kind, status='cache')
+                return cache.response(url, entry)
+            if cache.offline:
+                self.metrics.inc('requests_total', kind=kind, status='offline_miss')
+                return build_response(url, 504, {}, b'')  # 离线模式下缓存未命中
+            headers = cache.conditional_headers(entry)
+            stream = False  # 需要完整的响应体才能写入缓存
+        
+        for attempt in range(3):
+            self.rate_limiter.acquire(kind)
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=timeout, stream=stream, headers=headers)
+            except Exception:
+                self.metrics.inc('requests_total', kind=kind, status='error')
+                raise
+            self.metrics.observe('request_seconds', time.perf_counter() - start, kind=kind)
+            self.metrics.inc('requests_total', kind=kind, status=response.status_code)
+            self.rate_limiter.report(kind, response.status_code)
+            if response.status_code not in THROTTLE_STATUS or attempt == 2:
+                break
+            response.close()
+        
+        if cache:
+            if response.status_code == 304 and entry:
+                response.close()
+                cache.refresh(url, response.headers)
+                cache.hit(revalidated=True)
+                return cache.response(url, entry)
+            if response.status_code == 200:
+                cache.store(url, response.status_code, response.headers, response.content)
+        return response
+    
     def _get_with_retry(self, url, timeout=5):
-        """发送GET请求，带优化的重试机制"""
+        """发送GET请求，带优化的重试机制；失败返回None，错误原因保存在当前线程的last_error中"""
+        self.local.last_error = None
         try:
-            response = self.session.get(url, timeout=timeout)
+            response = self._send(url, timeout)
             if response.status_code == 200:
                 return response
             else:
-                print(f"请求失败，状态码: {response.status_code}，URL: {url}")
+                self.local.last_error = f"状态码: {response.status_code}"
+                logger.warning(f"请求失败，状态码: {response.status_code}，URL: {url}")
         except Exception as e:
-            print(f"请求异常: {e}, URL: {url}")
+            self.local.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"请求异常: {e}, URL: {url}")
         return None
     
-    def _smart_delay(self):
-        """智能延迟，根据并发数动态调整"""
-        if self.delay > 0:
-            delay = self.delay * (0.8 + random.random() * 0.4)
-            time.sleep(delay)
+    def _stream_play_page(self, url, timeout=3):
+        """流式读取播放页，解析出player_aaaa或达到字节上限后立即停止，返回 (已读文本, player_aaaa)"""
+        self.local.last_error = None
+        try:
+            response = self._send(url, timeout, stream=True)
+        except Exception as e:
+            self.local.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"请求异常: {e}, URL: {url}")
+            return None, None
+        
+        # 上限、统计和Content-Length都按连接上实际传输的字节数计算（gzip等压缩时iter_content返回的是解压后的内容）；
+        # 缓存构造的响应没有连接，按内容长度计算
+        decoded = 0
+        received = 0
+        scanner = PlayerConfigScanner(response.encoding or 'utf-8')
+        try:
+            if response.status_code != 200:
+                self.local.last_error = f"状态码: {response.status_code}"
+                logger.warning(f"请求失败，状态码: {response.status_code}，URL: {url}")
+                return None, None
+            
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                decoded += len(chunk)
+                received = response.raw.tell() if response.raw is not None else decoded
+                if scanner.feed(chunk) is not None or received >= self.stream_max_bytes:
+                    break
+            
+            # 剩余内容不多时读完，保留keep-alive连接；否则直接断开
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) - received <= STREAM_CHUNK_SIZE * 2:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    pass
+        except Exception as e:
+            self.local.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"读取播放页异常: {e}, URL: {url}")
+            if not scanner.text:
+                return None, None
+        finally:
+            response.close()
+            self._bump_stat('play_pages')
+            self._bump_stat('play_bytes', received)
+        
+        return scanner.text, scanner.config or None
+    
+    def _bump_stat(self, key, count=1):
+        """线程安全地累加运行统计"""
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + count
+    
+    def print_summary(self):
+        """输出运行统计"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        titles = stats.get('titles', 0)
+        detail_fetches = stats.get('detail_fetches', 0)
+        per_title = detail_fetches / titles if titles else 0
+        print(f"📈 运行统计: 处理影片 {titles} 部, 详情页请求 {detail_fetches} 次 (每部 {per_title:.2f} 次)")
+        
+        failures = stats.get('failures', 0)
+        recovered = stats.get('recovered', 0)
+        if failures or recovered:
+            hint = " (使用 --retry-failed 重试)" if failures else ""
+            print(f"⚠️ 失败记录: 新增/更新 {failures} 条, 重试成功 {recovered} 条{hint}")
+        
+        skipped = stats.get('skipped_unchanged', 0)
+        if skipped:
+            print(f"⏭️ 列表页更新标记未变化, 跳过详情页: {skipped} 部")
+        
+        play_pages = stats.get('play_pages', 0)
+        if play_pages:
+            # async引擎读到的是aiohttp解压后的内容，拿不到传输字节数，单独标明
+            if 'play_decoded_bytes' in stats:
+                size = f"平均 {stats['play_decoded_bytes'] / play_pages / 1024:.1f} KB/页 (解压后)"
+            else:
+                size = f"平均传输 {stats.get('play_bytes', 0) / play_pages / 1024:.1f} KB/页"
+            print(f"📥 播放页流式读取: {play_pages} 页, {size}")
+        
+        limits = self.rate_limiter.summary()
+        throttled = sum(count for _, _, count in limits.values())
+        if throttled:
+            details = ', '.join(f"{kind}={current:.1f}/{rate:g}" for kind, (rate, current, _) in limits.items())
+            print(f"🚦 限速: 收到429/503共 {throttled} 次, 当前速率(次/秒) {details}")
+        
+        if self.writer:
+            writer_stats = self.writer.stats
+            print(f"💾 写库统计: 提交 {writer_stats['commits']} 次, SQL语句 {writer_stats['statements']} 条, "
+                  f"影片 {writer_stats['movies']} 条, m3u8 {writer_stats['m3u8s']} 条")
+        
+        if self.http_cache:
+            cache_stats = self.http_cache.stats
+            print(f"🗄️ HTTP缓存: 命中 {cache_stats['hits']} 次, 304重新验证 {cache_stats['revalidated']} 次, "
+                  f"未命中 {cache_stats['misses']} 次, 写入 {cache_stats['stored']} 条, 淘汰 {cache_stats['evicted']} 条")
+        
+        latencies = []
+        for kind in ('list', 'detail', 'play', 'api'):
+            histogram = self.metrics.histogram('request_seconds', kind=kind)
+            if histogram and histogram.count:
+                latencies.append(f"{kind} p50={histogram.quantile(0.5) * 1000:.0f}ms/p99={histogram.quantile(0.99) * 1000:.0f}ms")
+        if latencies:
+            print(f"⏱️ 请求延迟: {', '.join(latencies)}")
+        
+        dplayer = self.dplayer_stats(stats)
+        if dplayer['calls'] or dplayer['avoided']:
+            print(f"🔑 get_dplayer接口: 调用 {dplayer['calls']} 次, 避免调用 {dplayer['avoided']} 次 "
+                  f"(内存命中 {dplayer['memory_hits']}, 数据库命中 {dplayer['db_hits']}, 合并并发请求 {dplayer['coalesced']})")
+        
+        hits = self.resolver.hit_counts()
+        if hits:
+            print(f"🎯 m3u8解析策略命中: {', '.join(f'{name}={count}' for name, count in hits.items())}")
+    
+    def dplayer_stats(self, stats=None):
+        """get_dplayer接口缓存统计；stats中的dplayer_*为分片工作进程汇总来的计数"""
+        with self.dplayer_cache.lock:
+            result = dict(self.dplayer_cache.stats)
+        for key in result:
+            result[key] += (stats or {}).get(f'dplayer_{key}', 0)
+        result['avoided'] = result['memory_hits'] + result['db_hits'] + result['coalesced']
+        return result
     
     def check_movie_exists(self, dyid):
         """检查影片是否已存在于dy表中"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
-            try:
-                cursor.execute("SELECT dyid FROM dy WHERE dyid = ?", (dyid,))
-                result = cursor.fetchone()
-                return result is not None
-            finally:
-                cursor.close()
+        return self.known.has_title(dyid)
     
-    def get_existing_m3u8_play_urls(self, dyid):
-        """获取指定dyid已存在的play_url列表"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
-            try:
-                cursor.execute("SELECT play_url FROM m3u8 WHERE dyid = ? AND m3u8_url IS NOT NULL", (dyid,))
-                results = cursor.fetchall()
-                return [row[0] for row in results] if results else []
-            finally:
-                cursor.close()
+    def get_movie_name(self, dyid):
+        """从已入库状态获取影片名称，不存在返回None"""
+        return self.known.name(dyid)
     
     def get_missing_episodes(self, dyid, total_episodes):
         """获取缺失的集数信息"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
-            try:
-                cursor.execute("""
-                SELECT episode FROM m3u8 
-                WHERE dyid = ? AND m3u8_url IS NOT NULL 
-                ORDER BY episode
-                """, (dyid,))
-                existing_episodes = [row[0] for row in cursor.fetchall()]
-                all_episodes = set(range(1, total_episodes + 1))
-                missing_episodes = list(all_episodes - set(existing_episodes))
-                return sorted(missing_episodes)
-            finally:
-                cursor.close()
+        return self.known.missing_episodes(dyid, total_episodes)
+    
+    def list_page_url(self, category_id, page):
+        """分类列表页URL"""
+        return f"{BASE_URL}/list/{category_id}-{page}.html"
     
     def get_total_pages(self, category_id):
         """获取分类的总页数"""
-        url = f"{BASE_URL}/list/{category_id}-1.html"
+        url = self.list_page_url(category_id, 1)
         response = self._get_with_retry(url)
         if not response:
             print(f"获取分类 {category_id} 的总页数失败")
             return 0
-            
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # 优先查找尾页链接
-        last_page_link = soup.select_one('a:-soup-contains("尾页")')
-        if last_page_link and 'href' in last_page_link.attrs:
-            href = str(last_page_link['href'])
-            match = re.search(r'/list/\d+-(\d+)\.html', href)
-            if match:
-                return int(match.group(1))
-        
-        # 备用方案：查找所有页码链接
-        page_links = soup.select('ul.page a')
-        max_page = 0
-        for link in page_links:
-            text = link.get_text(strip=True)
-            if text.isdigit():
-                page_num = int(text)
-                if page_num > max_page:
-                    max_page = page_num
-        
-        return max_page if max_page > 0 else 1
+        
+        return self.parse_total_pages(response.content, response.encoding)
+    
+    def parse_total_pages(self, html, encoding=None):
+        """从分类第一页中解析总页数"""
+        return self.parser.total_pages(html, encoding)
     
     def get_movie_links_batch(self, category_id, pages):
-        """批量获取多页的影片链接"""
+        """批量获取多页的影片条目 {dyid, url, badge}"""
         all_links = []
         
         def fetch_page_links(page):
-            url = f"{BASE_URL}/list/{category_id}-{page}.html"
+            url = self.list_page_url(category_id, page)
             response = self._get_with_retry(url)
             if not response:
                 return []
             
-            soup = BeautifulSoup(response.text, 'lxml')
-            movie_links = []
-            
-            # 查找影片列表
-            vodlist_ul = soup.select_one('ul.list_mov') or soup.select_one('ul[class*="-vodlist"]')
-            if vodlist_ul:
-                vodlist = vodlist_ul.select('li a')
-                for link in vodlist:
-                    if 'href' in link.attrs:
-                        href = str(link['href'])
-                        if href.startswith('/mp4/'):
-                            full_url = f"{BASE_URL}{href}"
-                            movie_links.append(full_url)
-            
-            return list(dict.fromkeys(movie_links))
+            return self.parse_list_page(response.content, response.encoding)
         
         # 并发获取多页链接
         with ThreadPoolExecutor(max_workers=min(len(pages), 5)) as executor:
@@ -232,477 +463,269 @@ class OptimizedDSQ4DCrawler:
                 try:
                     links = future.result()
                     all_links.extend(links)
-                    print(f"页面 {page}: 获取到 {len(links)} 个链接")
+                    logger.debug(f"页面 {page}: 获取到 {len(links)} 个链接")
                 except Exception as e:
-                    print(f"获取页面 {page} 链接失败: {e}")
+                    logger.warning(f"获取页面 {page} 链接失败: {e}")
         
-        return list(dict.fromkeys(all_links))
+        return list({entry['url']: entry for entry in all_links}.values())
     
-    def parse_movie_detail_fast(self, url):
-        """快速解析影片详情"""
-        response = self._get_with_retry(url, timeout=3)
-        if not response:
-            return None
-        
-        # 提取dyid
-        match = re.search(r'/mp4/(\d+)\.html', url)
-        if not match:
-            return None
-        dyid = int(match.group(1))
-        
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # 快速提取基本信息
-        title_elem = soup.select_one('h1.title')
-        name = title_elem.get_text(strip=True).split('(')[0].strip() if title_elem else "未知"
-        
-        # 批量提取数据元素
-        data_elems = soup.select('p.data')
-        type_text = region_text = year_text = actors_text = directors_text = "未知"
-        
-        if data_elems:
-            # 类型、地区、年份
-            if len(data_elems) > 0:
-                type_links = data_elems[0].select('a')
-                if type_links:
-                    type_text = type_links[0].get_text(strip=True)
-                    if len(type_links) > 1:
-                        region_text = type_links[1].get_text(strip=True)
-                    if len(type_links) > 2:
-                        year_text = type_links[2].get_text(strip=True)
-            
-            # 演员
-            if len(data_elems) > 1:
-                actor_links = data_elems[1].select('a')
-                if actor_links:
-                    actors_text = ", ".join([a.get_text(strip=True) for a in actor_links])
-            
-            # 导演
-            if len(data_elems) > 2:
-                director_links = data_elems[2].select('a')
-                if director_links:
-                    directors_text = ", ".join([d.get_text(strip=True) for d in director_links])
-        
-        # 快速提取简介
-        description = "暂无简介"
-        desc_elems = soup.select('div[class*="-content__desc"]')
-        if len(desc_elems) > 1:
-            description = desc_elems[1].get_text(strip=True)
-        
-        if description == "暂无简介":
-            meta_desc = soup.select_one('meta[name="description"]')
-            if meta_desc and 'content' in meta_desc.attrs:
-                content = str(meta_desc['content'])
-                match = re.search(r'剧情[:：](.+)', content)
-                if match:
-                    description = match.group(1).strip()
-                else:
-                    description = content.strip()
-        
-        return {
-            'dyid': dyid,
-            'name': name,
-            'type': type_text,
-            'region': region_text,
-            'year': year_text,
-            'actors': actors_text,
-            'directors': directors_text,
-            'description': description,
-            'url': url
-        }
+    def parse_list_page(self, html, encoding=None):
+        """从列表页中解析影片条目，返回 [{dyid, url, badge}]，badge为列表页上的更新标记（如"更新至12集"）"""
+        return self.parser.list_entries(html, encoding)
     
-    def get_episode_count_fast(self, soup):
-        """从已解析的soup中快速获取集数"""
-        playlist_ul = soup.select_one('ul[class*="-content__playlist"]')
-        if not playlist_ul:
-            return 1
-        
-        playlist_items = playlist_ul.select('li a')
-        episode_count = 0
-        for item in playlist_items:
-            if item.get_text(strip=True) != "APP播放":
-                episode_count += 1
-        
-        return max(episode_count, 1)
+    def is_unchanged(self, entry):
+        """列表页更新标记与上次完整爬取时一致，说明影片没有新剧集，无需请求详情页"""
+        badge = entry.get('badge')
+        dyid = entry.get('dyid')
+        return bool(badge) and self.known.has_title(dyid) and self.known.badge(dyid) == badge
     
-    def get_m3u8_urls_batch(self, dyid, episode_count, movie_name):
-        """批量获取m3u8链接"""
-        m3u8_data = []
-        
-        def fetch_m3u8(episode_index):
-            play_url = f"{BASE_URL}/play/{dyid}-0-{episode_index}.html"
+    def filter_changed(self, entries):
+        """过滤掉更新标记未变化的影片，返回需要爬取的条目"""
+        changed = [entry for entry in entries if not self.is_unchanged(entry)]
+        skipped = len(entries) - len(changed)
+        if skipped:
+            self._bump_stat('skipped_unchanged', skipped)
+        return changed
+    
+    def parse_detail_page(self, url, html, encoding=None):
+        """从已下载的详情页中一次性提取影片信息、集数和播放列表"""
+        return self.parser.detail(html, url, encoding)
+    
+    def get_episode_count_fast(self, html, encoding=None):
+        """从已下载的详情页中快速获取集数"""
+        return self.parser.episode_count(html, encoding)
+    
+    def fetch_m3u8(self, play_url):
+        """请求播放页并解析m3u8链接，返回m3u8链接、命中的策略、player_aaaa字段和失败原因"""
+        if self.stream_play_pages and '/play/' in play_url:
+            content, player = self._stream_play_page(play_url, timeout=3)
+            if content is None:
+                return {'m3u8_url': None, 'strategy': None, 'player': {}, 'error': self.local.last_error}
+            result = self.resolver.resolve_page(content, player)
+        else:
             response = self._get_with_retry(play_url, timeout=3)
             if not response:
-                return episode_index, play_url, None
-            
-            # 使用正则表达式快速查找m3u8链接
-            content = response.text
-            
-            # 方法1：查找player_aaaa配置
-            player_match = re.search(r'var player_aaaa\s*=\s*({.*?})', content, re.DOTALL)
-            if player_match:
-                player_data = player_match.group(1)
-                url_match = re.search(r"url\s*:\s*'([^']*)'", player_data)
-                if url_match:
-                    url = url_match.group(1)
-                    
-                    if "get_dplayer" in url:
-                        decrypt_api_url = f"{BASE_URL}{url}"
-                        api_response = self._get_with_retry(decrypt_api_url, timeout=3)
-                        if api_response:
-                            try:
-                                api_data = api_response.json()
-                                if api_data.get('code') == 200 and api_data.get('url'):
-                                    return episode_index, play_url, api_data['url']
-                            except:
-                                pass
-                    elif re.match(r'^[A-Za-z0-9+/=]+$', url) and len(url) > 20:
-                        try:
-                            decoded_url = base64.b64decode(url).decode('utf-8')
-                            if decoded_url.startswith('http'):
-                                return episode_index, play_url, decoded_url
-                        except:
-                            pass
-                    elif url.startswith('http'):
-                        return episode_index, play_url, url
-            
-            # 方法2：直接查找m3u8链接
-            m3u8_match = re.search(r'(https?://[^\s\'"`,]+\.m3u8)', content)
-            if m3u8_match:
-                return episode_index, play_url, m3u8_match.group(1)
-            
-            return episode_index, play_url, None
+                return {'m3u8_url': None, 'strategy': None, 'player': {}, 'error': self.local.last_error}
+            result = self.resolver.resolve_page(response.text)
         
-        # 并发获取m3u8链接
-        with ThreadPoolExecutor(max_workers=min(episode_count, 5)) as executor:
-            future_to_episode = {
-                executor.submit(fetch_m3u8, i): i 
-                for i in range(episode_count)
-            }
-            
-            for future in as_completed(future_to_episode):
-                try:
-                    episode_index, play_url, m3u8_url = future.result()
-                    m3u8_data.append({
-                        'dyid': dyid,
-                        'name': movie_name,
-                        'episode': episode_index + 1,
-                        'play_url': play_url,
-                        'm3u8_url': m3u8_url
-                    })
-                except Exception as e:
-                    episode_index = future_to_episode[future]
-                    print(f"获取第{episode_index + 1}集m3u8失败: {e}")
-        
-        return sorted(m3u8_data, key=lambda x: x['episode'])
+        if not result['m3u8_url']:
+            # get_dplayer接口请求失败时解析器已带回其错误原因
+            result['error'] = result.get('error') or "未解析到m3u8链接"
+        return result
     
-    def get_m3u8_urls_selective(self, dyid, episode_numbers, movie_name):
-        """选择性获取指定集数的m3u8链接"""
+    def _fetch_m3u8_jobs(self, dyid, movie_name, jobs):
+        """并发解析一组 (集数, 播放页URL) 的m3u8链接"""
         m3u8_data = []
+        if not jobs:
+            return m3u8_data
         
-        def fetch_m3u8(episode_number):
-            episode_index = episode_number - 1  # 转换为0基索引
-            play_url = f"{BASE_URL}/play/{dyid}-0-{episode_index}.html"
-            response = self._get_with_retry(play_url, timeout=3)
-            if not response:
-                return episode_number, play_url, None
-            
-            # 使用正则表达式快速查找m3u8链接
-            content = response.text
-            
-            # 方法1：查找player_aaaa配置
-            player_match = re.search(r'var player_aaaa\s*=\s*({.*?})', content, re.DOTALL)
-            if player_match:
-                player_data = player_match.group(1)
-                url_match = re.search(r"url\s*:\s*'([^']*)'", player_data)
-                if url_match:
-                    url = url_match.group(1)
-                    
-                    if "get_dplayer" in url:
-                        decrypt_api_url = f"{BASE_URL}{url}"
-                        api_response = self._get_with_retry(decrypt_api_url, timeout=3)
-                        if api_response:
-                            try:
-                                api_data = api_response.json()
-                                if api_data.get('code') == 200 and api_data.get('url'):
-                                    return episode_number, play_url, api_data['url']
-                            except:
-                                pass
-                    elif re.match(r'^[A-Za-z0-9+/=]+$', url) and len(url) > 20:
-                        try:
-                            decoded_url = base64.b64decode(url).decode('utf-8')
-                            if decoded_url.startswith('http'):
-                                return episode_number, play_url, decoded_url
-                        except:
-                            pass
-                    elif url.startswith('http'):
-                        return episode_number, play_url, url
-            
-            # 方法2：直接查找m3u8链接
-            m3u8_match = re.search(r'(https?://[^\s\'"`,]+\.m3u8)', content)
-            if m3u8_match:
-                return episode_number, play_url, m3u8_match.group(1)
-            
-            return episode_number, play_url, None
-        
-        # 并发获取指定集数的m3u8链接
-        with ThreadPoolExecutor(max_workers=min(len(episode_numbers), 5)) as executor:
-            future_to_episode = {
-                executor.submit(fetch_m3u8, episode_num): episode_num 
-                for episode_num in episode_numbers
+        with ThreadPoolExecutor(max_workers=min(len(jobs), 5)) as executor:
+            future_to_job = {
+                executor.submit(self.fetch_m3u8, play_url): (episode_number, play_url)
+                for episode_number, play_url in jobs
             }
             
-            for future in as_completed(future_to_episode):
+            for future in as_completed(future_to_job):
+                episode_number, play_url = future_to_job[future]
                 try:
-                    episode_number, play_url, m3u8_url = future.result()
-                    m3u8_data.append({
-                        'dyid': dyid,
-                        'name': movie_name,
-                        'episode': episode_number,
-                        'play_url': play_url,
-                        'm3u8_url': m3u8_url
-                    })
+                    m3u8_data.append(self.build_m3u8_row(
+                        dyid, movie_name, episode_number, play_url, future.result()
+                    ))
                 except Exception as e:
-                    episode_number = future_to_episode[future]
-                    print(f"获取第{episode_number}集m3u8失败: {e}")
+                    logger.warning(f"获取第{episode_number}集m3u8失败: {e}")
         
         return sorted(m3u8_data, key=lambda x: x['episode'])
     
+    def build_m3u8_row(self, dyid, movie_name, episode_number, play_url, result):
+        """把解析结果转换为m3u8记录"""
+        player = result['player']
+        self.metrics.inc('resolver_hits_total', strategy=result['strategy'] or 'none')
+        return {
+            'dyid': dyid,
+            'name': movie_name,
+            'episode': episode_number,
+            'play_url': play_url,
+            'm3u8_url': result['m3u8_url'],
+            'strategy': result['strategy'],
+            'source': player.get('from'),
+            'link_next': player.get('link_next'),
+            'error': result.get('error')
+        }
+    
+    def get_m3u8_urls_batch(self, dyid, episode_count, movie_name):
+        """批量获取m3u8链接"""
+        jobs = [
+            (i + 1, f"{BASE_URL}/play/{dyid}-0-{i}.html")
+            for i in range(episode_count)
+        ]
+        return self._fetch_m3u8_jobs(dyid, movie_name, jobs)
+    
+    def get_m3u8_urls_selective(self, dyid, episode_numbers, movie_name, play_urls=None):
+        """选择性获取指定集数的m3u8链接"""
+        play_urls = play_urls or {}
+        jobs = [
+            (episode_number, play_urls.get(episode_number) or f"{BASE_URL}/play/{dyid}-0-{episode_number - 1}.html")
+            for episode_number in episode_numbers
+        ]
+        return self._fetch_m3u8_jobs(dyid, movie_name, jobs)
+    
     def batch_save_to_db(self, movies=None, m3u8s=None):
-        """批量保存数据到数据库（优化查重）"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
-            try:
-                new_movies = 0
-                updated_movies = 0
-                new_m3u8s = 0
-                updated_m3u8s = 0
-                
-                if movies:
-                    # 批量插入或更新影片信息（只处理新影片）
-                    for movie in movies:
-                        cursor.execute("SELECT dyid FROM dy WHERE dyid = ?", (movie['dyid'],))
-                        if cursor.fetchone():
-                            # 更新现有影片信息
-                            cursor.execute("""
-                            UPDATE dy SET 
-                                name = ?, type = ?, region = ?, year = ?, 
-                                actors = ?, directors = ?, description = ?, url = ?,
-                                crawl_time = CURRENT_TIMESTAMP
-                            WHERE dyid = ?
-                            """, (
-                                movie['name'], movie['type'], movie['region'], movie['year'],
-                                movie['actors'], movie['directors'], movie['description'], 
-                                movie['url'], movie['dyid']
-                            ))
-                            updated_movies += 1
-                        else:
-                            # 插入新影片
-                            cursor.execute("""
-                            INSERT INTO dy (dyid, name, type, region, year, actors, directors, description, url)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (
-                                movie['dyid'], movie['name'], movie['type'], movie['region'], 
-                                movie['year'], movie['actors'], movie['directors'], 
-                                movie['description'], movie['url']
-                            ))
-                            new_movies += 1
-                
-                if m3u8s:
-                    # 批量插入或更新m3u8信息（智能查重）
-                    for m3u8 in m3u8s:
-                        if m3u8['m3u8_url']:  # 只保存有效的m3u8链接
-                            cursor.execute("""
-                            SELECT id, m3u8_url FROM m3u8 
-                            WHERE dyid = ? AND episode = ?
-                            """, (m3u8['dyid'], m3u8['episode']))
-                            existing = cursor.fetchone()
-                            
-                            if existing:
-                                # 如果已存在但m3u8_url为空，则更新
-                                if not existing[1]:  # m3u8_url为空
-                                    cursor.execute("""
-                                    UPDATE m3u8 SET 
-                                        name = ?, play_url = ?, m3u8_url = ?, crawl_time = CURRENT_TIMESTAMP
-                                    WHERE dyid = ? AND episode = ?
-                                    """, (m3u8['name'], m3u8['play_url'], m3u8['m3u8_url'], 
-                                         m3u8['dyid'], m3u8['episode']))
-                                    updated_m3u8s += 1
-                                # 如果已存在且有m3u8_url，跳过（避免重复）
-                            else:
-                                # 插入新记录
-                                cursor.execute("""
-                                INSERT INTO m3u8 (dyid, name, episode, play_url, m3u8_url)
-                                VALUES (?, ?, ?, ?, ?)
-                                """, (m3u8['dyid'], m3u8['name'], m3u8['episode'], 
-                                     m3u8['play_url'], m3u8['m3u8_url']))
-                                new_m3u8s += 1
-                
-                self.conn.commit()
-                
-                # 输出统计信息
-                if new_movies or updated_movies or new_m3u8s or updated_m3u8s:
-                    stats = []
-                    if new_movies: stats.append(f"新增{new_movies}部影片")
-                    if updated_movies: stats.append(f"更新{updated_movies}部影片")
-                    if new_m3u8s: stats.append(f"新增{new_m3u8s}个m3u8")
-                    if updated_m3u8s: stats.append(f"补充{updated_m3u8s}个m3u8")
-                    print(f"💾 批量保存: {', '.join(stats)}")
-                
-                return True
-                
-            except Exception as e:
-                print(f"批量保存数据失败: {e}")
-                self.conn.rollback()
-                return False
-            finally:
-                cursor.close()
+        """批量保存数据到数据库（交给写库线程并等待提交完成）"""
+        for movie in movies or []:
+            self.writer.put_movie(movie)
+        if m3u8s:
+            self.writer.put_m3u8s(m3u8s)
+        return self.writer.flush()
     
     def add_to_batch(self, movie_info=None, m3u8_info=None):
-        """添加数据到批量处理队列"""
-        with self.batch_lock:
-            if movie_info:
-                self.movie_batch.append(movie_info)
-            if m3u8_info:
-                self.m3u8_batch.extend(m3u8_info)
-            
-            # 当批量达到指定大小时，执行保存
-            if (len(self.movie_batch) >= self.batch_size or 
-                len(self.m3u8_batch) >= self.batch_size * 5):
-                self.flush_batch()
+        """添加数据到写库队列，由写库线程按数量或时间批量提交"""
+        if movie_info:
+            self.writer.put_movie(movie_info)
+        if m3u8_info:
+            self.writer.put_m3u8s(m3u8_info)
     
     def flush_batch(self):
         """刷新批量数据到数据库"""
-        if self.movie_batch or self.m3u8_batch:
-            movies = self.movie_batch.copy()
-            m3u8s = self.m3u8_batch.copy()
-            self.movie_batch.clear()
-            self.m3u8_batch.clear()
-            
-            success = self.batch_save_to_db(movies, m3u8s)
-            if success:
-                print(f"批量保存: {len(movies)}部影片, {len(m3u8s)}个m3u8链接")
-            return success
+        if self.writer:
+            return self.writer.flush()
         return True
     
-    def crawl_movie_fast(self, url):
-        """快速爬取单部影片（带查重功能）"""
+    def crawl_movie_fast(self, url, badge=None):
+        """快速爬取单部影片（带查重功能），badge为列表页上的更新标记"""
         try:
             # 提取dyid进行预检查
-            match = re.search(r'/mp4/(\d+)\.html', url)
-            if not match:
-                print(f"❌ 无法从URL提取dyid: {url}")
+            dyid = self.extract_dyid(url)
+            if dyid is None:
+                logger.warning(f"❌ 无法从URL提取dyid: {url}")
                 return False
+            self._bump_stat('titles')
+            started = time.time()
             
-            dyid = int(match.group(1))
-            
-            # 检查影片是否已存在
-            movie_exists = self.check_movie_exists(dyid)
-            
-            # 获取影片详情页面
+            # 获取影片详情页面（每部影片只请求和解析一次）
             response = self._get_with_retry(url, timeout=5)
             if not response:
+                self.record_failure(url, 'detail', dyid)
                 return False
+            self._bump_stat('detail_fetches')
             
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            # 获取集数
-            episode_count = self.get_episode_count_fast(soup)
+            plan = self.plan_title(url, response.content, badge, response.encoding)
+            if not plan:
+                return False
+            plan['started'] = started
             
-            movie_info = None
             m3u8_data = []
-            
-            # 获取影片名称（用于m3u8记录）
-            movie_name = f"影片{dyid}"  # 默认名称
-            
-            # 如果影片不存在，需要爬取影片信息
-            if not movie_exists:
-                movie_info = self.parse_movie_detail_fast(url)
-                if not movie_info:
-                    return False
-                movie_name = movie_info['name']
-                print(f"🆕 新影片: {movie_name}")
-            else:
-                # 影片已存在，从数据库获取名称
-                with self.db_lock:
-                    cursor = self.conn.cursor()
-                    try:
-                        cursor.execute("SELECT name FROM dy WHERE dyid = ?", (dyid,))
-                        result = cursor.fetchone()
-                        if result:
-                            movie_name = result[0]
-                    finally:
-                        cursor.close()
-                print(f"📋 已存在影片ID: {dyid} ({movie_name})")
-            
-            # 检查m3u8链接情况
-            missing_episodes = self.get_missing_episodes(dyid, episode_count)
-            
-            if missing_episodes:
-                print(f"🔍 需要补充 {len(missing_episodes)} 集: {missing_episodes}")
+            if plan['jobs']:
                 # 只爬取缺失的集数
-                m3u8_data = self.get_m3u8_urls_selective(
-                    dyid, missing_episodes, movie_name
-                )
-            else:
-                print(f"✅ 所有集数已完整: {episode_count}集")
-            
-            # 添加到批量处理队列
-            if movie_info or m3u8_data:
-                self.add_to_batch(movie_info, m3u8_data)
-                
-                valid_m3u8_count = sum(1 for m in m3u8_data if m['m3u8_url']) if m3u8_data else 0
-                status = "新增" if movie_info else "补充"
-                print(f"✓ {status} ({episode_count}集, {valid_m3u8_count}个新链接)")
+                m3u8_data = self._fetch_m3u8_jobs(plan['dyid'], plan['name'], plan['jobs'])
             
+            self.finish_title(plan, m3u8_data)
             return True
             
         except Exception as e:
-            print(f"爬取影片失败 {url}: {e}")
+            logger.warning(f"爬取影片失败 {url}: {e}")
             return False
     
-    def save_progress(self, category, current_page, total_pages, last_dyid, status="running"):
-        """保存爬取进度"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
-            try:
-                cursor.execute("SELECT id FROM crawl_progress WHERE category = ?", (category,))
-                if cursor.fetchone():
-                    cursor.execute("""
-                    UPDATE crawl_progress SET 
-                        current_page = ?, total_pages = ?, last_dyid = ?, 
-                        status = ?, update_time = CURRENT_TIMESTAMP
-                    WHERE category = ?
-                    """, (current_page, total_pages, last_dyid, status, category))
-                else:
-                    cursor.execute("""
-                    INSERT INTO crawl_progress (category, current_page, total_pages, last_dyid, status)
-                    VALUES (?, ?, ?, ?, ?)
-                    """, (category, current_page, total_pages, last_dyid, status))
-                
-                self.conn.commit()
-                return True
-            except Exception as e:
-                print(f"保存爬取进度失败: {e}")
-                self.conn.rollback()
-                return False
-            finally:
-                cursor.close()
+    def extract_dyid(self, url):
+        """从详情页URL中提取dyid，失败返回None"""
+        return extract_dyid(url)
+    
+    def plan_title(self, url, html, badge=None, encoding=None, detail=None):
+        """解析已下载的详情页并与数据库比对，返回需要补充的集数任务；detail为已解析的结果时不再解析html"""
+        if detail is None:
+            detail = self.parse_detail_page(url, html, encoding)
+        if not detail:
+            return None
+        self.record_success(url)
+        
+        dyid = detail['movie']['dyid']
+        episode_count = detail['episode_count']
+        play_urls = {ep['episode']: ep['play_url'] for ep in detail['episodes']}
+        
+        movie_info = None
+        
+        # 获取影片名称（用于m3u8记录）
+        movie_name = f"影片{dyid}"  # 默认名称
+        
+        # 如果影片不存在，直接使用已解析的影片信息
+        if not self.check_movie_exists(dyid):
+            movie_info = detail['movie']
+            movie_name = movie_info['name']
+            logger.debug(f"🆕 新影片: {movie_name}")
+        else:
+            # 影片已存在，从数据库获取名称
+            movie_name = self.get_movie_name(dyid) or movie_name
+            logger.debug(f"📋 已存在影片ID: {dyid} ({movie_name})")
+        
+        # 检查m3u8链接情况
+        missing_episodes = self.get_missing_episodes(dyid, episode_count)
+        if missing_episodes:
+            logger.debug(f"🔍 需要补充 {len(missing_episodes)} 集: {missing_episodes}")
+        else:
+            logger.debug(f"✅ 所有集数已完整: {episode_count}集")
+        
+        jobs = [
+            (episode_number, play_urls.get(episode_number) or f"{BASE_URL}/play/{dyid}-0-{episode_number - 1}.html")
+            for episode_number in missing_episodes
+        ]
+        
+        return {
+            'dyid': dyid,
+            'name': movie_name,
+            'movie': movie_info,
+            'episode_count': episode_count,
+            'badge': badge,
+            'jobs': jobs
+        }
+    
+    def finish_title(self, plan, m3u8_data):
+        """将单部影片的结果加入批量处理队列"""
+        movie_info = plan['movie']
+        if movie_info or m3u8_data:
+            self.add_to_batch(movie_info, m3u8_data)
+            
+            valid_m3u8_count = sum(1 for m in m3u8_data if m['m3u8_url']) if m3u8_data else 0
+            status = "新增" if movie_info else "补充"
+            logger.debug(f"✓ {status} ({plan['episode_count']}集, {valid_m3u8_count}个新链接)")
+        
+        # 单部影片从请求详情页到结果入队的耗时
+        if plan.get('started'):
+            self.metrics.record_span('title', plan['started'], dyid=plan['dyid'], episodes=len(m3u8_data or []))
+        self.metrics.inc('titles_total', result='new' if movie_info else ('updated' if m3u8_data else 'unchanged'))
+        
+        # 只有所有集数都拿到链接后才记录更新标记，否则下次仍需请求详情页补充
+        for row in m3u8_data or []:
+            if row['m3u8_url']:
+                self.record_success(row['play_url'])
+            else:
+                self.record_failure(row['play_url'], 'play', plan['dyid'], row['episode'],
+                                    row.get('error') or "未解析到m3u8链接")
+        
+        badge = plan.get('badge')
+        complete = all(m['m3u8_url'] for m in m3u8_data) if m3u8_data else True
+        if badge and complete and self.known.badge(plan['dyid']) != badge:
+            self.writer.put_badge(plan['dyid'], badge)
+    
+    def save_progress(self, category, current_page, total_pages, last_dyid, status="running", checkpoint=None):
+        """保存爬取进度（随下一次批量提交写入），checkpoint为CategoryCheckpoint时一并保存影片级断点"""
+        fields = checkpoint.fields() if checkpoint else {}
+        self.writer.put_progress(category, current_page, total_pages, last_dyid, status, **fields)
+        return True
     
     def get_progress(self, category):
         """获取指定分类的爬取进度"""
-        with self.db_lock:
-            cursor = self.conn.cursor()
+        cursor = self._reader().cursor()
+        try:
             cursor.execute("""
-            SELECT category, current_page, total_pages, last_dyid, status
+            SELECT category, current_page, total_pages, last_dyid, status, pages_done, titles_done, inflight
             FROM crawl_progress WHERE category = ?
             """, (category,))
             
             row = cursor.fetchone()
-            cursor.close()
             if row:
                 return dict(row)
             return None
+        finally:
+            cursor.close()
     
     def crawl_category_optimized(self, category_id, start_page=None):
         """优化的分类爬取方法"""
@@ -711,14 +734,23 @@ class OptimizedDSQ4DCrawler:
         
         current_page = 1
         total_pages = 0
+        last_dyid = 0
+        pipeline = None
+        checkpoint = None
         
         try:
-            # 获取或恢复进度
+            # 获取或恢复进度（增量模式总是从头开始），中断或出错后同样从断点恢复
             progress = self.get_progress(category_id)
-            if progress and progress['status'] == 'running' and start_page is None:
-                current_page = progress['current_page']
+            if progress:
+                last_dyid = progress['last_dyid'] or 0
+            if (progress and progress['status'] != 'completed' and progress['total_pages']
+                    and start_page is None and not self.incremental):
                 total_pages = progress['total_pages']
-                print(f"📋 恢复爬取进度: 当前页 {current_page}/{total_pages}")
+                checkpoint = CategoryCheckpoint.from_progress(progress)
+                current_page = checkpoint.first_pending()
+                print(f"📋 恢复爬取进度: 已完成 {len(checkpoint.pages_done)}/{total_pages} 页, "
+                      f"未完成页面中已完成 {checkpoint.titles_done_count()} 部, "
+                      f"重新处理 {len(checkpoint.resumed_inflight)} 部中断的影片")
             else:
                 total_pages = self.get_total_pages(category_id)
                 if total_pages == 0:
@@ -731,70 +763,149 @@ class OptimizedDSQ4DCrawler:
                 total_pages = 2
                 print("🧪 测试模式: 只爬取前2页")
             
-            self.save_progress(category_id, current_page, total_pages, 0, "running")
+            if self.incremental:
+                print(f"🔄 增量模式: 连续 {self.incremental} 页没有新内容后停止 (上次最大dyid: {last_dyid})")
             
-            # 按批次处理页面
-            batch_size = min(3, total_pages - current_page + 1)  # 每批处理3页
+            if checkpoint is None:
+                checkpoint = CategoryCheckpoint(total_pages, range(1, current_page))
+            checkpoint.total_pages = total_pages
+            self.save_progress(category_id, current_page, total_pages, last_dyid, "running", checkpoint)
             
-            for batch_start in range(current_page, total_pages + 1, batch_size):
-                batch_end = min(batch_start + batch_size - 1, total_pages)
-                batch_pages = list(range(batch_start, batch_end + 1))
-                
-                print(f"📦 批量处理页面 {batch_start}-{batch_end}")
-                
-                # 批量获取影片链接
-                movie_links = self.get_movie_links_batch(category_id, batch_pages)
-                print(f"🔗 获取到 {len(movie_links)} 个影片链接")
-                
-                if not movie_links:
-                    continue
-                
-                # 并发爬取影片
-                success_count = 0
-                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    # 提交所有任务
-                    future_to_url = {
-                        executor.submit(self.crawl_movie_fast, url): url 
-                        for url in movie_links
-                    }
-                    
-                    # 使用进度条显示处理进度
-                    with tqdm(total=len(movie_links), desc=f"爬取进度") as pbar:
-                        for future in as_completed(future_to_url):
-                            url = future_to_url[future]
-                            try:
-                                if future.result():
-                                    success_count += 1
-                            except Exception as e:
-                                print(f"❌ 处理失败 {url}: {e}")
-                            finally:
-                                pbar.update(1)
-                                self._smart_delay()
-                
-                # 刷新批量数据
-                self.flush_batch()
-                
-                # 更新进度
-                self.save_progress(category_id, batch_end, total_pages, 0, "running")
-                
-                print(f"✅ 批次完成: {success_count}/{len(movie_links)} 成功")
+            # 流水线处理：列表页 -> 详情页 -> 剧集解析 -> 写库
+            pipeline = CategoryPipeline(
+                self, category_id, checkpoint.pending_pages(current_page), total_pages,
+                list_workers=self.list_workers,
+                detail_workers=self.max_workers,
+                play_workers=self.play_workers,
+                queue_size=self.queue_size,
+                quiet_pages=self.incremental,
+                last_dyid=last_dyid,
+                checkpoint=checkpoint
+            )
+            success_count, title_count = pipeline.run()
+            print(f"✅ 处理完成: {success_count}/{title_count} 成功")
+            if pipeline.last_dyid > last_dyid:
+                print(f"🆕 最大dyid: {last_dyid} -> {pipeline.last_dyid}")
             
             # 最终刷新
             self.flush_batch()
-            self.save_progress(category_id, total_pages, total_pages, 0, "completed")
+            self.save_progress(category_id, total_pages, total_pages, pipeline.last_dyid, "completed")
             print(f"🎉 {category_name}爬取完成!")
             return True
             
         except KeyboardInterrupt:
             print("\n⏹️ 爬取被用户中断")
+            if pipeline:
+                current_page, last_dyid = pipeline.checkpoint_page, pipeline.last_dyid
             self.flush_batch()
-            self.save_progress(category_id, current_page, total_pages, 0, "interrupted")
+            self.save_progress(category_id, current_page, total_pages, last_dyid, "interrupted", checkpoint)
             return False
         except Exception as e:
             print(f"💥 爬取过程中发生错误: {e}")
+            if pipeline:
+                current_page, last_dyid = pipeline.checkpoint_page, pipeline.last_dyid
             self.flush_batch()
-            self.save_progress(category_id, current_page, total_pages, 0, "error")
+            self.save_progress(category_id, current_page, total_pages, last_dyid, "error", checkpoint)
+            return False
+    
+    def get_due_failures(self):
+        """获取已到重试时间且未超过最大重试次数的失败记录"""
+        cursor = self._reader().cursor()
+        try:
+            cursor.execute("""
+            SELECT url, kind, dyid, episode, attempts FROM crawl_failures
+            WHERE attempts < ? AND next_retry <= CURRENT_TIMESTAMP
+            ORDER BY next_retry
+            """, (MAX_RETRY_ATTEMPTS,))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    def count_dead_failures(self):
+        """超过最大重试次数、不再自动重试的失败记录数"""
+        cursor = self._reader().cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM crawl_failures WHERE attempts >= ?", (MAX_RETRY_ATTEMPTS,))
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    
+    def _retry_list_page(self, url):
+        """重试列表页，并爬取其中有变化的影片"""
+        response = self._get_with_retry(url)
+        if not response:
+            self.record_failure(url, 'list')
             return False
+        self.record_success(url)
+        entries = self.filter_changed(self.parse_list_page(response.content, response.encoding))
+        results = [self.crawl_movie_fast(entry['url'], entry['badge']) for entry in entries]
+        return all(results)
+    
+    def _retry_episodes(self, dyid, jobs):
+        """只重试单部影片中失败的集数"""
+        pending = []
+        for episode_number, play_url in jobs:
+            if self.known.has_episode(dyid, episode_number):
+                self.record_success(play_url)
+            else:
+                pending.append((episode_number, play_url))
+        if not pending:
+            return True
+        
+        plan = {
+            'dyid': dyid,
+            'name': self.get_movie_name(dyid) or f"影片{dyid}",
+            'movie': None,
+            'episode_count': len(pending),
+            'badge': None,
+            'jobs': pending,
+            'started': time.time()
+        }
+        m3u8_data = self._fetch_m3u8_jobs(dyid, plan['name'], pending)
+        self.finish_title(plan, m3u8_data)
+        return all(row['m3u8_url'] for row in m3u8_data)
+    
+    def retry_failed(self):
+        """只重试失败记录表中到期的URL，每次失败后重试间隔指数增长"""
+        failures = self.get_due_failures()
+        dead = self.count_dead_failures()
+        if dead:
+            print(f"☠️ {dead} 条失败记录已达到最大重试次数({MAX_RETRY_ATTEMPTS})，不再自动重试")
+        if not failures:
+            print("✅ 没有到期需要重试的失败记录")
+            return True
+        
+        # 列表页、详情页逐个重试，播放页按影片合并
+        tasks = []
+        episodes = {}
+        for failure in failures:
+            if failure['kind'] == 'list':
+                tasks.append((self._retry_list_page, (failure['url'],)))
+            elif failure['kind'] == 'detail':
+                tasks.append((self.crawl_movie_fast, (failure['url'],)))
+            elif failure['kind'] == 'play' and failure['dyid'] is not None:
+                episodes.setdefault(failure['dyid'], []).append((failure['episode'], failure['url']))
+        for dyid, jobs in episodes.items():
+            tasks.append((self._retry_episodes, (dyid, sorted(jobs))))
+        
+        kinds = {}
+        for failure in failures:
+            kinds[failure['kind']] = kinds.get(failure['kind'], 0) + 1
+        print(f"🔁 重试失败记录: {len(failures)} 条 ({', '.join(f'{k}={v}' for k, v in kinds.items())})")
+        
+        success_count = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(func, *args) for func, args in tasks]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="重试进度"):
+                try:
+                    if future.result():
+                        success_count += 1
+                except Exception as e:
+                    logger.warning(f"重试失败: {e}")
+        
+        self.flush_batch()
+        print(f"✅ 重试完成: {success_count}/{len(tasks)} 成功")
+        return True
     
     def crawl_all_optimized(self):
         """优化的全分类爬取"""
@@ -806,13 +917,24 @@ class OptimizedDSQ4DCrawler:
             print(f"⏱️ 等待 {self.delay * 2} 秒后继续下一个分类...")
             time.sleep(self.delay * 2)
     
-    def close(self):
-        """关闭资源"""
-        self.flush_batch()  # 确保所有数据都已保存
+    def close(self, summary=True):
+        """关闭资源，summary为False时不输出运行统计（分片工作进程由协调进程汇总输出）"""
+        if self.writer:
+            self.writer.close()  # 确保所有数据都已保存
+        if summary:
+            self.print_summary()
+        self.metrics.close()
+        self.dplayer_cache.close()
+        if isinstance(self.parser, ParsePool):
+            self.parser.close()
         if self.session:
             self.session.close()
-        if self.conn:
-            self.conn.close()
+        if self.http_cache:
+            self.http_cache.close()
+        with self.read_conns_lock:
+            for conn in self.read_conns:
+                conn.close()
+            self.read_conns.clear()
 
 def main():
     """主函数"""
@@ -820,24 +942,154 @@ def main():
     parser.add_argument("--test", action="store_true", help="测试模式，每个分类只爬取前2页")
     parser.add_argument("--category", type=int, choices=list(CATEGORIES.keys()), help="指定要爬取的分类ID (1=电影, 2=电视剧, 3=动漫, 4=综艺, 19=大陆剧, 20=欧美剧, 21=香港剧, 22=韩国剧, 23=台湾剧, 24=日本剧, 25=海外剧, 26=泰国剧, 27=短剧)")
     parser.add_argument("--page", type=int, help="指定从哪一页开始爬取")
-    parser.add_argument("--delay", type=float, default=0.1, help="请求延迟时间(秒)")
-    parser.add_argument("--workers", type=int, default=8, help="并发线程数")
+    parser.add_argument("--delay", type=float, default=0.1, help="分类之间的等待时间(秒)")
+    parser.add_argument("--rate", action="append", metavar="KIND=RATE", help="按请求类型限速(次/秒)，可多次指定，类型: list/detail/play/api，例如 --rate play=20")
+    parser.add_argument("--workers", type=int, default=8, help="详情页并发线程数")
+    parser.add_argument("--list-workers", type=int, default=2, help="列表页并发线程数")
+    parser.add_argument("--play-workers", type=int, default=16, help="播放页(剧集解析)并发线程数")
+    parser.add_argument("--queue-size", type=int, help="流水线各阶段之间的队列容量(默认按线程数自动设置)")
     parser.add_argument("--batch-size", type=int, default=50, help="批量处理大小")
+    parser.add_argument("--commit-interval", type=float, default=2.0, help="写库线程的最长提交间隔(秒)")
+    parser.add_argument("--no-stream", action="store_true", help="完整下载播放页，不使用流式提前结束")
+    parser.add_argument("--stream-max-kb", type=int, default=256, help="流式读取播放页的最大传输量(KB，async引擎按解压后的字节数计算)")
+    parser.add_argument("--engine", choices=["requests", "async"], default="requests", help="爬取引擎: requests=多线程(默认), async=asyncio单事件循环")
+    parser.add_argument("--list-concurrency", type=int, default=4, help="async引擎: 列表页全局并发数")
+    parser.add_argument("--detail-concurrency", type=int, default=16, help="async引擎: 详情页全局并发数")
+    parser.add_argument("--play-concurrency", type=int, default=32, help="async引擎: 播放页全局并发数")
+    parser.add_argument("--incremental", type=int, nargs="?", const=3, default=0, metavar="N",
+                        help="增量模式: 每个分类从第1页开始，连续N页(默认3)没有新影片或更新时停止")
+    parser.add_argument("--cache", nargs="?", const="http_cache.db", metavar="PATH", help="启用磁盘HTTP缓存(默认文件 http_cache.db)")
+    parser.add_argument("--cache-size-mb", type=int, default=512, help="HTTP缓存的最大容量(MB)，超出后按LRU淘汰")
+    parser.add_argument("--cache-ttl", action="append", metavar="KIND=SECONDS", help="按请求类型设置缓存有效期(秒)，0表示不缓存，默认 list=600, detail=604800, play=0, api=0")
+    parser.add_argument("--offline", action="store_true", help="离线回放模式: 只从HTTP缓存读取，不访问网络")
+    parser.add_argument("--parser", choices=["bs4", "lxml"], default="bs4",
+                        help="列表页和详情页的解析后端: bs4=BeautifulSoup(默认), lxml=lxml.html+XPath(更快)")
+    parser.add_argument("--parse-processes", type=int, default=0, metavar="N",
+                        help="在N个解析进程中解析页面，解析不再占用抓取线程的GIL(默认0，在抓取线程中解析)")
+    parser.add_argument("--dplayer-workers", type=int, default=4, help="get_dplayer接口的并发调用数")
+    parser.add_argument("--dplayer-cache-size", type=int, default=10000, help="get_dplayer接口结果的进程内缓存条数")
+    parser.add_argument("--dplayer-ttl", type=int, default=0, metavar="SECONDS",
+                        help="get_dplayer接口结果的有效期(秒)，过期后重新请求接口(默认0，永不过期)")
+    parser.add_argument("--processes", type=int, default=0, metavar="N",
+                        help="分片模式: 按 分类×页码段 切分任务，用N个工作进程并行爬取（多台机器共用数据库时各自运行即可）")
+    parser.add_argument("--shard-pages", type=int, default=20, help="分片模式: 每个分片的页数")
+    parser.add_argument("--lease-seconds", type=int, default=300, help="分片模式: 分片租约有效期(秒)，进程崩溃后过期的分片会被重新领取")
+    parser.add_argument("--reset-shards", action="store_true", help="分片模式: 删除上一轮未完成的分片并重新规划(上一轮已全部完成时会自动重新规划)")
+    parser.add_argument("--retry-failed", action="store_true", help="只重试失败记录表中已到重试时间的URL")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="日志级别，DEBUG时输出每部影片和每个页面的处理详情")
+    parser.add_argument("--metrics-file", metavar="PATH", help="定期写入Prometheus文本格式的指标文件")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="定期追加JSON lines格式的指标快照")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="指标文件的写入间隔(秒)")
+    parser.add_argument("--trace-file", metavar="PATH", help="记录每部影片处理耗时的追踪文件(JSON lines)")
+    parser.add_argument("--base-url", help="站点地址(默认 https://m.dsq4d.com)，可指向fixture_server.py启动的本地替身站点")
     
     args = parser.parse_args()
     
+    if args.processes:
+        # 分片模式的工作进程使用多线程流水线，各分片按页码段并行爬取
+        if args.engine == "async":
+            parser.error("--processes 分片模式只支持 --engine requests")
+        if args.incremental:
+            parser.error("--incremental 需要从第1页开始顺序爬取，不能与 --processes 同时使用")
+    
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(message)s")
+    
+    if args.base_url:
+        global BASE_URL
+        BASE_URL = args.base_url.rstrip('/')
+    
+    try:
+        rate_limits = parse_rates(args.rate)
+        cache_ttls = parse_ttls(args.cache_ttl)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    http_cache = None
+    if args.cache or args.offline:
+        http_cache = HTTPCache(args.cache or "http_cache.db", max_bytes=args.cache_size_mb * 1024 * 1024,
+                               ttls=cache_ttls, offline=args.offline)
+        print(f"🗄️ HTTP缓存: {http_cache.path}{' (离线回放)' if args.offline else ''}")
+    
+    metrics = Metrics(trace_file=args.trace_file)
+    metrics.start_reporter(args.metrics_file, args.metrics_jsonl, args.metrics_interval)
+    
     print("🎬 DSQ4D高速爬虫启动中...")
-    print(f"⚙️ 配置: 并发数={args.workers}, 延迟={args.delay}s, 批量大小={args.batch_size}")
+    print(f"⚙️ 配置: 引擎={args.engine}, 并发数={args.workers}, 延迟={args.delay}s, 批量大小={args.batch_size}")
     
     crawler = OptimizedDSQ4DCrawler(
         test_mode=args.test,
         delay=args.delay,
         max_workers=args.workers,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        stream_play_pages=not args.no_stream,
+        stream_max_bytes=args.stream_max_kb * 1024,
+        rate_limits=rate_limits,
+        list_workers=args.list_workers,
+        play_workers=args.play_workers,
+        queue_size=args.queue_size,
+        commit_interval=args.commit_interval,
+        incremental=args.incremental,
+        http_cache=http_cache,
+        metrics=metrics,
+        parser=args.parser,
+        parse_processes=args.parse_processes,
+        dplayer_workers=args.dplayer_workers,
+        dplayer_cache_size=args.dplayer_cache_size,
+        dplayer_ttl=args.dplayer_ttl
     )
     
     try:
-        if args.category:
+        if args.retry_failed:
+            crawler.retry_failed()
+        elif args.processes:
+            from shard_coordinator import ShardCoordinator
+            # 限速按进程生效，总速率平均分给各工作进程
+            worker_config = {
+                'test_mode': args.test,
+                'max_workers': args.workers,
+                'stream_play_pages': not args.no_stream,
+                'stream_max_bytes': args.stream_max_kb * 1024,
+                'rate_limits': {kind: rate / args.processes for kind, rate in rate_limits.items()},
+                'list_workers': args.list_workers,
+                'play_workers': args.play_workers,
+                'queue_size': args.queue_size,
+                'parser': args.parser,
+                'parse_processes': args.parse_processes,
+                'dplayer_workers': args.dplayer_workers,
+                'dplayer_cache_size': args.dplayer_cache_size,
+                'dplayer_ttl': args.dplayer_ttl
+            }
+            cache_config = None
+            if http_cache:
+                cache_config = {'path': http_cache.path, 'max_bytes': http_cache.max_bytes,
+                                'ttls': http_cache.ttls, 'offline': http_cache.offline}
+            coordinator = ShardCoordinator(
+                crawler, BASE_URL, DB_FILE, args.processes, shard_pages=args.shard_pages, lease_seconds=args.lease_seconds,
+                crawler_config=worker_config, cache_config=cache_config
+            )
+            try:
+                if args.category:
+                    coordinator.run({args.category: CATEGORIES[args.category]}, reset=args.reset_shards,
+                                    start_page=args.page or 1)
+                else:
+                    coordinator.run(CATEGORIES, reset=args.reset_shards)
+            finally:
+                coordinator.close()
+        elif args.engine == "async":
+            from async_engine import AsyncCrawlEngine
+            engine = AsyncCrawlEngine(
+                crawler,
+                list_concurrency=args.list_concurrency,
+                detail_concurrency=args.detail_concurrency,
+                play_concurrency=args.play_concurrency
+            )
+            if args.category:
+                engine.run({args.category: CATEGORIES[args.category]}, args.page)
+            else:
+                print("🚀 开始高速爬取所有分类...")
+                engine.run(CATEGORIES)
+        elif args.category:
             crawler.crawl_category_optimized(args.category, args.page)
         else:
             crawler.crawl_all_optimized()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+class FixtureServer:
+    """本地替身站点：生成或回放列表页、详情页、播放页和get_dplayer接口，可注入延迟、错误和429限流"""
+    
+    def __init__(self, host='127.0.0.1', port=0, pages=5, titles_per_page=20, max_episodes=12,
+                 play_page_kb=40, latency=0.0, error_rate=0.0, throttle_rate=0.0, replay_db=None, seed=0):
+        """
+        pages / titles_per_page / max_episodes: 生成模式下每个分类的页数、每页影片数、单部影片的最大集数
+        play_page_kb: 生成的播放页在player_aaaa之后的填充大小，用于体现流式读取的效果
+        latency: 每个请求的平均延迟（秒），实际延迟在0.5~1.5倍之间随机
+        error_rate / throttle_rate: 返回500 / 429的概率
+        replay_db: http_cache.py录制的缓存文件，指定后按路径回放缓存中的响应
+        """
+        self.pages = pages
+        self.titles_per_page = titles_per_page
+        self.max_episodes = max_episodes
+        self.play_padding = 'x' * (play_page_kb * 1024)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        
+        self.replay = self._load_replay(replay_db) if replay_db else None
+        
+        self.httpd = _QuietHTTPServer((host, port), _FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fixture = self
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fixture-server", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def snapshot(self):
+        """返回当前的请求计数"""
+        with self.counts_lock:
+            return dict(self.counts)
+    
+    def count(self, key):
+        with self.counts_lock:
+            self.counts[key] += 1
+    
+    def _load_replay(self, path):
+        """读取录制的缓存，按 路径+查询参数 建立索引"""
+        conn = sqlite3.connect(path)
+        try:
+            responses = {}
+            for url, status, headers, body in conn.execute("SELECT url, status, headers, body FROM responses"):
+                parts = urlsplit(url)
+                key = parts.path + (f"?{parts.query}" if parts.query else '')
+                responses[key] = (status, json.loads(headers), zlib.decompress(body))
+            print(f"📼 回放模式: 已加载 {len(responses)} 个响应")
+            return responses
+        finally:
+            conn.close()
+    
+    def inject(self):
+        """按配置返回需要注入的状态码（500/429），不注入时返回None"""
+        with self.random_lock:
+            delay = self.latency * self.random.uniform(0.5, 1.5) if self.latency else 0
+            roll = self.random.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+    
+    def handle(self, path):
+        """返回 (状态码, Content-Type, 响应体)"""
+        if self.replay is not None:
+            status, headers, body = self.replay.get(path, (404, {}, b'not found'))
+            return status, headers.get('Content-Type', 'text/html; charset=utf-8'), body
+        return self._generate(path)
+    
+    def _generate(self, path):
+        parts = path.split('?')[0].strip('/').split('/')
+        head = parts[0] if parts else ''
+        
+        if head == 'list' and len(parts) == 2:
+            category, page = (int(x) for x in parts[1].replace('.html', '').split('-'))
+            return 200, 'text/html; charset=utf-8', self._list_page(category, page)
+        if head == 'mp4' and len(parts) == 2:
+            return 200, 'text/html; charset=utf-8', self._detail_page(int(parts[1].replace('.html', '')))
+        if head == 'play' and len(parts) == 2:
+            dyid, _, episode = parts[1].replace('.html', '').split('-')
+            return 200, 'text/html; charset=utf-8', self._play_page(int(dyid), int(episode))
+        if path.startswith('/index.php/get_dplayer'):
+            token = path.split('id=')[-1]
+            body = json.dumps({'code': 200, 'url': f"https://cdn.example.com/api/{token}/index.m3u8"})
+            return 200, 'application/json', body.encode()
+        return 404, 'text/plain', b'not found'
+    
+    def _episodes(self, dyid):
+        return dyid % self.max_episodes + 1
+    
+    def _list_page(self, category, page):
+        items = []
+        for index in range(self.titles_per_page):
+            dyid = category * 1000000 + page * 1000 + index
+            items.append(
+                f'<li><a href="/mp4/{dyid}.html" title="影片{dyid}">'
+                f'<span class="pic-text">更新至{self._episodes(dyid)}集</span></a></li>'
+            )
+        return (
+            f'<html><body><ul class="stui-vodlist">{"".join(items)}</ul>'
+            f'<ul class="page"><a href="/list/{category}-1.html">首页</a>'
+            f'<a href="/list/{category}-{self.pages}.html">尾页</a></ul></body></html>'
+        ).encode()
+    
+    def _detail_page(self, dyid):
+        episodes = ''.join(
+            f'<li><a href="/play/{dyid}-0-{i}.html">第{i + 1}集</a></li>'
+            for i in range(self._episodes(dyid))
+        )
+        return (
+            f'<html><head><meta name="description" content="剧情：影片{dyid}的简介"></head><body>'
+            f'<h1 class="title">影片{dyid}(2024)</h1>'
+            f'<p class="data"><a>剧情片</a><a>大陆</a><a>2024</a></p>'
+            f'<p class="data"><a>演员甲</a><a>演员乙</a></p>'
+            f'<p class="data"><a>导演丙</a></p>'
+            f'<ul class="stui-content__playlist">{episodes}<li><a>APP播放</a></li></ul>'
+            f'</body></html>'
+        ).encode()
+    
+    def _play_page(self, dyid, episode):
+        # 每3集中有1集需要经过get_dplayer接口
+        if episode % 3 == 1:
+            url = f"/index.php/get_dplayer?id={dyid}-{episode}"
+        else:
+            url = f"https://cdn.example.com/{dyid}/{episode}/index.m3u8"
+        config = {
+            'flag': 'play', 'encrypt': 0, 'url': url, 'from': 'dplayer',
+            'link_next': f"/play/{dyid}-0-{episode + 1}.html"
+        }
+        return (
+            f'<html><head><script>var player_aaaa={json.dumps(config)}</script></head>'
+            f'<body>{self.play_padding}</body></html>'
+        ).encode()
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 流式读取的客户端会提前断开连接，不输出异常堆栈
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        fixture = self.server.fixture
+        kind = self.path.strip('/').split('/')[0] or 'root'
+        if kind == 'index.php':
+            kind = 'api'
+        fixture.count(kind)
+        
+        injected = fixture.inject()
+        if injected:
+            fixture.count(str(injected))
+            self._send(injected, 'text/plain', b'injected', {'Retry-After': '1'} if injected == 429 else {})
+            return
+        
+        status, content_type, body = fixture.handle(self.path)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            fixture.count('304')
+            self._send(304, None, b'', {'ETag': etag})
+            return
+        self._send(status, content_type, body, {'ETag': etag} if status == 200 else {})
+    
+    def _send(self, status, content_type, body, headers):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 流式读取的客户端提前断开
+
+def main():
+    parser = argparse.ArgumentParser(description="DSQ4D本地替身站点（用于测试和基准测试）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--pages", type=int, default=5, help="每个分类的页数")
+    parser.add_argument("--titles-per-page", type=int, default=20, help="每页影片数")
+    parser.add_argument("--max-episodes", type=int, default=12, help="单部影片的最大集数")
+    parser.add_argument("--play-page-kb", type=int, default=40, help="播放页的填充大小(KB)")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的平均延迟(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--replay", metavar="CACHE_DB", help="回放http_cache.py录制的缓存文件")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+    
+    server = FixtureServer(
+        args.host, args.port, pages=args.pages, titles_per_page=args.titles_per_page,
+        max_episodes=args.max_episodes, play_page_kb=args.play_page_kb, latency=args.latency / 1000,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, replay_db=args.replay, seed=args.seed
+    )
+    print(f"🧪 替身站点已启动: {server.url}  (爬虫使用 --base-url {server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"📊 请求统计: {server.snapshot()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# 各类请求的默认缓存时间（秒），0表示不缓存
+DEFAULT_TTLS = {
+    'list': 600,
+    'detail': 7 * 24 * 3600,
+    'play': 0,
+    'api': 0
+}
+
+# 随缓存保存的响应头
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+CHARSET_RE = re.compile(r'charset=["\']?([\w.-]+)', re.I)
+
+class HTTPCache:
+    """基于SQLite的磁盘HTTP缓存：按URL保存响应体和ETag/Last-Modified，过期后条件请求重新验证，超出容量按LRU淘汰"""
+    
+    def __init__(self, path='http_cache.db', max_bytes=512 * 1024 * 1024, ttls=None, offline=False):
+        """
+        path: 缓存数据库文件
+        max_bytes: 缓存的最大容量（按压缩后的响应体计算）
+        ttls: {请求类型: 秒}，未配置的类型使用DEFAULT_TTLS
+        offline: 离线回放模式，只从缓存读取，不发送任何网络请求
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.offline = offline
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            status INTEGER,
+            headers TEXT,
+            body BLOB,
+            size INTEGER,
+            stored_time REAL,
+            access_time REAL
+        )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access_time ON responses (access_time)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    
+    def enabled_for(self, kind):
+        """该类型的请求是否使用缓存（离线模式下所有类型都从缓存读取）"""
+        return self.offline or self.ttls.get(kind, 0) > 0
+    
+    def lookup(self, url):
+        """查询缓存，返回 {status, headers, body, stored_time} 或None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, headers, body, stored_time FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                self.stats['misses'] += 1
+                return None
+            self.conn.execute("UPDATE responses SET access_time = ? WHERE url = ?", (time.time(), url))
+        
+        status, headers, body, stored_time = row
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+            'stored_time': stored_time
+        }
+    
+    def is_fresh(self, entry, kind):
+        """缓存是否仍在有效期内（无需重新验证）"""
+        if self.offline:
+            return True
+        return time.time() - entry['stored_time'] < self.ttls.get(kind, 0)
+    
+    def conditional_headers(self, entry):
+        """重新验证用的条件请求头"""
+        headers = {}
+        if not entry:
+            return headers
+        etag = entry['headers'].get('ETag')
+        last_modified = entry['headers'].get('Last-Modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+    
+    def hit(self, revalidated=False):
+        with self.lock:
+            self.stats['revalidated' if revalidated else 'hits'] += 1
+    
+    def refresh(self, url, headers):
+        """收到304后更新有效期和校验信息"""
+        with self.lock:
+            row = self.conn.execute("SELECT headers FROM responses WHERE url = ?", (url,)).fetchone()
+            if not row:
+                return
+            stored = json.loads(row[0])
+            for name in ('ETag', 'Last-Modified'):
+                if headers.get(name):
+                    stored[name] = headers[name]
+            now = time.time()
+            self.conn.execute(
+                "UPDATE responses SET headers = ?, stored_time = ?, access_time = ? WHERE url = ?",
+                (json.dumps(stored), now, now, url)
+            )
+    
+    def store(self, url, status, headers, body):
+        """保存响应，超出容量时淘汰最久未访问的记录"""
+        stored_headers = {name: headers[name] for name in STORED_HEADERS if headers.get(name)}
+        data = zlib.compress(body, 1)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, status, headers, body, size, stored_time, access_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, status, json.dumps(stored_headers), data, len(data), now, now)
+            )
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            self.stats['stored'] += 1
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        """按访问时间从旧到新淘汰，直到容量降到上限的90%"""
+        target = self.max_bytes * 0.9
+        cursor = self.conn.execute("SELECT url, size FROM responses ORDER BY access_time")
+        evicted = []
+        for url, size in cursor:
+            if self.total_bytes <= target:
+                break
+            evicted.append((url,))
+            self.total_bytes -= size
+        cursor.close()
+        self.conn.executemany("DELETE FROM responses WHERE url = ?", evicted)
+        self.stats['evicted'] += len(evicted)
+    
+    def response(self, url, entry):
+        """用缓存内容构造requests.Response，from_cache属性为True"""
+        return build_response(url, entry['status'], entry['headers'], entry['body'])
+    
+    def text(self, entry):
+        """按Content-Type中的字符集解码缓存内容，未声明时使用utf-8"""
+        match = CHARSET_RE.search(entry['headers'].get('Content-Type', ''))
+        return entry['body'].decode(match.group(1) if match else 'utf-8', errors='replace')
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def build_response(url, status, headers, body):
+    """构造一个内容已读取完毕的requests.Response，stream读取时直接从内容中切片"""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+def parse_ttls(specs):
+    """解析命令行的 KIND=SECONDS 配置，返回完整的缓存时间表"""
+    ttls = dict(DEFAULT_TTLS)
+    for spec in specs or []:
+        kind, sep, value = spec.partition('=')
+        if not sep or kind not in ttls:
+            raise ValueError(f"无效的缓存时间配置: {spec}（格式为 类型=秒，类型可选 {', '.join(ttls)}）")
+        ttls[kind] = float(value)
+    return ttls
@@ -3,18 +3,49 @@
 
 import sqlite3
 import os
+import re
 import sys
 
-def init_database():
-    """初始化数据库，创建必要的表"""
-    # 检查数据库文件是否存在
-    db_file = 'dy.db'
-    db_exists = os.path.exists(db_file)
-    
-    # 连接数据库
-    conn = sqlite3.connect(db_file)
+# 数据库文件
+DB_FILE = 'dy.db'
+
+# 当前数据库结构版本，新增迁移时同步修改
+SCHEMA_VERSION = 9
+
+# 连接参数（journal_mode=WAL会持久化到数据库文件，其余每个连接都需设置）
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -64000),       # 约64MB页缓存
+    ('mmap_size', 268435456),     # 256MB内存映射
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 30000),
+]
+
+def apply_pragmas(conn, read_only=False):
+    """为连接设置性能相关的pragma，只读连接跳过需要写权限的设置"""
+    for name, value in PRAGMAS:
+        if read_only and name in ('journal_mode', 'synchronous'):
+            continue
+        conn.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+
+def get_schema_version(conn):
+    """获取数据库结构版本，没有版本表时返回0"""
     cursor = conn.cursor()
-    
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'")
+        if not cursor.fetchone():
+            return 0
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        row = cursor.fetchone()
+        return row[0] or 0
+    finally:
+        cursor.close()
+
+def _migration_1(cursor):
+    """创建基础表"""
     # 创建影片信息表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS dy (
@@ -58,13 +89,328 @@ def init_database():
         update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     ''')
+
+def _migration_2(cursor):
+    """去重并添加唯一索引和常用查询索引"""
+    # 清理重复的m3u8记录（优先保留有链接的一条）
+    cursor.execute('''
+    DELETE FROM m3u8 WHERE id NOT IN (
+        SELECT COALESCE(MIN(CASE WHEN m3u8_url IS NOT NULL THEN id END), MIN(id))
+        FROM m3u8 GROUP BY dyid, episode
+    )
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_m3u8_dyid_episode ON m3u8 (dyid, episode)
+    ''')
+    
+    # 每个分类只保留最新的一条进度
+    cursor.execute('''
+    DELETE FROM crawl_progress WHERE id NOT IN (
+        SELECT MAX(id) FROM crawl_progress GROUP BY category
+    )
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_crawl_progress_category ON crawl_progress (category)
+    ''')
+    
+    # 按分类、地区、年份筛选影片
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_dy_type_year ON dy (type, year)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_dy_region ON dy (region)
+    ''')
+
+def _migration_3(cursor):
+    """记录列表页上每部影片最后一次看到的更新标记"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS title_badge (
+        dyid INTEGER PRIMARY KEY,
+        badge TEXT,
+        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _migration_4(cursor):
+    """记录请求失败的URL，供 --retry-failed 按退避时间重试"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_failures (
+        url TEXT PRIMARY KEY,
+        kind TEXT,
+        dyid INTEGER,
+        episode INTEGER,
+        attempts INTEGER DEFAULT 1,
+        last_error TEXT,
+        next_retry TIMESTAMP,
+        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_crawl_failures_next_retry ON crawl_failures (next_retry)
+    ''')
+
+def _migration_5(cursor):
+    """crawl_progress增加影片级断点：已完成页码位图、未完成页面中已完成的影片、处理中的影片"""
+    cursor.execute("ALTER TABLE crawl_progress ADD COLUMN pages_done BLOB")
+    cursor.execute("ALTER TABLE crawl_progress ADD COLUMN titles_done TEXT")
+    cursor.execute("ALTER TABLE crawl_progress ADD COLUMN inflight TEXT")
+
+def _migration_6(cursor):
+    """多进程/多机分片爬取的租约表：每个分片为一个分类的一段页码"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_shards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category INTEGER,
+        start_page INTEGER,
+        end_page INTEGER,
+        status TEXT DEFAULT 'pending',
+        owner TEXT,
+        lease_until TIMESTAMP,
+        attempts INTEGER DEFAULT 0,
+        titles INTEGER DEFAULT 0,
+        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (category, start_page)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_crawl_shards_status ON crawl_shards (status, lease_until)
+    ''')
+
+def _migration_7(cursor):
+    """get_dplayer接口的解析结果，按接口路径缓存"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dplayer_cache (
+        key TEXT PRIMARY KEY,
+        m3u8_url TEXT NOT NULL,
+        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _migration_8(cursor):
+    """影片全文索引：FTS5外部内容表（trigram分词，适合中文子串搜索），由触发器与dy表保持同步"""
+    create_search_index(cursor)
+
+def create_search_index(cursor, warn=True):
+    """创建dy_fts、同步触发器并按dy表建立索引；SQLite不支持trigram分词时跳过并返回False"""
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS dy_fts USING fts5(
+            name, description, actors, directors,
+            content='dy', content_rowid='id', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite低于3.34或未编译FTS5时没有trigram分词器，搜索退回LIKE；升级SQLite后由ensure_search_index补建
+        if warn:
+            print(f"⚠️ 当前SQLite ({sqlite3.sqlite_version}) 不支持FTS5 trigram分词，跳过全文索引: {e}")
+        return False
+    
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS dy_fts_insert AFTER INSERT ON dy BEGIN
+        INSERT INTO dy_fts (rowid, name, description, actors, directors)
+        VALUES (new.id, new.name, new.description, new.actors, new.directors);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS dy_fts_delete AFTER DELETE ON dy BEGIN
+        INSERT INTO dy_fts (dy_fts, rowid, name, description, actors, directors)
+        VALUES ('delete', old.id, old.name, old.description, old.actors, old.directors);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS dy_fts_update AFTER UPDATE OF name, description, actors, directors ON dy BEGIN
+        INSERT INTO dy_fts (dy_fts, rowid, name, description, actors, directors)
+        VALUES ('delete', old.id, old.name, old.description, old.actors, old.directors);
+        INSERT INTO dy_fts (rowid, name, description, actors, directors)
+        VALUES (new.id, new.name, new.description, new.actors, new.directors);
+    END
+    ''')
+    
+    # 为已有数据建立索引
+    cursor.execute("INSERT INTO dy_fts (dy_fts) VALUES ('rebuild')")
+    return True
+
+def ensure_search_index(conn, warn=False):
+    """迁移8因SQLite不支持trigram而跳过时补建全文索引，返回是否新建了索引"""
+    if get_schema_version(conn) < 8:
+        return False  # 尚未执行到迁移8，由迁移创建
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dy_fts'").fetchone():
+        return False
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        created = create_search_index(cursor, warn)
+        conn.commit()
+        return created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def _migration_9(cursor):
+    """人员、分面维度表和关联表，并按已有影片回填"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS person (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS title_person (
+        dyid INTEGER NOT NULL,
+        person_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        position INTEGER,
+        PRIMARY KEY (dyid, role, person_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_title_person_person ON title_person (person_id, role, dyid)
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS facet (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        UNIQUE (kind, value)
+    )
+    ''')
+    # 分类、地区、年份每部影片只有一个取值，每部影片一行，分面统计只需扫描整数索引
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS title_facet (
+        dyid INTEGER PRIMARY KEY,
+        type_id INTEGER,
+        region_id INTEGER,
+        year_id INTEGER
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_title_facet_type_year ON title_facet (type_id, year_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_title_facet_region_year ON title_facet (region_id, year_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_title_facet_year ON title_facet (year_id, region_id)
+    ''')
+    
+    # 按已有影片回填。拆分规则固定为版本9时的规则（不引用dimensions模块），以后修改拆分规则不会改变旧库的迁移结果
+    separator = re.compile(r'\s*[,，、/]\s*')
+    unknown = "未知"
+    
+    def split_names(text):
+        names = []
+        for name in separator.split(text.strip()) if text else []:
+            if name and name != unknown and name not in names:
+                names.append(name)
+        return names
+    
+    def facet_value(value):
+        value = (value or '').strip()
+        return value if value and value != unknown else None
+    
+    # 分批回填，避免一次读入全部影片
+    rows = cursor.connection.execute("SELECT dyid, type, region, year, actors, directors FROM dy")
+    while True:
+        batch = rows.fetchmany(1000)
+        if not batch:
+            break
+        credits = []
+        facets = []
+        for dyid, type_, region, year, actors, directors in batch:
+            for role, text in (('actor', actors), ('director', directors)):
+                for position, name in enumerate(split_names(text)):
+                    credits.append((dyid, role, position, name))
+            facets.append((dyid, facet_value(type_), facet_value(region), facet_value(year)))
+        
+        cursor.executemany("INSERT OR IGNORE INTO person (name) VALUES (?)", [(name,) for *_, name in credits])
+        cursor.executemany(
+            "INSERT OR IGNORE INTO title_person (dyid, person_id, role, position) "
+            "SELECT ?, id, ?, ? FROM person WHERE name = ?", credits
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO facet (kind, value) VALUES (?, ?)",
+            {(kind, value) for _, *values in facets for kind, value in zip(('type', 'region', 'year'), values) if value}
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO title_facet (dyid, type_id, region_id, year_id) VALUES (?, "
+            "(SELECT id FROM facet WHERE kind = 'type' AND value = ?), "
+            "(SELECT id FROM facet WHERE kind = 'region' AND value = ?), "
+            "(SELECT id FROM facet WHERE kind = 'year' AND value = ?))", facets
+        )
+
+# 迁移列表：(版本号, 说明, 迁移函数)，按版本号升序执行
+MIGRATIONS = [
+    (1, "创建基础表", _migration_1),
+    (2, "m3u8(dyid, episode)与crawl_progress(category)唯一索引", _migration_2),
+    (3, "列表页更新标记表title_badge", _migration_3),
+    (4, "失败记录表crawl_failures", _migration_4),
+    (5, "crawl_progress影片级断点字段", _migration_5),
+    (6, "分片租约表crawl_shards", _migration_6),
+    (7, "get_dplayer接口结果缓存表dplayer_cache", _migration_7),
+    (8, "影片全文索引dy_fts", _migration_8),
+    (9, "人员与分面维度表person/title_person/facet/title_facet", _migration_9),
+]
+
+def migrate(conn):
+    """执行所有未应用的迁移，返回 (原版本, 新版本)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        conn.commit()
+        
+        old_version = get_schema_version(conn)
+        for version, description, migration in MIGRATIONS:
+            if version <= old_version:
+                continue
+            try:
+                # sqlite3模块不会为DDL隐式开启事务，显式BEGIN使结构变更与版本记录一起提交或回滚
+                cursor.execute("BEGIN")
+                migration(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                               (version, description))
+                conn.commit()
+                print(f"已应用迁移 {version}: {description}")
+            except Exception:
+                conn.rollback()
+                raise
+        
+        return old_version, get_schema_version(conn)
+    finally:
+        cursor.close()
+
+def init_database(db_file=DB_FILE):
+    """初始化数据库，创建必要的表并升级到最新结构"""
+    # 检查数据库文件是否存在
+    db_exists = os.path.exists(db_file)
+    
+    # 连接数据库
+    conn = sqlite3.connect(db_file)
+    apply_pragmas(conn)
+    
+    try:
+        old_version, new_version = migrate(conn)
+        if ensure_search_index(conn):
+            print("已补建全文索引dy_fts")
+    except Exception as e:
+        print(f"数据库迁移失败: {e}")
+        conn.close()
+        sys.exit(1)
     
-    # 提交更改
-    conn.commit()
     conn.close()
     
     print(f"数据库{'已存在' if db_exists else '已创建'}")
-    print("所有表已创建/更新")
+    if old_version == new_version:
+        print(f"数据库结构已是最新版本 (v{new_version})")
+    else:
+        print(f"数据库结构已从 v{old_version} 升级到 v{new_version}")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+
+class KnownStateIndex:
+    """已入库状态的内存索引：dyid -> 影片名称、已有m3u8链接的集数位图、列表页更新标记（查询无需加锁）"""
+    
+    def __init__(self):
+        self.names = {}
+        self.episodes = {}  # 位图第i位表示第i+1集已有链接
+        self.badges = {}
+        self.lock = threading.Lock()  # 只在更新时使用
+    
+    def load(self, conn, fetch_size=10000):
+        """从数据库加载全部影片和已有链接的集数"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT dyid, name FROM dy")
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for dyid, name in rows:
+                    self.names[dyid] = name
+            
+            cursor.execute("SELECT dyid, episode FROM m3u8 WHERE m3u8_url IS NOT NULL ORDER BY dyid")
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for dyid, episode in rows:
+                    self._set_episode(dyid, episode)
+            
+            cursor.execute("SELECT dyid, badge FROM title_badge")
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for dyid, badge in rows:
+                    self.badges[dyid] = badge
+        finally:
+            cursor.close()
+    
+    def has_title(self, dyid):
+        return dyid in self.names
+    
+    def name(self, dyid):
+        return self.names.get(dyid)
+    
+    def badge(self, dyid):
+        return self.badges.get(dyid)
+    
+    def has_episode(self, dyid, episode):
+        bitmap = self.episodes.get(dyid)
+        if not bitmap or episode < 1:
+            return False
+        index = episode - 1
+        return (index >> 3) < len(bitmap) and bool(bitmap[index >> 3] & (1 << (index & 7)))
+    
+    def missing_episodes(self, dyid, total_episodes):
+        """返回1..total_episodes中还没有链接的集数"""
+        bitmap = self.episodes.get(dyid)
+        if not bitmap:
+            return list(range(1, total_episodes + 1))
+        return [
+            episode for episode in range(1, total_episodes + 1)
+            if not self.has_episode(dyid, episode)
+        ]
+    
+    def on_commit(self, batch):
+        """写库线程的提交回调，保持索引与数据库一致"""
+        with self.lock:
+            for movie in batch['movies']:
+                self.names[movie['dyid']] = movie['name']
+            for m3u8 in batch['m3u8s']:
+                if m3u8.get('m3u8_url'):
+                    self._set_episode(m3u8['dyid'], m3u8['episode'])
+            self.badges.update(batch['badges'])
+    
+    def _set_episode(self, dyid, episode):
+        if episode is None or episode < 1:
+            return
+        index = episode - 1
+        bitmap = self.episodes.get(dyid)
+        if bitmap is None:
+            bitmap = self.episodes[dyid] = bytearray((index >> 3) + 1)
+        elif (index >> 3) >= len(bitmap):
+            bitmap.extend(bytes((index >> 3) + 1 - len(bitmap)))
+        bitmap[index >> 3] |= 1 << (index & 7)
+    
+    def episode_count(self):
+        """已有链接的总集数"""
+        return sum(bin(int.from_bytes(bitmap, 'little')).count('1') for bitmap in self.episodes.values())
+    
+    def memory_usage(self):
+        """估算索引占用的内存（字节），包括字典、键、名称字符串和位图"""
+        size = sys.getsizeof(self.names) + sys.getsizeof(self.episodes)
+        for dyid, name in self.names.items():
+            size += sys.getsizeof(dyid) + sys.getsizeof(name)
+        for bitmap in self.episodes.values():
+            size += sys.getsizeof(bitmap)
+        size += sys.getsizeof(self.badges)
+        for badge in self.badges.values():
+            size += sys.getsizeof(badge)
+        return size
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import base64
+import codecs
+import threading
+from collections import Counter
+from urllib.parse import unquote
+
+# 预编译的正则表达式（避免每集重复编译）
+PLAYER_ASSIGN_RE = re.compile(r'player_aaaa\s*=\s*\{')
+BRACE_TOKEN_RE = re.compile(r'[{}"\'\\]')
+JS_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'((?:[^\'\\]|\\.)*)\'|([{,]\s*)([A-Za-z_$][\w$]*)(\s*:)', re.DOTALL)
+BASE64_RE = re.compile(r'^[A-Za-z0-9+/=]+$')
+M3U8_RE = re.compile(r'(https?://[^\s\'"`,]+\.m3u8)')
+
+# player_aaaa对象的最大长度，超过则认为页面异常
+MAX_PLAYER_CONFIG_SIZE = 64 * 1024
+
+# 播放页流式读取的分块大小
+STREAM_CHUNK_SIZE = 8 * 1024
+
+def find_object_end(text, start):
+    """从start处的'{'开始做括号配对（跳过字符串），返回对象结束后的位置，未闭合返回None"""
+    depth = 0
+    quote = None
+    pos = start
+    limit = min(len(text), start + MAX_PLAYER_CONFIG_SIZE)
+    while pos < limit:
+        match = BRACE_TOKEN_RE.search(text, pos, limit)
+        if not match:
+            return None
+        char = match.group(0)
+        pos = match.end()
+        if char == '\\':
+            # 跳过被转义的字符
+            pos += 1
+        elif quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+    return None
+
+def _js_object_to_json(text):
+    """把单引号字符串、未加引号键名的JS对象字面量转换为JSON"""
+    def convert(match):
+        if match.group(3):
+            return f'{match.group(2)}"{match.group(3)}"{match.group(4)}'
+        if match.group(1) is not None:
+            value = re.sub(r"\\(.)", r"\1", match.group(1))
+            return json.dumps(value, ensure_ascii=False)
+        return match.group(0)
+    return JS_TOKEN_RE.sub(convert, text)
+
+def decode_player_config(text):
+    """将player_aaaa对象文本解码为字典，失败返回None"""
+    try:
+        config = json.loads(text)
+    except ValueError:
+        try:
+            config = json.loads(_js_object_to_json(text))
+        except ValueError:
+            return None
+    return config if isinstance(config, dict) else None
+
+def extract_player_config(content):
+    """在页面中定位player_aaaa赋值并解析出完整对象，找不到返回None"""
+    match = PLAYER_ASSIGN_RE.search(content)
+    if not match:
+        return None
+    start = match.end() - 1
+    end = find_object_end(content, start)
+    if end is None:
+        return None
+    return decode_player_config(content[start:end])
+
+def player_config_url(config):
+    """按encrypt字段还原player_aaaa中的播放地址"""
+    url = config.get('url')
+    if not url or not isinstance(url, str):
+        return None
+    encrypt = str(config.get('encrypt', '0'))
+    try:
+        if encrypt == '1':
+            url = unquote(url)
+        elif encrypt == '2':
+            url = unquote(base64.b64decode(url).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return url
+
+class PlayerConfigScanner:
+    """增量扫描播放页字节流，player_aaaa解析完成后即可停止读取"""
+    
+    def __init__(self, encoding='utf-8'):
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.text = ''
+        self.search_pos = 0
+        self.start = None
+        self.config = None
+    
+    def feed(self, chunk):
+        """喂入一段字节，解析完成时返回player_aaaa字典，否则返回None"""
+        if self.config is not None:
+            return self.config
+        self.text += self.decoder.decode(chunk)
+        
+        if self.start is None:
+            # 标记可能被分块截断，从上一块末尾附近继续查找
+            match = PLAYER_ASSIGN_RE.search(self.text, self.search_pos)
+            if not match:
+                self.search_pos = max(0, len(self.text) - 64)
+                return None
+            self.start = match.end() - 1
+        
+        end = find_object_end(self.text, self.start)
+        if end is not None:
+            self.config = decode_player_config(self.text[self.start:end]) or {}
+        elif len(self.text) - self.start > MAX_PLAYER_CONFIG_SIZE:
+            self.config = {}
+        return self.config
+
+class DPlayerError(Exception):
+    """get_dplayer接口请求失败，异常信息为失败原因；经由DPlayerCache的线程池时随结果一起传回等待的线程"""
+
+class M3U8Resolver:
+    """播放页m3u8解析器，按顺序尝试各个解析策略"""
+    
+    # 默认策略顺序：开销最小的放在最前
+    DEFAULT_STRATEGIES = ('player_json', 'get_dplayer', 'base64', 'direct_regex')
+    
+    def __init__(self, fetch, base_url, strategies=None, api_cache=None, last_error=None):
+        """
+        fetch: 发送GET请求的函数，签名为 fetch(url, timeout=...)，失败返回None
+        last_error: 返回当前线程最近一次fetch失败原因的函数，get_dplayer接口请求失败时作为错误信息
+        base_url: 站点根地址，用于拼接get_dplayer接口地址
+        strategies: 策略名称或 (名称, 函数) 的列表，函数签名为 func(page) -> m3u8_url
+        api_cache: DPlayerCache实例，get_dplayer接口的结果经其缓存和合并，为None时每次都请求接口
+        """
+        self.fetch = fetch
+        self.last_error = last_error
+        self.base_url = base_url
+        self.api_cache = api_cache
+        self.strategies = []
+        for strategy in strategies or self.DEFAULT_STRATEGIES:
+            self.add_strategy(strategy)
+        
+        self.hits = Counter()
+        self.hits_lock = threading.Lock()
+    
+    def add_strategy(self, strategy, position=None):
+        """注册解析策略，position为None时追加到末尾"""
+        if isinstance(strategy, str):
+            name, func = strategy, getattr(self, f"_strategy_{strategy}")
+        else:
+            name, func = strategy
+        entry = (name, func)
+        if position is None:
+            self.strategies.append(entry)
+        else:
+            self.strategies.insert(position, entry)
+    
+    def resolve(self, content):
+        """解析播放页内容，返回 (m3u8_url, 命中的策略名称)"""
+        result = self.resolve_page(content)
+        return result['m3u8_url'], result['strategy']
+    
+    def resolve_page(self, content, player=None):
+        """解析播放页内容，返回m3u8链接、命中的策略和player_aaaa的全部字段"""
+        page = {'content': content}
+        if player is not None:
+            page['player'] = player
+        
+        m3u8_url = strategy = error = None
+        for name, func in self.strategies:
+            try:
+                m3u8_url = func(page)
+            except DPlayerError as e:
+                m3u8_url, error = None, str(e)
+            except Exception:
+                m3u8_url = None
+            if m3u8_url:
+                strategy = name
+                break
+        return self._page_result(page, m3u8_url, strategy, error)
+    
+    async def resolve_page_async(self, content, fetch_json, player=None):
+        """resolve_page的异步版本，get_dplayer接口通过 await fetch_json(url) 请求"""
+        page = {'content': content}
+        if player is not None:
+            page['player'] = player
+        
+        m3u8_url = strategy = error = None
+        for name, func in self.strategies:
+            try:
+                if name == 'get_dplayer':
+                    api_url = self._dplayer_api_url(page)
+                    m3u8_url = await self._dplayer_async(api_url, fetch_json) if api_url else None
+                else:
+                    m3u8_url = func(page)
+            except DPlayerError as e:
+                m3u8_url, error = None, str(e)
+            except Exception:
+                m3u8_url = None
+            if m3u8_url:
+                strategy = name
+                break
+        return self._page_result(page, m3u8_url, strategy, error)
+    
+    def _page_result(self, page, m3u8_url, strategy, error=None):
+        """error: 未解析到链接时get_dplayer接口的失败原因"""
+        self._record_hit(strategy or 'miss')
+        result = {
+            'm3u8_url': m3u8_url,
+            'strategy': strategy,
+            'player': self._player_config(page)
+        }
+        if not m3u8_url and error:
+            result['error'] = error
+        return result
+    
+    def hit_counts(self):
+        """获取各策略的命中次数"""
+        with self.hits_lock:
+            return dict(self.hits)
+    
+    def merge_hits(self, counts):
+        """累加其他进程的策略命中次数"""
+        with self.hits_lock:
+            self.hits.update(counts)
+    
+    def _record_hit(self, name):
+        with self.hits_lock:
+            self.hits[name] += 1
+    
+    def _player_config(self, page):
+        """解析player_aaaa对象（每页只解析一次）"""
+        if 'player' not in page:
+            page['player'] = extract_player_config(page['content']) or {}
+        return page['player']
+    
+    def _player_url(self, page):
+        """提取player_aaaa中的url字段（每页只提取一次）"""
+        if 'player_url' not in page:
+            page['player_url'] = player_config_url(self._player_config(page))
+        return page['player_url']
+    
+    def _strategy_player_json(self, page):
+        """player_aaaa中直接给出了播放地址"""
+        url = self._player_url(page)
+        if url and url.startswith('http') and "get_dplayer" not in url:
+            return url
+        return None
+    
+    def _strategy_get_dplayer(self, page):
+        """player_aaaa中的地址需要调用get_dplayer接口解密"""
+        api_url = self._dplayer_api_url(page)
+        if not api_url:
+            return None
+        
+        def call():
+            # 启用缓存时在DPlayerCache的线程中执行，失败原因需在该线程中取出并随异常传回
+            api_response = self.fetch(api_url, timeout=3)
+            if not api_response:
+                raise DPlayerError((self.last_error and self.last_error()) or "get_dplayer接口请求失败")
+            return self._parse_dplayer_data(api_response.json())
+        
+        if self.api_cache:
+            return self.api_cache.get(api_url, call)
+        return call()
+    
+    async def _dplayer_async(self, api_url, fetch_json):
+        async def call():
+            return self._parse_dplayer_data(await fetch_json(api_url))
+        
+        if self.api_cache:
+            return await self.api_cache.get_async(api_url, call)
+        return await call()
+    
+    def _dplayer_api_url(self, page):
+        """需要调用get_dplayer接口时返回接口地址，否则返回None"""
+        url = self._player_url(page)
+        if not url or "get_dplayer" not in url:
+            return None
+        return f"{self.base_url}{url}"
+    
+    def _parse_dplayer_data(self, api_data):
+        """从get_dplayer接口返回的数据中取出m3u8链接"""
+        if api_data and api_data.get('code') == 200 and api_data.get('url'):
+            return api_data['url']
+        return None
+    
+    def _strategy_base64(self, page):
+        """player_aaaa中的地址经过base64编码"""
+        url = self._player_url(page)
+        if not url or len(url) <= 20 or not BASE64_RE.match(url):
+            return None
+        
+        decoded_url = base64.b64decode(url).decode('utf-8')
+        if decoded_url.startswith('http'):
+            return decoded_url
+        return None
+    
+    def _strategy_direct_regex(self, page):
+        """直接在页面中查找m3u8链接"""
+        m3u8_match = M3U8_RE.search(page['content'])
+        if m3u8_match:
+            return m3u8_match.group(1)
+        return None
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 延迟直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 批量写库行数的分桶
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+class Histogram:
+    """固定分桶的直方图，记录每个桶的计数、总和与总数"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def quantile(self, q):
+        """按分桶估算分位数（桶内线性插值）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class Metrics:
+    """进程内的指标注册表：计数器、直方图、仪表盘，支持Prometheus文本格式、JSON lines和单部影片的追踪记录"""
+    
+    def __init__(self, prefix='dsq4d', trace_file=None):
+        """
+        prefix: 指标名前缀
+        trace_file: 追踪记录文件（JSON lines），为None时不记录追踪
+        """
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        
+        self.trace = open(trace_file, 'a', encoding='utf-8') if trace_file else None
+        self.trace_lock = threading.Lock()
+        
+        self.reporter = None
+        self.reporter_stop = threading.Event()
+    
+    def _key(self, name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+    
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+    
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+    
+    def histogram(self, name, **labels):
+        """返回直方图的副本，不存在时返回None"""
+        with self.lock:
+            histogram = self.histograms.get(self._key(name, labels))
+            if histogram is None:
+                return None
+            copy = Histogram(histogram.buckets)
+            copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+            return copy
+    
+    def export(self):
+        """导出计数器和直方图的原始值（可序列化），用于从工作进程汇总到协调进程"""
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+            }
+    
+    def merge(self, exported):
+        """合并export()导出的指标：计数器累加，直方图按桶相加；仪表盘是各进程的瞬时值，不合并"""
+        with self.lock:
+            for key, value in exported['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in exported['histograms'].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                if histogram.buckets != tuple(buckets):
+                    continue  # 分桶不同无法合并
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+    
+    def record_span(self, name, start, end=None, **labels):
+        """记录一段耗时：写入 name_seconds 直方图，启用追踪时追加一条追踪记录。start/end为time.time()时间戳"""
+        end = end or time.time()
+        self.observe(f"{name}_seconds", end - start)
+        if self.trace:
+            line = json.dumps({'span': name, 'start': round(start, 6), 'duration_ms': round((end - start) * 1000, 3),
+                               **labels}, ensure_ascii=False)
+            with self.trace_lock:
+                self.trace.write(line + '\n')
+    
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_span(name, start, **labels)
+    
+    def snapshot(self):
+        """返回所有指标的当前值，用于JSON输出"""
+        def label_key(name, labels):
+            return name + ('{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else '')
+        
+        with self.lock:
+            return {
+                'counters': {label_key(*key): value for key, value in self.counters.items()},
+                'gauges': {label_key(*key): value for key, value in self.gauges.items()},
+                'histograms': {
+                    label_key(*key): {
+                        'count': h.count,
+                        'sum': round(h.sum, 6),
+                        'p50': round(h.quantile(0.5), 6),
+                        'p99': round(h.quantile(0.99), 6)
+                    }
+                    for key, h in self.histograms.items()
+                }
+            }
+    
+    def prometheus(self):
+        """Prometheus文本格式"""
+        def labels_text(labels, extra=None):
+            pairs = list(labels) + (extra or [])
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+        
+        lines = []
+        with self.lock:
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    full_name = f"{self.prefix}_{name}"
+                    if full_name not in typed:
+                        lines.append(f"# TYPE {full_name} {kind}")
+                        typed.add(full_name)
+                    lines.append(f"{full_name}{labels_text(labels)} {value}")
+            
+            typed = set()
+            for (name, labels), h in sorted(self.histograms.items()):
+                full_name = f"{self.prefix}_{name}"
+                if full_name not in typed:
+                    lines.append(f"# TYPE {full_name} histogram")
+                    typed.add(full_name)
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_sum{labels_text(labels)} {h.sum}")
+                lines.append(f"{full_name}_count{labels_text(labels)} {h.count}")
+        return '\n'.join(lines) + '\n'
+    
+    def write_prometheus(self, path):
+        """原子地写入Prometheus文本文件（可供node_exporter的textfile收集器读取）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+    
+    def write_jsonl(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': round(time.time(), 3), **self.snapshot()}, ensure_ascii=False) + '\n')
+    
+    def start_reporter(self, prometheus_file=None, jsonl_file=None, interval=10.0):
+        """启动后台线程，定期写入Prometheus文本文件和/或JSON lines文件"""
+        if not (prometheus_file or jsonl_file):
+            return
+        
+        def report():
+            if prometheus_file:
+                self.write_prometheus(prometheus_file)
+            if jsonl_file:
+                self.write_jsonl(jsonl_file)
+        
+        def run():
+            while not self.reporter_stop.wait(interval):
+                report()
+            report()  # 结束时再写一次最终结果
+        
+        self.reporter = threading.Thread(target=run, name="metrics-reporter", daemon=True)
+        self.reporter.start()
+    
+    def close(self):
+        if self.reporter:
+            self.reporter_stop.set()
+            self.reporter.join()
+            self.reporter = None
+        if self.trace:
+            with self.trace_lock:
+                self.trace.close()
+                self.trace = None
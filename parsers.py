@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+
+# 列表页上影片的更新标记（如"更新至12集"、"HD"），不同模板的class不同
+LIST_BADGE_SELECTOR = '.pic-text, [class*="remarks"], [class*="note"]'
+
+DETAIL_URL_RE = re.compile(r'/mp4/(\d+)\.html')
+LAST_PAGE_RE = re.compile(r'/list/\d+-(\d+)\.html')
+DESCRIPTION_RE = re.compile(r'剧情[:：](.+)')
+
+def extract_dyid(url):
+    """从详情页URL中提取dyid，失败返回None"""
+    match = DETAIL_URL_RE.search(url)
+    return int(match.group(1)) if match else None
+
+def to_text(html, encoding=None):
+    """解析进程收到的是原始字节，在这里按响应的编码解码"""
+    if isinstance(html, bytes):
+        return html.decode(encoding or 'utf-8', errors='replace')
+    return html
+
+def build_total_pages(last_href, page_texts):
+    """优先使用尾页链接中的页码，否则取页码链接中的最大值"""
+    if last_href:
+        match = LAST_PAGE_RE.search(last_href)
+        if match:
+            return int(match.group(1))
+    
+    max_page = 0
+    for text in page_texts:
+        if text.isdigit():
+            max_page = max(max_page, int(text))
+    return max_page if max_page > 0 else 1
+
+def build_episodes(playlist, dyid, base_url):
+    """[(标题, href)] -> 播放列表（集数从1开始，跳过"APP播放"）"""
+    episodes = []
+    for title, href in playlist:
+        if title == "APP播放":
+            continue
+        episode_number = len(episodes) + 1
+        if href.startswith('/play/'):
+            play_url = f"{base_url}{href}"
+        else:
+            play_url = f"{base_url}/play/{dyid}-0-{episode_number - 1}.html"
+        episodes.append({
+            'episode': episode_number,
+            'title': title,
+            'play_url': play_url
+        })
+    return episodes
+
+def build_detail(url, dyid, title, data_groups, desc_texts, meta_desc, playlist, base_url):
+    """把各解析后端提取的原始字段组装为 {movie, episode_count, episodes}"""
+    name = title.split('(')[0].strip() if title is not None else "未知"
+    
+    type_text = region_text = year_text = actors_text = directors_text = "未知"
+    # 类型、地区、年份
+    if len(data_groups) > 0 and data_groups[0]:
+        type_text = data_groups[0][0]
+        if len(data_groups[0]) > 1:
+            region_text = data_groups[0][1]
+        if len(data_groups[0]) > 2:
+            year_text = data_groups[0][2]
+    # 演员
+    if len(data_groups) > 1 and data_groups[1]:
+        actors_text = ", ".join(data_groups[1])
+    # 导演
+    if len(data_groups) > 2 and data_groups[2]:
+        directors_text = ", ".join(data_groups[2])
+    
+    description = "暂无简介"
+    if len(desc_texts) > 1:
+        description = desc_texts[1]
+    if description == "暂无简介" and meta_desc is not None:
+        match = DESCRIPTION_RE.search(meta_desc)
+        description = match.group(1).strip() if match else meta_desc.strip()
+    
+    movie = {
+        'dyid': dyid,
+        'name': name,
+        'type': type_text,
+        'region': region_text,
+        'year': year_text,
+        'actors': actors_text,
+        'directors': directors_text,
+        'description': description,
+        'url': url
+    }
+    
+    episodes = build_episodes(playlist, dyid, base_url)
+    return {
+        'movie': movie,
+        'episode_count': max(len(episodes), 1),
+        'episodes': episodes
+    }
+
+class SoupParser:
+    """BeautifulSoup + CSS选择器（原有实现）"""
+    
+    name = 'bs4'
+    
+    def __init__(self, base_url):
+        self.base_url = base_url
+    
+    def _soup(self, html, encoding):
+        return BeautifulSoup(to_text(html, encoding), 'lxml')
+    
+    def total_pages(self, html, encoding=None):
+        soup = self._soup(html, encoding)
+        last_page_link = soup.select_one('a:-soup-contains("尾页")')
+        last_href = str(last_page_link['href']) if last_page_link and 'href' in last_page_link.attrs else None
+        return build_total_pages(last_href, [link.get_text(strip=True) for link in soup.select('ul.page a')])
+    
+    def list_entries(self, html, encoding=None):
+        soup = self._soup(html, encoding)
+        entries = {}
+        vodlist_ul = soup.select_one('ul.list_mov') or soup.select_one('ul[class*="-vodlist"]')
+        if vodlist_ul:
+            for item in vodlist_ul.select('li'):
+                link = item.select_one('a[href^="/mp4/"]')
+                if not link:
+                    continue
+                full_url = f"{self.base_url}{link['href']}"
+                dyid = extract_dyid(full_url)
+                if dyid is None or full_url in entries:
+                    continue
+                badge_tag = item.select_one(LIST_BADGE_SELECTOR)
+                badge = badge_tag.get_text(strip=True) if badge_tag else ''
+                entries[full_url] = {'dyid': dyid, 'url': full_url, 'badge': badge}
+        return list(entries.values())
+    
+    def detail(self, html, url, encoding=None):
+        dyid = extract_dyid(url)
+        if dyid is None:
+            return None
+        soup = self._soup(html, encoding)
+        
+        title_elem = soup.select_one('h1.title')
+        meta_desc = soup.select_one('meta[name="description"]')
+        return build_detail(
+            url, dyid,
+            title_elem.get_text(strip=True) if title_elem else None,
+            [[a.get_text(strip=True) for a in p.select('a')] for p in soup.select('p.data')[:3]],
+            [div.get_text(strip=True) for div in soup.select('div[class*="-content__desc"]')],
+            str(meta_desc['content']) if meta_desc and 'content' in meta_desc.attrs else None,
+            self._playlist(soup),
+            self.base_url
+        )
+    
+    def episode_count(self, html, encoding=None):
+        return max(sum(1 for title, _ in self._playlist(self._soup(html, encoding)) if title != "APP播放"), 1)
+    
+    def _playlist(self, soup):
+        playlist_ul = soup.select_one('ul[class*="-content__playlist"]')
+        if not playlist_ul:
+            return []
+        return [(item.get_text(strip=True), str(item.get('href', ''))) for item in playlist_ul.select('li a')]
+
+def _has_class(name):
+    """XPath：class属性中包含完整的类名（等价于CSS的 .name）"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+class LxmlParser:
+    """lxml.html + 预编译XPath，不构建BeautifulSoup对象树，速度约为bs4的数倍"""
+    
+    name = 'lxml'
+    
+    LAST_PAGE = etree.XPath('//a[contains(., "尾页")]')
+    PAGE_LINKS = etree.XPath(f'//ul[{_has_class("page")}]//a')
+    VODLIST = etree.XPath(f'//ul[{_has_class("list_mov")}] | //ul[contains(@class, "-vodlist")]')
+    LIST_ITEMS = etree.XPath('.//li')
+    DETAIL_LINK = etree.XPath('.//a[starts-with(@href, "/mp4/")]')
+    BADGE = etree.XPath(
+        f'.//*[{_has_class("pic-text")} or contains(@class, "remarks") or contains(@class, "note")]'
+    )
+    TITLE = etree.XPath(f'//h1[{_has_class("title")}]')
+    DATA = etree.XPath(f'//p[{_has_class("data")}]')
+    LINKS = etree.XPath('.//a')
+    DESC = etree.XPath('//div[contains(@class, "-content__desc")]')
+    META_DESC = etree.XPath('//meta[@name="description"]')
+    PLAYLIST = etree.XPath('//ul[contains(@class, "-content__playlist")]')
+    PLAYLIST_LINKS = etree.XPath('.//li//a')
+    UTF8_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+    
+    def __init__(self, base_url):
+        self.base_url = base_url
+    
+    def _doc(self, html, encoding):
+        text = to_text(html, encoding)
+        try:
+            return lxml.html.document_fromstring(text)
+        except ValueError:
+            # 带XML编码声明的字符串需要以字节形式解析
+            return lxml.html.document_fromstring(text.encode('utf-8'), parser=self.UTF8_PARSER)
+        except etree.ParserError:
+            # 空文档，与bs4一致按没有任何元素处理
+            return lxml.html.document_fromstring('<html></html>')
+    
+    def _text(self, element):
+        """与bs4的get_text(strip=True)一致：每段文本去掉首尾空白后拼接"""
+        return ''.join(text.strip() for text in element.itertext())
+    
+    def total_pages(self, html, encoding=None):
+        doc = self._doc(html, encoding)
+        last_page_links = self.LAST_PAGE(doc)
+        last_href = last_page_links[0].get('href') if last_page_links else None
+        return build_total_pages(last_href, [self._text(link) for link in self.PAGE_LINKS(doc)])
+    
+    def list_entries(self, html, encoding=None):
+        doc = self._doc(html, encoding)
+        entries = {}
+        # 与bs4一致：优先使用ul.list_mov，否则使用第一个*-vodlist
+        vodlists = self.VODLIST(doc)
+        vodlist_ul = next((ul for ul in vodlists if 'list_mov' in ul.get('class', '').split()), None)
+        if vodlist_ul is None and vodlists:
+            vodlist_ul = vodlists[0]
+        if vodlist_ul is not None:
+            for item in self.LIST_ITEMS(vodlist_ul):
+                links = self.DETAIL_LINK(item)
+                if not links:
+                    continue
+                full_url = f"{self.base_url}{links[0].get('href')}"
+                dyid = extract_dyid(full_url)
+                if dyid is None or full_url in entries:
+                    continue
+                badges = self.BADGE(item)
+                entries[full_url] = {'dyid': dyid, 'url': full_url, 'badge': self._text(badges[0]) if badges else ''}
+        return list(entries.values())
+    
+    def detail(self, html, url, encoding=None):
+        dyid = extract_dyid(url)
+        if dyid is None:
+            return None
+        doc = self._doc(html, encoding)
+        
+        titles = self.TITLE(doc)
+        metas = self.META_DESC(doc)
+        return build_detail(
+            url, dyid,
+            self._text(titles[0]) if titles else None,
+            [[self._text(a) for a in self.LINKS(p)] for p in self.DATA(doc)[:3]],
+            [self._text(div) for div in self.DESC(doc)],
+            metas[0].get('content') if metas else None,
+            self._playlist(doc),
+            self.base_url
+        )
+    
+    def episode_count(self, html, encoding=None):
+        return max(sum(1 for title, _ in self._playlist(self._doc(html, encoding)) if title != "APP播放"), 1)
+    
+    def _playlist(self, doc):
+        playlists = self.PLAYLIST(doc)
+        if not playlists:
+            return []
+        return [(self._text(link), link.get('href', '')) for link in self.PLAYLIST_LINKS(playlists[0])]
+
+# 可选的解析后端
+PARSERS = {
+    SoupParser.name: SoupParser,
+    LxmlParser.name: LxmlParser
+}
+
+# 解析进程中的解析器实例，由_init_worker创建
+_worker_parser = None
+
+def _init_worker(backend, base_url):
+    global _worker_parser
+    _worker_parser = PARSERS[backend](base_url)
+
+def _call(method, args):
+    return getattr(_worker_parser, method)(*args)
+
+class ParsePool:
+    """在进程池中解析页面，I/O线程只发送原始字节并等待结果，解析不再占用爬虫进程的GIL；接口与解析器相同"""
+    
+    def __init__(self, backend, base_url, processes):
+        self.name = backend
+        self.processes = processes
+        # spawn：爬虫进程中已有写库等后台线程，fork可能复制到持有中的锁
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(backend, base_url)
+        )
+    
+    def submit(self, method, *args):
+        """提交解析任务，返回concurrent.futures.Future（async引擎用asyncio.wrap_future等待）"""
+        return self.executor.submit(_call, method, args)
+    
+    def total_pages(self, html, encoding=None):
+        return self.submit('total_pages', html, encoding).result()
+    
+    def list_entries(self, html, encoding=None):
+        return self.submit('list_entries', html, encoding).result()
+    
+    def detail(self, html, url, encoding=None):
+        return self.submit('detail', html, url, encoding).result()
+    
+    def episode_count(self, html, encoding=None):
+        return self.submit('episode_count', html, encoding).result()
+    
+    def close(self):
+        self.executor.shutdown()
+
+def create_parser(backend='bs4', base_url='', processes=0):
+    """创建解析器，processes大于0时在对应数量的解析进程中运行"""
+    if backend not in PARSERS:
+        raise ValueError(f"未知的解析后端: {backend}（可选 {', '.join(PARSERS)}）")
+    if processes > 0:
+        return ParsePool(backend, base_url, processes)
+    return PARSERS[backend](base_url)
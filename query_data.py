@@ -4,16 +4,41 @@
 import sqlite3
 import argparse
 import csv
+import gzip
+import io
+import itertools
 import json
 import os
 import sys
+import time
+import threading
 from datetime import datetime
 
+from init_db import apply_pragmas, ensure_search_index
+from dimensions import FACET_KINDS, PERSON_ROLES
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # 数据库文件
 DB_FILE = "dy.db"
 
+# 全文索引使用trigram分词，少于3个字的关键词无法使用索引，退回LIKE扫描
+FTS_MIN_KEYWORD = 3
+
+# bm25权重：name, description, actors, directors（片名匹配排在最前）
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+# 流式导出时每次从游标读取的行数
+EXPORT_CHUNK_SIZE = 1000
+
+# 可整表导出的表及其导出顺序
+EXPORT_TABLES = {'dy': 'dyid', 'm3u8': 'dyid, episode'}
+
 def connect_db():
-    """连接数据库"""
+    """打开读写连接（重建全文索引等写操作使用，查询使用MovieStore）"""
     if not os.path.exists(DB_FILE):
         print(f"数据库文件 {DB_FILE} 不存在，请先运行爬虫程序")
         sys.exit(1)
@@ -22,151 +47,350 @@ def connect_db():
     conn.row_factory = sqlite3.Row
     return conn
 
-def get_categories():
-    """获取所有分类"""
-    conn = connect_db()
-    cursor = conn.cursor()
+def has_search_index(conn):
+    """数据库中是否有全文索引dy_fts"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dy_fts'")
+    return cursor.fetchone() is not None
+
+def fts_phrase(keyword):
+    """把关键词转为FTS5短语（trigram分词下等价于子串匹配）"""
+    return '"' + keyword.replace('"', '""') + '"'
+
+def build_search_query(keyword=None, category=None, region=None, year=None, limit=100, use_index=True):
+    """构造搜索SQL，返回 (sql, params)；use_index为True且关键词不少于3个字时使用全文索引，limit为None时不限数量"""
+    if limit is None:
+        limit = -1  # SQLite中负数LIMIT表示不限制
+    filters = ""
+    filter_params = []
+    
+    if category:
+        filters += " AND dy.type = ?"
+        filter_params.append(category)
     
-    cursor.execute("""
-    SELECT DISTINCT type FROM dy
-    """)
+    if region:
+        filters += " AND dy.region = ?"
+        filter_params.append(region)
     
-    categories = [row['type'] for row in cursor.fetchall()]
-    conn.close()
+    if year:
+        filters += " AND dy.year = ?"
+        filter_params.append(year)
+    
+    if keyword and len(keyword) >= FTS_MIN_KEYWORD and use_index:
+        # 片名匹配的影片排在前面，两组分别对全部匹配按bm25排序后各取前limit条再合并
+        # CROSS JOIN固定先查全文索引，否则按筛选条件的索引遍历dy后逐行MATCH会非常慢
+        join = " CROSS JOIN dy ON dy.id = dy_fts.rowid" if filters else ""
+        score = f"bm25(dy_fts, {', '.join(map(str, FTS_WEIGHTS))})"
+        query = f"""
+        SELECT dy.* FROM (
+            SELECT * FROM (
+                SELECT dy_fts.rowid AS id, 0 AS tier, {score} AS score
+                FROM dy_fts{join}
+                WHERE dy_fts MATCH ?{filters}
+                ORDER BY score LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT dy_fts.rowid AS id, 1 AS tier, {score} AS score
+                FROM dy_fts{join}
+                WHERE dy_fts MATCH ?{filters}
+                ORDER BY score LIMIT ?
+            )
+        ) AS hits JOIN dy ON dy.id = hits.id
+        ORDER BY hits.tier, hits.score LIMIT ?
+        """
+        phrase = fts_phrase(keyword)
+        return query, ([f"name : {phrase}"] + filter_params + [limit] + [f"{phrase} NOT name : {phrase}"]
+                       + filter_params + [limit, limit])
+    
+    query = "SELECT dy.* FROM dy WHERE 1=1"
+    params = []
+    if keyword:
+        query += " AND (dy.name LIKE ? OR dy.description LIKE ? OR dy.actors LIKE ? OR dy.directors LIKE ?)"
+        params.extend([f"%{keyword}%"] * 4)
     
-    return categories
+    query += filters + " ORDER BY dy.dyid DESC LIMIT ?"
+    return query, params + filter_params + [limit]
+
+class MovieStore:
+    """只读数据访问层：持有一个只读连接并复用其语句缓存，同一进程内可以低开销地执行多次查询。
+    连接为 mode=ro + query_only，WAL模式下可以与正在写库的爬虫同时使用，每次查询读取最新提交的数据"""
+    
+    def __init__(self, db_file=None, cached_statements=128):
+        """
+        db_file: 数据库文件，默认为DB_FILE
+        cached_statements: 连接缓存的预编译语句数
+        """
+        self.db_file = db_file or DB_FILE
+        if not os.path.exists(self.db_file):
+            raise FileNotFoundError(f"数据库文件 {self.db_file} 不存在")
+        
+        self.conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=30,
+                                    cached_statements=cached_statements, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        apply_pragmas(self.conn, read_only=True)
+        self.lock = threading.Lock()
+    
+    def query(self, sql, params=()):
+        """执行查询并返回全部结果（sqlite3.Row列表）"""
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+    
+    def iter_query(self, sql, params=(), chunk_size=EXPORT_CHUNK_SIZE):
+        """逐批（fetchmany）读取查询结果的生成器，内存占用与结果总数无关"""
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+    
+    def categories(self):
+        """获取所有分类"""
+        return [row['type'] for row in self.query("SELECT DISTINCT type FROM dy")]
+    
+    def progress(self):
+        """获取爬取进度"""
+        return self.query("""
+        SELECT category, current_page, total_pages, status, update_time
+        FROM crawl_progress
+        """)
+    
+    def counts(self):
+        """获取影片数量和m3u8链接数量"""
+        row = self.query("SELECT (SELECT COUNT(*) FROM dy) AS movies, (SELECT COUNT(*) FROM m3u8) AS m3u8s")[0]
+        return row['movies'], row['m3u8s']
+    
+    def has_search_index(self):
+        with self.lock:
+            return has_search_index(self.conn)
+    
+    def search(self, keyword=None, category=None, region=None, year=None, limit=100):
+        """搜索影片：关键词匹配片名、简介、演员和导演，有全文索引时按相关度排序，否则按影片ID倒序"""
+        query, params = build_search_query(keyword, category, region, year, limit, use_index=self.has_search_index())
+        return self.query(query, params)
+    
+    def iter_search(self, keyword=None, category=None, region=None, year=None, limit=None):
+        """search的流式版本，limit为None时返回全部匹配结果"""
+        query, params = build_search_query(keyword, category, region, year, limit, use_index=self.has_search_index())
+        return self.iter_query(query, params)
+    
+    def iter_table(self, table):
+        """按主键顺序流式读取整张表（dy或m3u8）"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"只能导出 {', '.join(EXPORT_TABLES)} 表")
+        return self.iter_query(f"SELECT * FROM {table} ORDER BY {EXPORT_TABLES[table]}")
+    
+    def titles_by_person(self, name, role='actor', limit=100):
+        """按人名精确查找其参演（role='actor'）或导演（role='director'）的影片"""
+        return self.query("""
+        SELECT d.*
+        FROM person p
+        JOIN title_person tp ON tp.person_id = p.id AND tp.role = ?
+        JOIN dy d ON d.dyid = tp.dyid
+        WHERE p.name = ?
+        ORDER BY d.dyid DESC
+        LIMIT ?
+        """, (role, name, limit))
+    
+    def facet_counts(self, by=('region',), category=None, region=None, year=None, limit=100):
+        """按分面（type/region/year的组合）统计影片数，可按分面取值筛选，返回按数量降序的行（取值未知的为"未知"）"""
+        by = list(by)
+        if not by or any(kind not in FACET_KINDS for kind in by):
+            raise ValueError(f"分面必须是 {', '.join(FACET_KINDS)} 中的一个或多个")
+        
+        # 先在title_facet的整数索引上分组计数，再连接facet取得取值
+        where = []
+        params = []
+        for kind, value in zip(FACET_KINDS, (category, region, year)):
+            if value:
+                where.append(f"{kind}_id = (SELECT id FROM facet WHERE kind = ? AND value = ?)")
+                params.extend([kind, value])
+        
+        keys = ', '.join(f"{kind}_id" for kind in by)
+        columns = ', '.join(f"COALESCE(f{index}.value, '未知') AS {kind}" for index, kind in enumerate(by))
+        joins = ' '.join(f"LEFT JOIN facet f{index} ON f{index}.id = c.{kind}_id" for index, kind in enumerate(by))
+        sql = f"""
+        SELECT {columns}, c.count
+        FROM (
+            SELECT {keys}, COUNT(*) AS count
+            FROM title_facet
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            GROUP BY {keys}
+        ) AS c {joins}
+        ORDER BY c.count DESC
+        LIMIT ?
+        """
+        return self.query(sql, params + [limit])
+    
+    def m3u8_links(self, dyid):
+        """获取指定影片的m3u8链接"""
+        return self.query("""
+        SELECT m.*, d.name as movie_name
+        FROM m3u8 m
+        JOIN dy d ON m.dyid = d.dyid
+        WHERE m.dyid = ?
+        ORDER BY m.episode
+        """, (dyid,))
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# 模块级查询函数共用的MovieStore，首次使用时创建
+_store = None
+
+def get_store():
+    """获取模块级函数共用的MovieStore（每个进程一个只读连接）"""
+    global _store
+    if _store is None:
+        if not os.path.exists(DB_FILE):
+            print(f"数据库文件 {DB_FILE} 不存在，请先运行爬虫程序")
+            sys.exit(1)
+        _store = MovieStore(DB_FILE)
+    return _store
+
+def get_categories():
+    """获取所有分类"""
+    return get_store().categories()
 
 def get_progress():
     """获取爬取进度"""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    SELECT category, current_page, total_pages, status, update_time
-    FROM crawl_progress
-    """)
-    
-    progress = cursor.fetchall()
-    conn.close()
-    
-    return progress
+    return get_store().progress()
 
 def get_movie_count():
     """获取影片数量"""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) as count FROM dy")
-    movie_count = cursor.fetchone()['count']
-    
-    cursor.execute("SELECT COUNT(*) as count FROM m3u8")
-    m3u8_count = cursor.fetchone()['count']
-    
-    conn.close()
-    
-    return movie_count, m3u8_count
+    return get_store().counts()
 
 def search_movies(keyword=None, category=None, region=None, year=None, limit=100):
     """搜索影片"""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM dy WHERE 1=1"
-    params = []
-    
-    if keyword:
-        query += " AND (name LIKE ? OR description LIKE ?)"
-        params.extend([f"%{keyword}%", f"%{keyword}%"])
-    
-    if category:
-        query += " AND type = ?"
-        params.append(category)
-    
-    if region:
-        query += " AND region = ?"
-        params.append(region)
-    
-    if year:
-        query += " AND year = ?"
-        params.append(year)
-    
-    query += " ORDER BY dyid DESC LIMIT ?"
-    params.append(limit)
-    
-    cursor.execute(query, params)
-    movies = cursor.fetchall()
-    conn.close()
-    
-    return movies
+    return get_store().search(keyword, category, region, year, limit)
+
+def iter_search_movies(keyword=None, category=None, region=None, year=None, limit=None):
+    """流式搜索影片，limit为None时返回全部匹配结果"""
+    return get_store().iter_search(keyword, category, region, year, limit)
+
+def iter_table(table):
+    """流式读取整张dy或m3u8表"""
+    return get_store().iter_table(table)
 
 def get_m3u8_links(dyid):
     """获取指定影片的m3u8链接"""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    SELECT m.*, d.name as movie_name
-    FROM m3u8 m
-    JOIN dy d ON m.dyid = d.dyid
-    WHERE m.dyid = ?
-    ORDER BY m.episode
-    """, (dyid,))
-    
-    links = cursor.fetchall()
-    conn.close()
-    
-    return links
+    return get_store().m3u8_links(dyid)
 
-def export_to_csv(data, filename):
-    """导出数据到CSV文件"""
-    if not data:
-        print("没有数据可导出")
-        return False
-    
+def get_titles_by_person(name, role='actor', limit=100):
+    """按演员或导演查找影片"""
+    return get_store().titles_by_person(name, role, limit)
+
+def get_facet_counts(by=('region',), category=None, region=None, year=None, limit=100):
+    """按分类/地区/年份统计影片数"""
+    return get_store().facet_counts(by, category, region, year, limit)
+
+def rebuild_search_index():
+    """按dy表重建全文索引并合并索引段；迁移时因SQLite不支持trigram而跳过的索引在此补建"""
+    conn = connect_db()
     try:
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # 写入表头
-            writer.writerow(dict(data[0]).keys())
-            
-            # 写入数据
-            for row in data:
-                writer.writerow(dict(row).values())
+        if ensure_search_index(conn, warn=True):
+            print("已补建全文索引dy_fts")
+        if not has_search_index(conn):
+            print("数据库中没有全文索引，请先运行 init_db.py 升级数据库")
+            return False
         
-        print(f"数据已导出到 {filename}")
+        start = time.time()
+        conn.execute("INSERT INTO dy_fts (dy_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO dy_fts (dy_fts) VALUES ('optimize')")
+        conn.commit()
+        count = conn.execute("SELECT COUNT(*) FROM dy").fetchone()[0]
+        print(f"全文索引已重建: {count} 部影片, 耗时 {time.time() - start:.1f} 秒")
         return True
-    except Exception as e:
-        print(f"导出数据失败: {e}")
-        return False
+    finally:
+        conn.close()
 
-def export_to_json(data, filename):
-    """导出数据到JSON文件"""
-    if not data:
+def open_export(filename):
+    """按扩展名打开导出文件：.gz使用gzip压缩，.zst使用zstd压缩（需要安装zstandard）"""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wt', compresslevel=6, encoding='utf-8', newline='')
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("导出.zst文件需要安装zstandard (pip install zstandard)")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(filename, 'wb')), encoding='utf-8', newline='')
+    return open(filename, 'w', newline='', encoding='utf-8')
+
+def peek_rows(data):
+    """取出第一行，返回 (第一行, 仍包含第一行的迭代器)；没有数据时第一行为None"""
+    rows = iter(data)
+    first = next(rows, None)
+    return first, (itertools.chain([first], rows) if first is not None else rows)
+
+def export_rows(data, filename, write):
+    """流式导出：data为行的列表或迭代器（sqlite3.Row或字典），write(f, 列名, 行迭代器)写入并返回行数"""
+    first, rows = peek_rows(data)
+    if first is None:
         print("没有数据可导出")
         return False
     
     try:
-        # 将sqlite3.Row对象转换为字典
-        json_data = [dict(row) for row in data]
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"数据已导出到 {filename}")
+        with open_export(filename) as f:
+            count = write(f, list(first.keys()), rows)
+        print(f"数据已导出到 {filename} ({count} 条)")
         return True
     except Exception as e:
         print(f"导出数据失败: {e}")
         return False
 
+def export_to_csv(data, filename):
+    """导出数据到CSV文件"""
+    def write(f, columns, rows):
+        writer = csv.writer(f)
+        writer.writerow(columns)  # 写入表头
+        count = 0
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+            count += 1
+        return count
+    
+    return export_rows(data, filename, write)
+
+def export_to_json(data, filename):
+    """导出数据到JSON文件（JSON数组，每行一条记录，逐条写入）"""
+    def write(f, columns, rows):
+        count = 0
+        f.write("[")
+        for row in rows:
+            f.write(("," if count else "") + "\n  " + json.dumps(dict(row), ensure_ascii=False))
+            count += 1
+        f.write("\n]\n")
+        return count
+    
+    return export_rows(data, filename, write)
+
+def export_to_jsonl(data, filename):
+    """导出数据到JSON Lines文件（每行一个JSON对象）"""
+    def write(f, columns, rows):
+        count = 0
+        for row in rows:
+            f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+            count += 1
+        return count
+    
+    return export_rows(data, filename, write)
+
+# 导出格式 -> 导出函数
+EXPORTERS = {'csv': export_to_csv, 'json': export_to_json, 'jsonl': export_to_jsonl}
+
 def export_m3u8_playlist(links, filename):
     """导出m3u8链接为播放列表"""
-    if not links:
+    first, links = peek_rows(links)
+    if first is None:
         print("没有m3u8链接可导出")
         return False
     
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        with open_export(filename) as f:
             f.write("#EXTM3U\n")
             
             for link in links:
@@ -179,9 +403,23 @@ def export_m3u8_playlist(links, filename):
         print(f"导出播放列表失败: {e}")
         return False
 
+def print_movies(movies, output=None, format="csv"):
+    """显示影片列表（前10条），指定output时导出全部结果"""
+    print(f"找到 {len(movies)} 部影片:")
+    for i, movie in enumerate(movies[:10]):  # 只显示前10条
+        print(f"{i+1}. {movie['name']} ({movie['year']}) - {movie['type']} - {movie['region']}")
+    
+    if len(movies) > 10:
+        print(f"... 还有 {len(movies) - 10} 部影片未显示")
+    
+    # 导出数据
+    if output:
+        EXPORTERS[format](movies, output)
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="DSQ4D影视资源数据查询工具")
+    parser.add_argument("--rebuild-index", action="store_true", help="重建影片全文索引(dy_fts)")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
     # 查看进度
@@ -192,22 +430,59 @@ def main():
     
     # 搜索影片
     search_parser = subparsers.add_parser("search", help="搜索影片")
-    search_parser.add_argument("-k", "--keyword", help="关键词")
+    search_parser.add_argument("-k", "--keyword", help="关键词(不少于3个字时按相关度排序，片名匹配的排在前面)")
     search_parser.add_argument("-c", "--category", help="分类")
     search_parser.add_argument("-r", "--region", help="地区")
     search_parser.add_argument("-y", "--year", help="年份")
     search_parser.add_argument("-l", "--limit", type=int, default=100, help="限制结果数量")
-    search_parser.add_argument("-o", "--output", help="导出文件名")
-    search_parser.add_argument("-f", "--format", choices=["csv", "json"], default="csv", help="导出格式")
+    search_parser.add_argument("-a", "--all", action="store_true", help="不限制结果数量（需配合--output流式导出）")
+    search_parser.add_argument("-o", "--output", help="导出文件名，以.gz/.zst结尾时压缩")
+    search_parser.add_argument("-f", "--format", choices=list(EXPORTERS), default="csv", help="导出格式")
+    
+    # 按演员/导演查找影片
+    for role, label in (("actor", "演员"), ("director", "导演")):
+        person_parser = subparsers.add_parser(role, help=f"按{label}查找影片")
+        person_parser.add_argument("name", help=f"{label}姓名(精确匹配)")
+        person_parser.add_argument("-l", "--limit", type=int, default=100, help="限制结果数量")
+        person_parser.add_argument("-o", "--output", help="导出文件名，以.gz/.zst结尾时压缩")
+        person_parser.add_argument("-f", "--format", choices=list(EXPORTERS), default="csv", help="导出格式")
+    
+    # 分面统计
+    facets_parser = subparsers.add_parser("facets", help="按分类/地区/年份统计影片数")
+    facets_parser.add_argument("-b", "--by", default="region", help=f"分组维度，逗号分隔: {','.join(FACET_KINDS)}")
+    facets_parser.add_argument("-c", "--category", help="只统计该分类")
+    facets_parser.add_argument("-r", "--region", help="只统计该地区")
+    facets_parser.add_argument("-y", "--year", help="只统计该年份")
+    facets_parser.add_argument("-l", "--limit", type=int, default=50, help="限制结果数量")
     
     # 获取m3u8链接
     m3u8_parser = subparsers.add_parser("m3u8", help="获取m3u8链接")
     m3u8_parser.add_argument("dyid", type=int, help="影片ID")
-    m3u8_parser.add_argument("-o", "--output", help="导出文件名")
-    m3u8_parser.add_argument("-f", "--format", choices=["csv", "json", "m3u"], default="m3u", help="导出格式")
+    m3u8_parser.add_argument("-o", "--output", help="导出文件名，以.gz/.zst结尾时压缩")
+    m3u8_parser.add_argument("-f", "--format", choices=list(EXPORTERS) + ["m3u"], default="m3u", help="导出格式")
+    
+    # 列式快照
+    snapshot_parser = subparsers.add_parser("export-snapshot", help="导出按分类/年份分区的Parquet或Arrow快照（需要pyarrow）")
+    snapshot_parser.add_argument("-o", "--output", default="snapshot", help="快照目录")
+    snapshot_parser.add_argument("-f", "--format", choices=["parquet", "arrow"], default="parquet",
+                                 help="文件格式: parquet(zstd压缩) 或 arrow(Arrow IPC，不压缩，可内存映射)")
+    snapshot_parser.add_argument("-t", "--tables", default="dy,m3u8", help="要导出的表，逗号分隔")
+    snapshot_parser.add_argument("--batch-rows", type=int, default=50000, help="每批写入的行数")
+    snapshot_parser.add_argument("--full", action="store_true", help="删除已有快照重新完整导出（默认只重写上次导出以来有变化的分区）")
+    
+    # 整表导出
+    export_parser = subparsers.add_parser("export", help="流式导出整张dy或m3u8表")
+    export_parser.add_argument("table", choices=list(EXPORT_TABLES), help="要导出的表")
+    export_parser.add_argument("-o", "--output", required=True, help="导出文件名，以.gz/.zst结尾时压缩")
+    export_parser.add_argument("-f", "--format", choices=list(EXPORTERS), default="jsonl", help="导出格式")
     
     args = parser.parse_args()
     
+    if args.rebuild_index:
+        rebuild_search_index()
+        if not args.command:
+            return
+    
     if args.command == "progress":
         # 查看爬取进度
         progress = get_progress()
@@ -230,27 +505,46 @@ def main():
         print(f"m3u8链接总数: {m3u8_count}")
         print(f"影片分类: {', '.join(categories)}")
     
+    elif args.command == "search" and args.output:
+        # 流式导出搜索结果，不在内存中保存全部结果
+        limit = None if args.all else args.limit
+        EXPORTERS[args.format](iter_search_movies(args.keyword, args.category, args.region, args.year, limit), args.output)
+    
     elif args.command == "search":
         # 搜索影片
+        if args.all:
+            parser.error("--all 需要配合 --output 使用")
         movies = search_movies(args.keyword, args.category, args.region, args.year, args.limit)
         
         if movies:
-            print(f"找到 {len(movies)} 部影片:")
-            for i, movie in enumerate(movies[:10]):  # 只显示前10条
-                print(f"{i+1}. {movie['name']} ({movie['year']}) - {movie['type']} - {movie['region']}")
-            
-            if len(movies) > 10:
-                print(f"... 还有 {len(movies) - 10} 部影片未显示")
-            
-            # 导出数据
-            if args.output:
-                if args.format == "csv":
-                    export_to_csv(movies, args.output)
-                elif args.format == "json":
-                    export_to_json(movies, args.output)
+            print_movies(movies, args.output, args.format)
         else:
             print("没有找到符合条件的影片")
     
+    elif args.command in PERSON_ROLES:
+        # 按演员/导演查找影片
+        movies = get_titles_by_person(args.name, args.command, args.limit)
+        
+        if movies:
+            print_movies(movies, args.output, args.format)
+        else:
+            print(f"没有找到{'演员' if args.command == 'actor' else '导演'}为 {args.name} 的影片")
+    
+    elif args.command == "facets":
+        # 分面统计
+        by = [kind.strip() for kind in args.by.split(',') if kind.strip()]
+        try:
+            rows = get_facet_counts(by, args.category, args.region, args.year, args.limit)
+        except ValueError as e:
+            parser.error(str(e))
+        
+        if rows:
+            print(f"按 {', '.join(by)} 统计:")
+            for row in rows:
+                print(f"{' / '.join(row[kind] for kind in by)}: {row['count']} 部")
+        else:
+            print("没有符合条件的影片")
+    
     elif args.command == "m3u8":
         # 获取m3u8链接
         links = get_m3u8_links(args.dyid)
@@ -262,15 +556,32 @@ def main():
             
             # 导出数据
             if args.output:
-                if args.format == "csv":
-                    export_to_csv(links, args.output)
-                elif args.format == "json":
-                    export_to_json(links, args.output)
-                elif args.format == "m3u":
+                if args.format == "m3u":
                     export_m3u8_playlist(links, args.output)
+                else:
+                    EXPORTERS[args.format](links, args.output)
         else:
             print(f"没有找到影片ID为 {args.dyid} 的m3u8链接")
     
+    elif args.command == "export-snapshot":
+        # 列式快照
+        from snapshot import SNAPSHOT_TABLES, export_snapshot
+        tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+        if any(table not in SNAPSHOT_TABLES for table in tables):
+            parser.error(f"只能导出 {', '.join(SNAPSHOT_TABLES)} 表")
+        try:
+            start = time.time()
+            counts = export_snapshot(get_store(), args.output, args.format, tables, args.batch_rows, args.full)
+        except (RuntimeError, ValueError) as e:
+            print(f"导出快照失败: {e}")
+            sys.exit(1)
+        print(f"快照已{'完整导出' if args.full else '导出'}到 {args.output} ({args.format}): "
+              f"{', '.join(f'{table} {count} 条' for table, count in counts.items())}, 耗时 {time.time() - start:.1f} 秒")
+    
+    elif args.command == "export":
+        # 整表导出
+        EXPORTERS[args.format](iter_table(args.table), args.output)
+    
     else:
         parser.print_help()
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+
+# 各类请求的默认速率（次/秒）
+DEFAULT_RATES = {
+    'list': 4.0,
+    'detail': 10.0,
+    'play': 30.0,
+    'api': 15.0
+}
+
+# 触发自适应降速的状态码
+THROTTLE_STATUS = {429, 503}
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，令牌不足时预约并返回需要等待的时间"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def reserve(self, rate=None):
+        """取走一个令牌，返回调用方在发送请求前需要等待的秒数"""
+        with self.lock:
+            rate = rate or self.rate
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / rate
+
+class RateLimiter:
+    """全局限速器：按请求类型分别限速，遇到429/503时乘性降速，之后逐步恢复"""
+    
+    def __init__(self, rates=None, min_factor=0.05, recover_step=0.05, cooldown=1.0):
+        """
+        rates: {请求类型: 次/秒}，未配置的类型不限速
+        min_factor: 降速后的最低速率系数
+        recover_step: 每次成功请求后速率系数的恢复量（按速率归一化）
+        cooldown: 两次降速之间的最小间隔（秒），避免一批并发失败把速率压到最低
+        """
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.buckets = {kind: TokenBucket(rate) for kind, rate in self.rates.items() if rate > 0}
+        self.factors = {kind: 1.0 for kind in self.buckets}
+        self.min_factor = min_factor
+        self.recover_step = recover_step
+        self.cooldown = cooldown
+        self.last_throttle = {}
+        self.throttled = {}
+        self.lock = threading.Lock()
+    
+    def reserve(self, kind):
+        """预约一次请求，返回需要等待的秒数"""
+        bucket = self.buckets.get(kind)
+        if not bucket:
+            return 0.0
+        return bucket.reserve(bucket.rate * self.factors[kind])
+    
+    def acquire(self, kind):
+        """阻塞直到允许发送一次该类型的请求"""
+        wait = self.reserve(kind)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, kind):
+        """acquire的异步版本"""
+        wait = self.reserve(kind)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    def report(self, kind, status):
+        """记录响应状态码，用于自适应调整速率"""
+        if kind not in self.buckets:
+            return
+        with self.lock:
+            if status in THROTTLE_STATUS:
+                self.throttled[kind] = self.throttled.get(kind, 0) + 1
+                now = time.monotonic()
+                if now - self.last_throttle.get(kind, 0) >= self.cooldown:
+                    self.last_throttle[kind] = now
+                    self.factors[kind] = max(self.min_factor, self.factors[kind] * 0.5)
+            elif self.factors[kind] < 1.0:
+                step = self.recover_step / max(self.rates[kind], 1.0)
+                self.factors[kind] = min(1.0, self.factors[kind] + step)
+    
+    def summary(self):
+        """返回各类型的 (配置速率, 当前速率, 限流次数)"""
+        with self.lock:
+            return {
+                kind: (self.rates[kind], self.rates[kind] * self.factors[kind], self.throttled.get(kind, 0))
+                for kind in self.buckets
+            }
+
+def parse_rates(specs):
+    """解析命令行的 KIND=RATE 配置，返回完整的速率表"""
+    rates = dict(DEFAULT_RATES)
+    for spec in specs or []:
+        kind, sep, value = spec.partition('=')
+        if not sep or kind not in rates:
+            raise ValueError(f"无效的限速配置: {spec}（格式为 类型=次/秒，类型可选 {', '.join(rates)}）")
+        rates[kind] = float(value)
+    return rates
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import multiprocessing
+
+from init_db import apply_pragmas
+from db_writer import QueueWriter
+from crawl_pipeline import CategoryPipeline
+
+# 每个分片的默认页数
+DEFAULT_SHARD_PAGES = 20
+
+# 租约有效期（秒），工作进程每隔三分之一有效期续约一次
+DEFAULT_LEASE_SECONDS = 300
+
+# 同一分片最多被领取的次数，超过后不再分配（通常是工作进程反复崩溃）
+MAX_SHARD_ATTEMPTS = 5
+
+CLAIM_SHARD_SQL = """
+UPDATE crawl_shards
+SET status = 'leased', owner = ?, lease_until = datetime('now', ?), attempts = attempts + 1,
+    update_time = CURRENT_TIMESTAMP
+WHERE id = (
+    SELECT id FROM crawl_shards
+    WHERE (status = 'pending' OR (status = 'leased' AND lease_until < CURRENT_TIMESTAMP)) AND attempts < ?
+    ORDER BY category, start_page
+    LIMIT 1
+)
+RETURNING id, category, start_page, end_page, attempts
+"""
+
+# 分类中尚未结束的分片：未完成且还可以领取，或者正在租约期内处理
+OPEN_SHARDS_SQL = """
+SELECT COUNT(*) FROM crawl_shards
+WHERE category = ? AND status != 'done'
+  AND (attempts < ? OR (status = 'leased' AND lease_until >= CURRENT_TIMESTAMP))
+"""
+
+# UPDATE ... RETURNING 需要的最低SQLite版本
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+class ShardLeases:
+    """crawl_shards表上的分片租约：规划分片、原子领取、续约和释放（多个进程或多台机器共用同一个数据库）"""
+    
+    def __init__(self, db_file, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(f"分片模式需要SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} 以上版本 (UPDATE ... RETURNING)，"
+                               f"当前Python使用的SQLite版本为 {sqlite3.sqlite_version}")
+        self.lease_seconds = lease_seconds
+        # 自动提交：每条UPDATE都是一个独立的原子操作，不会长时间持有写锁
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        apply_pragmas(self.conn)
+        self.lock = threading.Lock()
+    
+    def has_open_shards(self, category):
+        """分类是否还有未结束的分片（上一轮爬取尚未完成）"""
+        with self.lock:
+            return self.conn.execute(OPEN_SHARDS_SQL, (category, MAX_SHARD_ATTEMPTS)).fetchone()[0] > 0
+    
+    def plan(self, category, total_pages, shard_pages=DEFAULT_SHARD_PAGES, start_page=1):
+        """
+        把分类的第start_page页到最后一页切分为分片，返回新建的分片数
+        上一轮的分片已全部结束时先删除，开始新一轮；其他进程已经规划了新一轮时不会重复创建
+        """
+        shards = [
+            (category, start, min(start + shard_pages - 1, total_pages))
+            for start in range(max(start_page, 1), total_pages + 1, shard_pages)
+        ]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self.conn.execute(OPEN_SHARDS_SQL, (category, MAX_SHARD_ATTEMPTS)).fetchone()[0]:
+                    self.conn.execute("DELETE FROM crawl_shards WHERE category = ?", (category,))
+                    before = self.conn.total_changes
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO crawl_shards (category, start_page, end_page) VALUES (?, ?, ?)", shards
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return self.conn.total_changes - before
+    
+    def reset(self, category):
+        """删除分类的全部分片（包括未完成的），下次规划时重新切分"""
+        with self.lock:
+            self.conn.execute("DELETE FROM crawl_shards WHERE category = ?", (category,))
+    
+    def claim(self, owner):
+        """领取一个待处理或租约已过期的分片，没有可领取的分片时返回None"""
+        with self.lock:
+            # 读完RETURNING的结果语句才会结束，自动提交的事务随之提交
+            rows = self.conn.execute(
+                CLAIM_SHARD_SQL, (owner, f"+{int(self.lease_seconds)} seconds", MAX_SHARD_ATTEMPTS)
+            ).fetchall()
+        if not rows:
+            return None
+        return dict(zip(('id', 'category', 'start_page', 'end_page', 'attempts'), rows[0]))
+    
+    def renew(self, shard_id, owner):
+        """续约，返回租约是否仍属于owner"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE crawl_shards SET lease_until = datetime('now', ?) "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (f"+{int(self.lease_seconds)} seconds", shard_id, owner)
+            )
+            return cursor.rowcount == 1
+    
+    def release(self, shard_id, owner):
+        """中断时放回分片，其他进程可以立即领取"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE crawl_shards SET status = 'pending', lease_until = NULL, update_time = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (shard_id, owner)
+            )
+    
+    def summary(self, categories=None):
+        """按状态统计分片数和影片数，返回 {状态: (分片数, 影片数)}"""
+        sql = "SELECT status, COUNT(*), SUM(titles) FROM crawl_shards"
+        params = []
+        if categories:
+            sql += f" WHERE category IN ({','.join('?' * len(categories))})"
+            params = list(categories)
+        with self.lock:
+            rows = self.conn.execute(sql + " GROUP BY status", params).fetchall()
+        return {status: (count, titles or 0) for status, count, titles in rows}
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def shard_worker(worker_id, config, result_queue):
+    """工作进程：循环领取分片并用流水线爬取，数据经result_queue交给协调进程写库"""
+    import dsq4d_crawler_optimized as crawler_module
+    from http_cache import HTTPCache
+    
+    crawler_module.BASE_URL = config['base_url']
+    crawler_module.DB_FILE = config['db_file']
+    
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    leases = ShardLeases(config['db_file'], config['lease_seconds'])
+    http_cache = None
+    if config['cache']:
+        http_cache = HTTPCache(**config['cache'])
+    crawler = crawler_module.OptimizedDSQ4DCrawler(
+        writer=QueueWriter(result_queue), http_cache=http_cache, **config['crawler']
+    )
+    
+    shard = None
+    try:
+        while True:
+            shard = leases.claim(owner)
+            if not shard:
+                break
+            
+            # 后台续约，分片处理时间超过租约有效期时不会被其他进程领取
+            stop_renew = threading.Event()
+            
+            def renew(shard_id=shard['id']):
+                while not stop_renew.wait(config['lease_seconds'] / 3):
+                    if not leases.renew(shard_id, owner):
+                        result_queue.put(('log', f"⚠️ [{owner}] 分片 #{shard_id} 的租约已失效"))
+                        return
+            
+            renewer = threading.Thread(target=renew, name="lease-renew", daemon=True)
+            renewer.start()
+            try:
+                pipeline = CategoryPipeline(
+                    crawler, shard['category'], range(shard['start_page'], shard['end_page'] + 1), shard['end_page'],
+                    list_workers=crawler.list_workers,
+                    detail_workers=crawler.max_workers,
+                    play_workers=crawler.play_workers,
+                    queue_size=crawler.queue_size,
+                    save_progress=False,
+                    progress_bar=False
+                )
+                success_count, title_count = pipeline.run()
+            finally:
+                stop_renew.set()
+                renewer.join()
+            
+            # 完成标记排在该分片数据之后，提交时不会早于数据
+            crawler.writer.put_shard_done(shard['id'], owner, title_count)
+            result_queue.put(('log', f"✅ [{owner}] 分片 #{shard['id']} 分类{shard['category']} "
+                                     f"第{shard['start_page']}-{shard['end_page']}页: {success_count}/{title_count} 成功"))
+            shard = None
+    except KeyboardInterrupt:
+        if shard:
+            leases.release(shard['id'], owner)
+    finally:
+        with crawler.stats_lock:
+            stats = dict(crawler.stats)
+        with crawler.dplayer_cache.lock:
+            stats.update({f'dplayer_{key}': value for key, value in crawler.dplayer_cache.stats.items()})
+        result_queue.put(('stats', stats))
+        # 请求延迟等指标和解析策略命中次数同样交给协调进程汇总
+        result_queue.put(('metrics', {'metrics': crawler.metrics.export(), 'resolver_hits': crawler.resolver.hit_counts()}))
+        crawler.close(summary=False)
+        leases.close()
+        result_queue.put(('exit', worker_id))
+
+class ShardCoordinator:
+    """分片协调器：规划分片，启动工作进程，并把所有工作进程的数据交给唯一的写库线程"""
+    
+    def __init__(self, crawler, base_url, db_file, processes=4, shard_pages=DEFAULT_SHARD_PAGES,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, crawler_config=None, cache_config=None):
+        """
+        crawler: 协调进程中的OptimizedDSQ4DCrawler实例，用于获取总页数，其DBWriter是唯一的写库线程
+        base_url / db_file: 工作进程使用的站点地址和数据库文件
+        processes: 工作进程数
+        crawler_config: 传给工作进程中OptimizedDSQ4DCrawler的参数（必须可序列化）
+        cache_config: 传给工作进程中HTTPCache的参数，为None时不使用缓存
+        """
+        self.crawler = crawler
+        self.processes = max(processes, 1)
+        self.shard_pages = shard_pages
+        self.lease_seconds = lease_seconds
+        self.crawler_config = dict(crawler_config or {})
+        self.cache_config = cache_config
+        self.base_url = base_url
+        self.db_file = db_file
+        self.leases = ShardLeases(self.db_file, lease_seconds)
+    
+    def plan(self, categories, reset=False, start_page=1):
+        """为每个分类规划分片（从start_page页开始）；上一轮还有未结束的分片时继续处理，否则重新规划开始新一轮"""
+        for category_id, category_name in categories.items():
+            if reset:
+                self.leases.reset(category_id)
+            elif self.leases.has_open_shards(category_id):
+                print(f"🔁 {category_name}: 继续处理上一轮未完成的分片")
+                continue
+            
+            total_pages = self.crawler.get_total_pages(category_id)
+            if total_pages == 0:
+                print(f"❌ 获取{category_name}总页数失败，跳过")
+                continue
+            if self.crawler.test_mode and total_pages > 2:
+                total_pages = 2
+            created = self.leases.plan(category_id, total_pages, self.shard_pages, start_page)
+            print(f"🧩 {category_name}: {total_pages} 页, 新建 {created} 个分片")
+    
+    def run(self, categories, reset=False, start_page=1):
+        """规划分片并运行工作进程直到没有可领取的分片"""
+        self.plan(categories, reset, start_page)
+        
+        pending = self.leases.summary(list(categories))
+        todo = sum(pending.get(status, (0, 0))[0] for status in ('pending', 'leased'))
+        if not todo:
+            print("✅ 没有可领取的分片")
+            return True
+        print(f"🚀 {self.processes} 个工作进程处理 {todo} 个分片...")
+        
+        config = {
+            'base_url': self.base_url,
+            'db_file': self.db_file,
+            'lease_seconds': self.lease_seconds,
+            'crawler': self.crawler_config,
+            'cache': self.cache_config
+        }
+        # spawn：协调进程中已有写库线程等后台线程，fork可能复制到持有中的锁
+        context = multiprocessing.get_context('spawn')
+        result_queue = context.Queue(maxsize=10000)
+        workers = [
+            context.Process(target=shard_worker, args=(index, config, result_queue), name=f"shard-worker-{index}")
+            for index in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        interrupted = False
+        try:
+            self._drain(workers, result_queue)
+        except KeyboardInterrupt:
+            # 工作进程同样收到中断信号，放回分片后退出；继续转发其剩余的数据
+            print("\n⏹️ 爬取被用户中断，等待工作进程退出...")
+            interrupted = True
+            self._drain(workers, result_queue)
+        
+        for worker in workers:
+            worker.join()
+        self.crawler.flush_batch()
+        
+        summary = self.leases.summary(list(categories))
+        print("🧩 分片状态: " + ', '.join(
+            f"{status} {count} 个({titles}部)" for status, (count, titles) in sorted(summary.items())
+        ))
+        return not interrupted
+    
+    def _drain(self, workers, result_queue):
+        """转发工作进程的数据到写库队列，直到所有工作进程退出"""
+        writer_queue = self.crawler.writer.queue
+        running = {index for index in range(len(workers))}
+        while running:
+            try:
+                kind, payload = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                # 异常退出的进程不会发送exit消息
+                for index in list(running):
+                    if not workers[index].is_alive() and workers[index].exitcode != 0:
+                        print(f"💥 工作进程 {workers[index].name} 异常退出 (退出码 {workers[index].exitcode})")
+                        running.discard(index)
+                continue
+            
+            if kind == 'exit':
+                running.discard(payload)
+            elif kind == 'log':
+                print(payload)
+            elif kind == 'stats':
+                for key, value in payload.items():
+                    self.crawler._bump_stat(key, value)
+            elif kind == 'metrics':
+                self.crawler.metrics.merge(payload['metrics'])
+                self.crawler.resolver.merge_hits(payload['resolver_hits'])
+            else:
+                writer_queue.put((kind, payload))
+    
+    def close(self):
+        self.leases.close()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import glob
+import shutil
+import itertools
+from urllib.parse import unquote
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+# 快照格式 -> 文件扩展名
+SNAPSHOT_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# 增量导出的状态文件（位于快照目录下）
+SNAPSHOT_STATE_FILE = "_snapshot_state.json"
+
+# 每批写入的行数
+DEFAULT_BATCH_ROWS = 50000
+
+# 只导出早于该秒数的数据：写库线程的事务可能晚于crawl_time数秒提交，留出余量避免增量导出漏掉
+SNAPSHOT_LAG_SECONDS = 60
+
+# 分区列（Hive风格目录 type=.../year=...）
+PARTITION_COLUMNS = ('type', 'year')
+
+# 分区值为NULL时的目录名（pyarrow的Hive分区默认值）
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# 导出的表：
+# query: 导出的查询，{where}处填入分区筛选条件（完整导出时为空）
+# partition: 按分区筛选的条件
+# changed: crawl_time在 [上次导出, 本次截止) 区间内有变化的影片及其当前分区 (dyid, type, year)；
+#          m3u8还包括影片本身有变化的情况（分类或年份改变时其剧集需要移到新分区）
+# columns: 列名和类型，m3u8连接dy取得分区列
+SNAPSHOT_TABLES = {
+    'dy': {
+        'query': "SELECT id, dyid, name, type, region, year, actors, directors, description, url, crawl_time "
+                 "FROM dy{where} ORDER BY dyid",
+        'partition': "type IS ? AND year IS ?",
+        'changed': "SELECT dyid, type, year FROM dy WHERE crawl_time >= ? AND crawl_time < ?",
+        'columns': [('id', 'int64'), ('dyid', 'int64'), ('name', 'string'), ('type', 'string'), ('region', 'string'),
+                    ('year', 'string'), ('actors', 'string'), ('directors', 'string'), ('description', 'string'),
+                    ('url', 'string'), ('crawl_time', 'timestamp')]
+    },
+    'm3u8': {
+        'query': "SELECT m.id, m.dyid, m.name, m.episode, m.play_url, m.m3u8_url, m.crawl_time, d.type, d.year "
+                 "FROM m3u8 m JOIN dy d ON d.dyid = m.dyid{where} ORDER BY m.dyid, m.episode",
+        'partition': "d.type IS ? AND d.year IS ?",
+        'changed': "SELECT dyid, type, year FROM dy WHERE crawl_time >= ? AND crawl_time < ? "
+                   "UNION SELECT d.dyid, d.type, d.year FROM m3u8 m JOIN dy d ON d.dyid = m.dyid "
+                   "WHERE m.crawl_time >= ? AND m.crawl_time < ?",
+        'columns': [('id', 'int64'), ('dyid', 'int64'), ('name', 'string'), ('episode', 'int64'), ('play_url', 'string'),
+                    ('m3u8_url', 'string'), ('crawl_time', 'timestamp'), ('type', 'string'), ('year', 'string')]
+    },
+}
+
+def table_schema(columns):
+    """由 (列名, 类型) 构造pyarrow schema，crawl_time为秒精度时间戳"""
+    types = {'int64': pa.int64(), 'string': pa.string(), 'timestamp': pa.timestamp('s')}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def partitioning(schema):
+    """Hive风格分区，分区值按字符串读取（否则year会被推断为整数）"""
+    return ds.partitioning(pa.schema([schema.field(name) for name in PARTITION_COLUMNS]), flavor='hive')
+
+def record_batches(rows, columns, schema, batch_rows):
+    """把行迭代器按batch_rows切分为RecordBatch，内存中同时只有一批数据"""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, batch_rows))
+        if not chunk:
+            break
+        arrays = []
+        for index, (name, kind) in enumerate(columns):
+            values = [row[index] for row in chunk]
+            if kind == 'timestamp':
+                # SQLite中的CURRENT_TIMESTAMP为 'YYYY-MM-DD HH:MM:SS' 文本
+                arrays.append(pc.strptime(pa.array(values, pa.string()), format='%Y-%m-%d %H:%M:%S', unit='s',
+                                          error_is_null=True))
+            else:
+                arrays.append(pa.array(values, schema.field(name).type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def partition_of(table_dir, path):
+    """由数据文件路径解析分区值 (type, year)，NULL分区为None"""
+    values = {}
+    for segment in os.path.relpath(path, table_dir).split(os.sep)[:-1]:
+        name, _, value = segment.partition('=')
+        values[name] = None if value == NULL_PARTITION else unquote(value)
+    return tuple(values.get(name) for name in PARTITION_COLUMNS)
+
+def load_state(out_dir):
+    """读取增量导出状态 {表名: 已导出到的crawl_time}，没有状态文件时返回空字典"""
+    path = os.path.join(out_dir, SNAPSHOT_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(out_dir, state):
+    """原子地写入增量导出状态"""
+    path = os.path.join(out_dir, SNAPSHOT_STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def plan_rewrite(store, table_dir, spec, schema, file_format, since, cutoff):
+    """
+    增量导出需要重写的分区：区间内有变化的影片当前所在的分区，以及这些影片在快照中原来所在的分区（分类或年份改变时）
+    返回 (按分区导出的查询列表, 这些分区中需要删除的旧文件)
+    """
+    affected = set()
+    dyids = set()
+    params = (since, cutoff) * (spec['changed'].count('?') // 2)
+    for dyid, type_, year in store.iter_query(spec['changed'], params):
+        dyids.add(dyid)
+        affected.add((type_, year))
+    if not dyids:
+        return [], []
+    
+    existing = ds.dataset(table_dir, format=file_format, partitioning=partitioning(schema))
+    if existing.files:
+        located = existing.to_table(columns=list(PARTITION_COLUMNS), filter=ds.field('dyid').isin(list(dyids)))
+        affected.update(zip(*(located.column(name).to_pylist() for name in PARTITION_COLUMNS)))
+    
+    old_files = [path for path in existing.files if partition_of(table_dir, path) in affected]
+    where = f" WHERE {spec['partition']}"
+    queries = [(spec['query'].format(where=where), values) for values in sorted(affected, key=str)]
+    return queries, old_files
+
+def replace_partitions(table_dir, staging_dir, old_files):
+    """把临时目录中的新文件移入表目录，再删除被重写分区的旧文件；中途中断时旧文件仍在，下次导出会重写同一分区"""
+    moved = set()
+    if os.path.exists(staging_dir):
+        for root, _, files in os.walk(staging_dir):
+            for name in files:
+                source = os.path.join(root, name)
+                target = os.path.join(table_dir, os.path.relpath(source, staging_dir))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+                moved.add(os.path.normpath(target))
+        shutil.rmtree(staging_dir)
+    
+    for path in old_files:
+        if os.path.normpath(path) not in moved:
+            os.remove(path)
+            # 分区中的影片全部移到其他分区后删除空目录
+            directory = os.path.dirname(path)
+            while os.path.normpath(directory) != os.path.normpath(table_dir) and not os.listdir(directory):
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+
+def export_snapshot(store, out_dir, format='parquet', tables=('dy', 'm3u8'), batch_rows=DEFAULT_BATCH_ROWS, full=False):
+    """
+    把dy和m3u8导出为按 type/year 分区的Parquet或Arrow IPC文件
+    store: query_data.MovieStore实例
+    out_dir: 快照目录，每张表一个子目录（Hive风格分区 <表>/type=.../year=.../part-*.parquet）
+    full: 删除已有快照重新导出；否则只重写上次导出以来有新增或更新的分区，快照中每部影片（每集）始终只有一行
+    返回 {表名: 写入行数}
+    """
+    if pa is None:
+        raise RuntimeError("导出快照需要安装pyarrow (pip install pyarrow)")
+    if format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"快照格式必须是 {', '.join(SNAPSHOT_FORMATS)} 之一")
+    
+    os.makedirs(out_dir, exist_ok=True)
+    state = {} if full else load_state(out_dir)
+    if state.get('format', format) != format:
+        raise ValueError(f"快照目录中已是{state['format']}格式，改变格式需要重新完整导出")
+    cutoff = store.query("SELECT datetime('now', ?)", (f"-{SNAPSHOT_LAG_SECONDS} seconds",))[0][0]
+    run_id = cutoff.replace('-', '').replace(':', '').replace(' ', '')
+    
+    if format == 'parquet':
+        file_format = ds.ParquetFileFormat()
+        write_options = file_format.make_write_options(compression='zstd')
+    else:
+        # Arrow IPC不压缩，读取时可以直接内存映射
+        file_format = ds.IpcFileFormat()
+        write_options = file_format.make_write_options()
+    
+    counts = {}
+    for table in tables:
+        spec = SNAPSHOT_TABLES[table]
+        columns = spec['columns']
+        schema = table_schema(columns)
+        table_dir = os.path.join(out_dir, table)
+        since = state.get(table)
+        if since is None and os.path.exists(table_dir):
+            # 完整导出（或没有该表的导出状态）时删除已有文件
+            shutil.rmtree(table_dir)
+        os.makedirs(table_dir, exist_ok=True)  # 没有数据时也保留表目录，读取方不必区分
+        # 上次中断留下的临时目录
+        for stale in glob.glob(os.path.join(table_dir, ".staging-*")):
+            shutil.rmtree(stale)
+        
+        if since is None:
+            # 首次导出：整表写入
+            queries = [(spec['query'].format(where=''), ())]
+            old_files = []
+        else:
+            queries, old_files = plan_rewrite(store, table_dir, spec, schema, file_format, since, cutoff)
+        
+        count = 0
+        
+        def batches():
+            nonlocal count
+            for sql, params in queries:
+                for batch in record_batches(store.iter_query(sql, params, chunk_size=batch_rows),
+                                            columns, schema, batch_rows):
+                    count += batch.num_rows
+                    yield batch
+        
+        # 先写入隐藏的临时目录（读取快照时会被忽略），写完后再替换分区中的旧文件
+        staging_dir = os.path.join(table_dir, f".staging-{run_id}")
+        ds.write_dataset(
+            batches(), staging_dir, schema=schema, format=file_format, file_options=write_options,
+            partitioning=partitioning(schema),
+            basename_template=f"part-{run_id}-{{i}}.{SNAPSHOT_FORMATS[format]}",
+            existing_data_behavior='overwrite_or_ignore',
+            max_rows_per_group=batch_rows
+        )
+        replace_partitions(table_dir, staging_dir, old_files)
+        counts[table] = count
+        state[table] = cutoff
+    
+    # 数据文件全部写完后才更新状态，中断时下次会重新导出同一区间
+    state['format'] = format
+    save_state(out_dir, state)
+    return counts
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+# 项目模块位于仓库根目录
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from fixture_server import FixtureServer
+
+# 替身站点的规模：每个分类3页、每页4部影片、每部1~3集，播放页只填充1KB
+SITE_PAGES = 3
+SITE_TITLES_PER_PAGE = 4
+SITE_MAX_EPISODES = 3
+
+@pytest.fixture
+def site():
+    """在临时端口上启动的替身站点"""
+    server = FixtureServer(port=0, pages=SITE_PAGES, titles_per_page=SITE_TITLES_PER_PAGE,
+                           max_episodes=SITE_MAX_EPISODES, play_page_kb=1).start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中初始化dy.db（爬虫按相对路径使用数据库文件）"""
+    import init_db
+    monkeypatch.chdir(tmp_path)
+    init_db.init_database()
+    return tmp_path
+
+@pytest.fixture
+def make_crawler(site, workdir, monkeypatch):
+    """创建指向替身站点、不限速的爬虫，测试结束时关闭"""
+    import dsq4d_crawler_optimized as crawler_module
+    monkeypatch.setattr(crawler_module, 'BASE_URL', site.url)
+    crawlers = []
+    
+    def make(**kwargs):
+        options = {'delay': 0, 'rate_limits': {}, 'commit_interval': 0.2}
+        options.update(kwargs)
+        crawler = crawler_module.OptimizedDSQ4DCrawler(**options)
+        crawlers.append(crawler)
+        return crawler
+    
+    yield make
+    for crawler in crawlers:
+        crawler.close(summary=False)
+
+def site_episodes(dyid):
+    """替身站点上影片的集数（与FixtureServer._episodes一致）"""
+    return dyid % SITE_MAX_EPISODES + 1
+
+def site_dyids(category, pages=SITE_PAGES, titles_per_page=SITE_TITLES_PER_PAGE):
+    """替身站点上分类的全部影片dyid"""
+    return [category * 1000000 + page * 1000 + index
+            for page in range(1, pages + 1) for index in range(titles_per_page)]
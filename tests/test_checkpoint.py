@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+from crawl_pipeline import CategoryCheckpoint, encode_pages, decode_pages
+from conftest import SITE_PAGES, SITE_TITLES_PER_PAGE, site_dyids
+
+def test_encode_decode_pages():
+    pages = {1, 2, 8, 9, 17, 300}
+    bitmap = encode_pages(pages)
+    assert len(bitmap) == (300 - 1) // 8 + 1
+    assert decode_pages(bitmap) == pages
+    assert encode_pages(set()) == b''
+    assert decode_pages(None) == set()
+
+def test_fields_round_trip():
+    checkpoint = CategoryCheckpoint(10)
+    checkpoint.finish_page(1)
+    checkpoint.finish_page(3)
+    checkpoint.start_title(2001)
+    checkpoint.start_title(2002)
+    checkpoint.finish_title(2, 2001)
+    
+    progress = {'total_pages': 10, 'current_page': 2, **checkpoint.fields()}
+    restored = CategoryCheckpoint.from_progress(progress)
+    assert restored.pages_done == {1, 3}
+    assert restored.is_title_done(2, 2001)
+    assert not restored.is_title_done(2, 2002)
+    assert restored.resumed_inflight == [2002]
+    assert restored.first_pending() == 2
+    assert restored.pending_pages(3) == [4, 5, 6, 7, 8, 9, 10]
+
+def test_finish_page_drops_titles():
+    checkpoint = CategoryCheckpoint(3)
+    checkpoint.finish_title(2, 2001)
+    checkpoint.finish_page(2)
+    assert checkpoint.titles_done_count() == 0
+    assert checkpoint.first_pending() == 1
+
+def test_legacy_progress():
+    # 旧记录没有位图：current_page之前的页面视为已完成
+    restored = CategoryCheckpoint.from_progress({'total_pages': 5, 'current_page': 3, 'pages_done': None})
+    assert restored.pages_done == {1, 2}
+    assert restored.pending_pages() == [3, 4, 5]
+
+def test_resume_skips_finished_work(site, make_crawler):
+    """中断后恢复：已完成的页面不再请求，未完成页面中已完成的影片不再请求详情页"""
+    category = 1
+    page2 = site_dyids(category)[SITE_TITLES_PER_PAGE:SITE_TITLES_PER_PAGE * 2]
+    checkpoint = CategoryCheckpoint(SITE_PAGES, [1])
+    checkpoint.finish_title(2, page2[0])
+    
+    crawler = make_crawler()
+    crawler.save_progress(category, 2, SITE_PAGES, 0, "interrupted", checkpoint)
+    assert crawler.flush_batch()
+    assert crawler.crawl_category_optimized(category)
+    crawler.close(summary=False)
+    
+    counts = site.snapshot()
+    assert counts['list'] == SITE_PAGES - 1
+    assert counts['mp4'] == (SITE_PAGES - 1) * SITE_TITLES_PER_PAGE - 1
+    
+    db = sqlite3.connect('dy.db')
+    try:
+        status = db.execute("SELECT status FROM crawl_progress WHERE category = ?", (category,)).fetchone()[0]
+        assert status == 'completed'
+        assert db.execute("SELECT COUNT(*) FROM dy WHERE dyid = ?", (page2[0],)).fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM dy").fetchone()[0] == counts['mp4']
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import sqlite3
+import subprocess
+
+import pytest
+
+from conftest import ROOT, SITE_PAGES, SITE_TITLES_PER_PAGE, site_dyids, site_episodes
+
+# 不限速、不等待
+NO_LIMITS = ['--delay', '0'] + [arg for kind in ('list', 'detail', 'play', 'api') for arg in ('--rate', f'{kind}=0')]
+
+def run_crawler(site, *args):
+    """在当前目录（测试的临时目录）中运行爬虫命令行"""
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'dsq4d_crawler_optimized.py'), '--base-url', site.url, *NO_LIMITS, *args],
+        capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+def table_counts():
+    db = sqlite3.connect('dy.db')
+    try:
+        return {
+            'dy': db.execute("SELECT COUNT(*) FROM dy").fetchone()[0],
+            'm3u8': db.execute("SELECT COUNT(*) FROM m3u8").fetchone()[0],
+            'm3u8_url': db.execute("SELECT COUNT(m3u8_url) FROM m3u8").fetchone()[0],
+            'badges': db.execute("SELECT COUNT(*) FROM title_badge").fetchone()[0],
+            'failures': db.execute("SELECT COUNT(*) FROM crawl_failures").fetchone()[0]
+        }
+    finally:
+        db.close()
+
+def expected_counts(titles_per_page=SITE_TITLES_PER_PAGE):
+    dyids = site_dyids(1, titles_per_page=titles_per_page)
+    episodes = sum(site_episodes(dyid) for dyid in dyids)
+    return {'dy': len(dyids), 'm3u8': episodes, 'm3u8_url': episodes, 'badges': len(dyids), 'failures': 0}
+
+def test_full_then_incremental(site, workdir):
+    run_crawler(site, '--category', '1')
+    assert table_counts() == expected_counts()
+    full = site.snapshot()
+    assert full['mp4'] == SITE_PAGES * SITE_TITLES_PER_PAGE
+    
+    # 没有变化：增量模式连续1页没有新内容即停止，不请求详情页和播放页
+    output = run_crawler(site, '--category', '1', '--incremental', '1')
+    assert table_counts() == expected_counts()
+    after = site.snapshot()
+    assert after['mp4'] == full['mp4'] and after['play'] == full['play']
+    assert after['list'] - full['list'] < SITE_PAGES + 1
+    assert "增量模式" in output
+    
+    # 每页新增一部影片：只爬取新影片
+    site.titles_per_page = SITE_TITLES_PER_PAGE + 1
+    run_crawler(site, '--category', '1', '--incremental', '1')
+    assert table_counts() == expected_counts(SITE_TITLES_PER_PAGE + 1)
+    assert site.snapshot()['mp4'] - after['mp4'] == SITE_PAGES
+
+def test_async_engine(site, workdir):
+    pytest.importorskip('aiohttp')
+    run_crawler(site, '--category', '1', '--engine', 'async')
+    assert table_counts() == expected_counts()
+
+def test_sharded_rounds(site, workdir):
+    output = run_crawler(site, '--category', '1', '--processes', '2', '--shard-pages', '1')
+    assert f"新建 {SITE_PAGES} 个分片" in output
+    assert table_counts() == expected_counts()
+    
+    # 上一轮的分片全部完成后自动开始新一轮
+    output = run_crawler(site, '--category', '1', '--processes', '2', '--shard-pages', '1')
+    assert f"新建 {SITE_PAGES} 个分片" in output
+    assert table_counts() == expected_counts()
+
+def test_processes_rejects_async(site, workdir):
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'dsq4d_crawler_optimized.py'), '--processes', '2', '--engine', 'async'],
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 2 and '--processes' in result.stderr
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+
+from db_writer import DBWriter, RETRY_BASE_DELAY
+from known_state import KnownStateIndex
+
+def movie(dyid, name, **fields):
+    row = {'dyid': dyid, 'name': name, 'type': '剧情片', 'region': '大陆', 'year': '2024',
+           'actors': '演员甲,演员乙', 'directors': '导演丙', 'description': '简介', 'url': f'/mp4/{dyid}.html'}
+    row.update(fields)
+    return row
+
+def episode(dyid, number, m3u8_url):
+    return {'dyid': dyid, 'name': f'影片{dyid}', 'episode': number,
+            'play_url': f'/play/{dyid}-0-{number - 1}.html', 'm3u8_url': m3u8_url}
+
+@pytest.fixture
+def writer(workdir):
+    writer = DBWriter('dy.db', batch_size=1000, commit_interval=60)
+    yield writer
+    writer.close()
+
+@pytest.fixture
+def db(workdir):
+    conn = sqlite3.connect('dy.db')
+    yield conn
+    conn.close()
+
+def test_movie_upsert_overwrites(writer, db):
+    writer.put_movie(movie(1, '旧名称'))
+    assert writer.flush()
+    writer.put_movie(movie(1, '新名称', year='2025'))
+    assert writer.flush()
+    assert db.execute("SELECT name, year FROM dy WHERE dyid = 1").fetchall() == [('新名称', '2025')]
+    # 人员和分面维度随影片一起写入
+    assert db.execute("SELECT COUNT(*) FROM title_person WHERE dyid = 1").fetchone()[0] == 3
+
+def test_m3u8_upsert_only_fills_null(writer, db):
+    db.execute("INSERT INTO m3u8 (dyid, name, episode, play_url, m3u8_url) VALUES (1, '影片1', 2, '/play/1-0-1.html', NULL)")
+    db.commit()
+    writer.put_m3u8s([episode(1, 1, 'https://a/1.m3u8'), episode(1, 2, 'https://a/2.m3u8')])
+    assert writer.flush()
+    # 已有链接的记录不被覆盖；没有链接的行不会写入
+    writer.put_m3u8s([episode(1, 1, 'https://b/1.m3u8'), episode(1, 3, None)])
+    assert writer.flush()
+    
+    rows = db.execute("SELECT episode, m3u8_url FROM m3u8 WHERE dyid = 1 ORDER BY episode").fetchall()
+    assert rows == [(1, 'https://a/1.m3u8'), (2, 'https://a/2.m3u8')]
+
+def test_failure_backoff(writer, db):
+    def retry_delay():
+        return db.execute(
+            "SELECT attempts, last_error, ROUND((julianday(next_retry) - julianday('now')) * 86400) "
+            "FROM crawl_failures WHERE url = '/play/1-0-0.html'"
+        ).fetchone()
+    
+    writer.put_failure('/play/1-0-0.html', 'play', 1, 1, error='状态码: 500')
+    assert writer.flush()
+    attempts, error, delay = retry_delay()
+    assert (attempts, error) == (1, '状态码: 500')
+    assert abs(delay - RETRY_BASE_DELAY) <= 2
+    
+    writer.put_failure('/play/1-0-0.html', 'play', error='超时')
+    assert writer.flush()
+    attempts, error, delay = retry_delay()
+    assert (attempts, error) == (2, '超时')
+    assert abs(delay - RETRY_BASE_DELAY * 2) <= 2
+    # 之后的记录没有dyid时保留原值
+    assert db.execute("SELECT dyid, episode FROM crawl_failures").fetchall() == [(1, 1)]
+    
+    writer.put_resolved('/play/1-0-0.html')
+    assert writer.flush()
+    assert db.execute("SELECT COUNT(*) FROM crawl_failures").fetchone()[0] == 0
+
+def test_progress_last_write_wins(writer, db):
+    writer.put_progress(1, 1, 5, 100, 'running')
+    writer.put_progress(1, 3, 5, 300, 'interrupted')
+    assert writer.flush()
+    assert db.execute("SELECT current_page, last_dyid, status FROM crawl_progress").fetchall() == [(3, 300, 'interrupted')]
+
+def test_known_state_on_commit(writer):
+    known = KnownStateIndex()
+    writer.add_commit_callback(known.on_commit)
+    writer.put_movie(movie(7, '影片7'))
+    writer.put_m3u8s([episode(7, 1, 'https://a/1.m3u8'), episode(7, 3, 'https://a/3.m3u8'), episode(7, 2, None)])
+    writer.put_badge(7, '更新至3集')
+    
+    # 提交之前索引不变
+    assert not known.has_title(7)
+    assert writer.flush()
+    assert known.name(7) == '影片7'
+    assert known.badge(7) == '更新至3集'
+    assert known.missing_episodes(7, 4) == [2, 4]
+    assert known.episode_count() == 2
+
+def test_known_state_load_matches_commits(writer, db):
+    known = KnownStateIndex()
+    writer.add_commit_callback(known.on_commit)
+    writer.put_movie(movie(8, '影片8'))
+    writer.put_m3u8s([episode(8, 9, 'https://a/9.m3u8')])
+    writer.put_badge(8, '完结')
+    assert writer.flush()
+    
+    loaded = KnownStateIndex()
+    loaded.load(db)
+    assert (loaded.names, loaded.episodes, loaded.badges) == (known.names, known.episodes, known.badges)
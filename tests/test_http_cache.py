@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from http_cache import HTTPCache
+
+def list_url(site, page=1):
+    return f"{site.url}/list/1-{page}.html"
+
+def test_fresh_entry_skips_network(site, make_crawler):
+    cache = HTTPCache('http_cache.db')
+    crawler = make_crawler(http_cache=cache)
+    first = crawler._get_with_retry(list_url(site))
+    second = crawler._get_with_retry(list_url(site))
+    
+    assert site.snapshot()['list'] == 1
+    assert not getattr(first, 'from_cache', False)
+    assert second.from_cache and second.content == first.content
+    assert cache.stats['stored'] == 1 and cache.stats['hits'] == 1
+
+def test_disabled_kind_not_cached(site, make_crawler):
+    # 播放页默认不缓存
+    cache = HTTPCache('http_cache.db')
+    crawler = make_crawler(http_cache=cache)
+    url = f"{site.url}/play/1001000-0-0.html"
+    crawler._get_with_retry(url)
+    crawler._get_with_retry(url)
+    assert site.snapshot()['play'] == 2
+    assert cache.stats['stored'] == 0
+
+def test_expired_entry_revalidates(site, make_crawler):
+    cache = HTTPCache('http_cache.db', ttls={'list': 60})
+    crawler = make_crawler(http_cache=cache)
+    body = crawler._get_with_retry(list_url(site)).content
+    
+    # 超过有效期后发送条件请求，站点返回304时使用缓存内容并刷新有效期
+    cache.conn.execute("UPDATE responses SET stored_time = stored_time - 3600")
+    revalidated = crawler._get_with_retry(list_url(site))
+    assert revalidated.from_cache and revalidated.content == body
+    assert site.snapshot()['list'] == 2 and site.snapshot()['304'] == 1
+    assert cache.stats['revalidated'] == 1
+    
+    crawler._get_with_retry(list_url(site))
+    assert site.snapshot()['list'] == 2
+
+def test_offline_replay(site, make_crawler):
+    crawler = make_crawler(http_cache=HTTPCache('http_cache.db'))
+    body = crawler._get_with_retry(list_url(site)).content
+    crawler.close(summary=False)
+    
+    # 离线模式：缓存中的页面照常返回（不论是否过期），未缓存的页面不访问网络
+    offline = make_crawler(http_cache=HTTPCache('http_cache.db', ttls={'list': 1}, offline=True))
+    offline.http_cache.conn.execute("UPDATE responses SET stored_time = stored_time - 3600")
+    assert offline._get_with_retry(list_url(site)).content == body
+    assert offline._get_with_retry(list_url(site, 2)) is None
+    assert offline._get_with_retry(f"{site.url}/play/1001000-0-0.html") is None
+    assert site.snapshot() == {'list': 1}
+
+def test_eviction(tmp_path):
+    cache = HTTPCache(str(tmp_path / 'http_cache.db'), max_bytes=2000)
+    for index in range(10):
+        cache.store(f"http://x/{index}", 200, {'ETag': f'"{index}"'}, bytes(range(256)) * 4)
+    assert cache.total_bytes <= 2000
+    assert cache.stats['evicted'] > 0
+    # 最近写入的记录保留
+    assert cache.lookup("http://x/9")['headers'] == {'ETag': '"9"'}
+    assert cache.total_bytes == cache.conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    cache.close()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import base64
+
+import requests
+
+from m3u8_resolver import M3U8Resolver, PlayerConfigScanner
+
+def make_resolver(base_url):
+    """fetch失败时返回None，并像爬虫一样记下失败原因"""
+    errors = []
+    
+    def fetch(url, timeout=3):
+        response = requests.get(url, timeout=timeout)
+        if response.status_code != 200:
+            errors.append(f"状态码: {response.status_code}")
+            return None
+        return response
+    
+    return M3U8Resolver(fetch, base_url, last_error=lambda: errors[-1] if errors else None)
+
+def play_page(site, dyid, episode):
+    return requests.get(f"{site.url}/play/{dyid}-0-{episode}.html", timeout=3).text
+
+def test_player_json(site):
+    resolver = make_resolver(site.url)
+    result = resolver.resolve_page(play_page(site, 1001000, 0))
+    assert result['strategy'] == 'player_json'
+    assert result['m3u8_url'] == "https://cdn.example.com/1001000/0/index.m3u8"
+    assert result['player']['link_next'] == "/play/1001000-0-1.html"
+    assert 'error' not in result
+
+def test_js_literal(site):
+    content = "<script>var player_aaaa = {flag:'play', url:'https://cdn.example.com/a\\'b/index.m3u8', name:'影片'};</script>"
+    result = make_resolver(site.url).resolve_page(content)
+    assert result['strategy'] == 'player_json'
+    assert result['m3u8_url'] == "https://cdn.example.com/a'b/index.m3u8"
+    assert result['player']['name'] == '影片'
+
+def test_get_dplayer(site):
+    resolver = make_resolver(site.url)
+    result = resolver.resolve_page(play_page(site, 1001000, 1))
+    assert result['strategy'] == 'get_dplayer'
+    assert result['m3u8_url'] == "https://cdn.example.com/api/1001000-1/index.m3u8"
+    assert site.snapshot().get('api') == 1
+    assert resolver.hit_counts() == {'get_dplayer': 1}
+
+def test_get_dplayer_failure_reason(site):
+    # 接口地址不存在，失败原因随结果带回
+    resolver = make_resolver(f"{site.url}/missing")
+    result = resolver.resolve_page(play_page(site, 1001000, 1))
+    assert result['m3u8_url'] is None
+    assert result['error'] == "状态码: 404"
+    assert resolver.hit_counts() == {'miss': 1}
+
+def test_base64(site):
+    encoded = base64.b64encode(b"https://cdn.example.com/b64/index.m3u8").decode()
+    content = f"<script>var player_aaaa={json.dumps({'url': encoded})}</script>"
+    result = make_resolver(site.url).resolve_page(content)
+    assert result['strategy'] == 'base64'
+    assert result['m3u8_url'] == "https://cdn.example.com/b64/index.m3u8"
+
+def test_direct_regex(site):
+    content = "<video src='https://cdn.example.com/direct/index.m3u8'></video>"
+    result = make_resolver(site.url).resolve_page(content)
+    assert result['strategy'] == 'direct_regex'
+    assert result['m3u8_url'] == "https://cdn.example.com/direct/index.m3u8"
+    assert result['player'] == {}
+
+def test_miss(site):
+    result = make_resolver(site.url).resolve_page("<html>没有播放地址</html>")
+    assert result['m3u8_url'] is None and result['strategy'] is None
+
+def test_scanner_small_chunks(site):
+    body = requests.get(f"{site.url}/play/1001000-0-0.html", timeout=3).content
+    scanner = PlayerConfigScanner()
+    fed = 0
+    for start in range(0, len(body), 7):
+        fed += 7
+        if scanner.feed(body[start:start + 7]) is not None:
+            break
+    # 解析出配置后即停止，不必读完页面的填充内容
+    assert fed < len(body)
+    assert scanner.config['url'] == "https://cdn.example.com/1001000/0/index.m3u8"
+    assert scanner.text.startswith('<html>')
+
+def test_scanner_split_multibyte():
+    # 逐字节喂入：标记和多字节字符都会被分块截断
+    body = 'var player_aaaa={"url":"https://cdn.example.com/x/index.m3u8","name":"影片{甲}"};后续'.encode('utf-8')
+    scanner = PlayerConfigScanner('utf-8')
+    for index in range(len(body)):
+        if scanner.feed(body[index:index + 1]) is not None:
+            break
+    assert scanner.config == {'url': "https://cdn.example.com/x/index.m3u8", 'name': "影片{甲}"}
+
+def test_scanner_unclosed():
+    scanner = PlayerConfigScanner()
+    assert scanner.feed(b'var player_aaaa={"url":"https://a/b.m3u8"') is None
+    assert scanner.config is None
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import pytest
+
+import init_db
+
+# 引入版本管理之前 init_db.py 创建的表结构
+BASELINE_SCHEMA = """
+CREATE TABLE dy (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dyid INTEGER UNIQUE,
+    name TEXT, type TEXT, region TEXT, year TEXT, actors TEXT, directors TEXT, description TEXT, url TEXT,
+    crawl_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE m3u8 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dyid INTEGER, name TEXT, episode INTEGER, play_url TEXT, m3u8_url TEXT,
+    crawl_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (dyid) REFERENCES dy (dyid)
+);
+CREATE TABLE crawl_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category INTEGER, current_page INTEGER, total_pages INTEGER, last_dyid INTEGER, status TEXT,
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+@pytest.fixture
+def baseline(tmp_path):
+    """带有重复记录的旧版数据库"""
+    conn = sqlite3.connect(tmp_path / 'dy.db')
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO dy (dyid, name, type, region, year, actors, directors, description) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(1, '星际穿越', '科幻片', '美国', '2014', '马修·麦康纳, 安妮·海瑟薇', '克里斯托弗·诺兰', '一队探险家穿越虫洞'),
+         (2, '流浪地球', '科幻片', '大陆', '2019', '吴京、屈楚萧/未知', '郭帆', '太阳即将毁灭'),
+         (3, '未知影片', '未知', '', None, '', None, None)]
+    )
+    conn.executemany(
+        "INSERT INTO m3u8 (dyid, name, episode, play_url, m3u8_url) VALUES (?, ?, ?, ?, ?)",
+        [(1, '星际穿越', 1, '/play/1-0-0.html', None),
+         (1, '星际穿越', 1, '/play/1-0-0.html', 'https://a/1.m3u8'),
+         (1, '星际穿越', 1, '/play/1-0-0.html', 'https://b/1.m3u8'),
+         (2, '流浪地球', 1, '/play/2-0-0.html', None),
+         (2, '流浪地球', 1, '/play/2-0-0.html', None)]
+    )
+    conn.executemany(
+        "INSERT INTO crawl_progress (category, current_page, total_pages, last_dyid, status) VALUES (?, ?, ?, ?, ?)",
+        [(1, 3, 10, 100, 'running'), (1, 5, 10, 200, 'interrupted')]
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_migrate_baseline_to_latest(baseline):
+    assert init_db.migrate(baseline) == (0, init_db.SCHEMA_VERSION)
+    assert [row[0] for row in baseline.execute("SELECT version FROM schema_version ORDER BY version")] == \
+        list(range(1, init_db.SCHEMA_VERSION + 1))
+    
+    # 迁移2：重复剧集保留有链接的最早一条，每个分类保留最新的进度
+    assert baseline.execute("SELECT dyid, m3u8_url FROM m3u8 ORDER BY dyid").fetchall() == \
+        [(1, 'https://a/1.m3u8'), (2, None)]
+    assert baseline.execute("SELECT current_page, status FROM crawl_progress").fetchall() == [(5, 'interrupted')]
+    with pytest.raises(sqlite3.IntegrityError):
+        baseline.execute("INSERT INTO m3u8 (dyid, episode) VALUES (1, 1)")
+    
+    # 迁移5：旧进度没有断点字段
+    assert baseline.execute("SELECT pages_done, titles_done, inflight FROM crawl_progress").fetchone() == (None, None, None)
+    
+    # 迁移9：按已有影片回填人员和分面，占位值和空值不写入
+    credits = baseline.execute(
+        "SELECT tp.dyid, tp.role, tp.position, p.name FROM title_person tp JOIN person p ON p.id = tp.person_id "
+        "ORDER BY tp.dyid, tp.role, tp.position"
+    ).fetchall()
+    assert credits == [
+        (1, 'actor', 0, '马修·麦康纳'), (1, 'actor', 1, '安妮·海瑟薇'), (1, 'director', 0, '克里斯托弗·诺兰'),
+        (2, 'actor', 0, '吴京'), (2, 'actor', 1, '屈楚萧'), (2, 'director', 0, '郭帆')
+    ]
+    facets = baseline.execute(
+        "SELECT tf.dyid, t.value, r.value, y.value FROM title_facet tf "
+        "LEFT JOIN facet t ON t.id = tf.type_id LEFT JOIN facet r ON r.id = tf.region_id "
+        "LEFT JOIN facet y ON y.id = tf.year_id ORDER BY tf.dyid"
+    ).fetchall()
+    assert facets == [(1, '科幻片', '美国', '2014'), (2, '科幻片', '大陆', '2019'), (3, None, None, None)]
+
+@pytest.mark.skipif(sqlite3.sqlite_version_info < (3, 34, 0), reason="SQLite低于3.34时没有trigram分词器")
+def test_migrate_builds_search_index(baseline):
+    init_db.migrate(baseline)
+    rows = baseline.execute("SELECT rowid FROM dy_fts WHERE dy_fts MATCH ?", ('"穿越虫"',)).fetchall()
+    assert rows == baseline.execute("SELECT id FROM dy WHERE dyid = 1").fetchall()
+    # 触发器随dy表更新索引
+    baseline.execute("UPDATE dy SET description = '新的简介' WHERE dyid = 1")
+    assert baseline.execute("SELECT COUNT(*) FROM dy_fts WHERE dy_fts MATCH ?", ('"穿越虫"',)).fetchone()[0] == 0
+
+def test_migrate_is_idempotent(baseline):
+    init_db.migrate(baseline)
+    assert init_db.migrate(baseline) == (init_db.SCHEMA_VERSION, init_db.SCHEMA_VERSION)
+
+def test_failed_migration_rolls_back(baseline, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (id INTEGER)")
+        cursor.execute("SELECT * FROM no_such_table")
+    
+    monkeypatch.setattr(init_db, 'MIGRATIONS', init_db.MIGRATIONS[:3] + [(4, "失败的迁移", broken)])
+    with pytest.raises(sqlite3.OperationalError):
+        init_db.migrate(baseline)
+    assert init_db.get_schema_version(baseline) == 3
+    assert baseline.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None